@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+from benchmarks import runner
+from benchmarks.generators import GENERATORS
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks of the resolver stages")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks and store the results as json")
+    run_parser.add_argument("-k", "--workload", help="Workloads to run, defaults to all",
+                            choices=list(GENERATORS), action="append")
+    run_parser.add_argument("--scale", help="Size factor of the generated workloads", type=int, default=1)
+    run_parser.add_argument("--repeat", help="Repetitions per workload, the fastest is reported", type=int, default=3)
+    run_parser.add_argument("--memory", help="Measure the peak memory of every stage in an additional run",
+                            action="store_true")
+    run_parser.add_argument("--formats", help="Measure writing and reading the resolved content in every output "
+                                              "format", action="store_true")
+    run_parser.add_argument("-o", "--output", help="Json file to store the results in", type=Path)
+    add_compare_arguments(run_parser)
+    compare_parser = commands.add_parser("compare", help="Compare results against a baseline")
+    compare_parser.add_argument("results", help="Json results to be checked", type=Path)
+    add_compare_arguments(compare_parser)
+    args = parser.parse_args(argv)
+
+    baseline = runner.load(args.baseline) if args.baseline else None
+    if args.command == "run":
+        results = runner.run(args.workload, args.scale, args.repeat, args.memory, args.formats)
+        if args.output:
+            runner.save(results, args.output)
+    else:
+        results = runner.load(args.results)
+    print(runner.report(results, baseline))
+    if baseline is None:
+        return 0
+    regressions = runner.compare(baseline, results, args.threshold, args.min_time)
+    if regressions:
+        print(f"Regressions of more than {args.threshold}%:\n" + "\n".join(regressions))
+        return 1
+    return 0
+
+
+def add_compare_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-b", "--baseline", help="Json results to compare against", type=Path,
+                        required=parser.prog.endswith("compare"))
+    parser.add_argument("--threshold", help="Maximum allowed slowdown of a stage in percent", type=float,
+                        default=runner.DEFAULT_THRESHOLD)
+    parser.add_argument("--min-time", help="Stages faster than this in seconds are not compared", type=float,
+                        default=runner.DEFAULT_MIN_TIME)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Generators of synthetic workloads.
+
+Every generator writes its files into a directory and returns a Workload describing how to resolve them.
+The size of all workloads grows linearly with scale.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import yaml
+
+
+class Workload:
+
+    def __init__(self, name: str, root: Path, params: Dict | None = None, include_dirs: List[Path] | None = None):
+        self.name = name
+        self.root = root
+        self.params = params or {}
+        self.include_dirs = include_dirs or []
+
+    def __repr__(self):
+        return f"Workload({self.name}, {self.root})"
+
+
+def write_yaml(path: Path, content) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(yaml.safe_dump(content, sort_keys=False))
+    return path
+
+
+def include_deep(directory: Path, scale: int = 1) -> Workload:
+    """Chain of include files, each one including the next"""
+    depth = 20 * scale
+    for i in range(depth):
+        content = {f"value_{i}": f"level {i}", f"list_{i}": list(range(10))}
+        if i + 1 < depth:
+            content["xyml.include"] = f"deep_{i + 1}.yaml<<level={i + 1}>>"
+        write_yaml(directory / f"deep_{i}.yaml", content)
+    root = write_yaml(directory / "include_deep.yaml", {"root": True, "xyml.include": "deep_0.yaml<<level=0>>"})
+    return Workload("include_deep", root)
+
+
+def include_wide(directory: Path, scale: int = 1) -> Workload:
+    """Root file including many independent files from a sub directory"""
+    width = 200 * scale
+    for i in range(width):
+        write_yaml(directory / "wide" / f"wide_{i}.yaml", {f"value_{i}": "{{index}}", f"list_{i}": list(range(10))})
+    root = write_yaml(directory / "include_wide.yaml",
+                      {"wide": {"xyml.include": [f"wide/wide_{i}.yaml<<index={i}>>" for i in range(width)]}})
+    return Workload("include_wide", root)
+
+
+def include_diamond(directory: Path, scale: int = 1) -> Workload:
+    """Layers of files, each file includes all files of the next layer"""
+    layers = 5 + scale
+    width = 3
+    for layer in range(layers):
+        for i in range(width):
+            content = {f"value_{layer}_{i}": f"layer {layer}"}
+            if layer + 1 < layers:
+                content[f"next_{layer}_{i}"] = {"xyml.include": [f"diamond_{layer + 1}_{j}.yaml"
+                                                                 for j in range(width)]}
+            write_yaml(directory / f"diamond_{layer}_{i}.yaml", content)
+    root = write_yaml(directory / "include_diamond.yaml",
+                      {"diamond": {"xyml.include": [f"diamond_0_{j}.yaml" for j in range(width)]}})
+    return Workload("include_diamond", root)
+
+
+def multi_loop(directory: Path, scale: int = 1) -> Workload:
+    """Loops over the cross product of two large lists"""
+    size = 30 * scale
+    root = write_yaml(directory / "multi_loop.yaml", {
+        "rows": [f"row_{i}" for i in range(size)],
+        "columns": list(range(size)),
+        "cells": {
+            "xyml.for": "row:rows, column:columns",
+            "xyml.content": [{"name": "{{row}}_{{column}}", "column": "{{column}}"}],
+        },
+    })
+    return Workload("multi_loop", root)
+
+
+def multi_loop_body(directory: Path, scale: int = 1) -> Workload:
+    """Loops over three lists with a large body, most of it independent of the loop values"""
+    size = 10 * scale
+    root = write_yaml(directory / "multi_loop_body.yaml", {
+        "regions": [f"region_{i}" for i in range(size)],
+        "zones": ["a", "b", "c"],
+        "hosts": list(range(size)),
+        "machines": {
+            "xyml.for": "region:regions, zone:zones, host:hosts",
+            "xyml.content": [{
+                "name": "{{region}}-{{zone}}-{{host}}",
+                "settings": {f"setting_{i}": {"values": list(range(10)), "enabled": True} for i in range(20)},
+                "labels": {"region": "{{region}}", "tier": "backend"},
+            }],
+        },
+    })
+    return Workload("multi_loop_body", root)
+
+
+def inline_loop(directory: Path, scale: int = 1) -> Workload:
+    """Many scalars containing inline loops over a large list"""
+    size = 200 * scale
+    root = write_yaml(directory / "inline_loop.yaml", {
+        "items": [f"item_{i}" for i in range(size)],
+        "lines": [f"line {i}: {{{{xyml.for:item:items: {{{{item}}}}_{i},}}}}" for i in range(size // 4)],
+    })
+    return Workload("inline_loop", root)
+
+
+def reference_chain(directory: Path, scale: int = 1) -> Workload:
+    """Chains of references, each reference resolves to the next one"""
+    chains = 20 * scale
+    length = 20
+    content = {}
+    for chain in range(chains):
+        content[f"chain_{chain}_0"] = f"end of chain {chain}"
+        for i in range(1, length):
+            content[f"chain_{chain}_{i}"] = f"{{{{chain_{chain}_{i - 1}}}}}"
+    root = write_yaml(directory / "reference_chain.yaml", content)
+    return Workload("reference_chain", root)
+
+
+def reference_many(directory: Path, scale: int = 1) -> Workload:
+    """Scalars containing many references each"""
+    size = 50
+    content = {"values": {f"value_{i}": i for i in range(size)},
+               "params": [" ".join(f"{{{{values.value_{i}}}}}" for i in range(size)) + " {{xyml.param.suffix}}"
+                          for _ in range(100 * scale)]}
+    root = write_yaml(directory / "reference_many.yaml", content)
+    return Workload("reference_many", root, {"suffix": "end"})
+
+
+def list_lookup(directory: Path, scale: int = 1) -> Workload:
+    """References into a large list of dicts by index and by key of all elements"""
+    size = 1000 * scale
+    content = {"servers": [{"name": f"server_{i}", "port": 8000 + i} for i in range(size)],
+               "first": "{{servers.0.name}}",
+               "names": "{{servers.name}}",
+               "lookups": [f"{{{{servers.{i}.port}}}}" for i in range(0, size, 10)]}
+    root = write_yaml(directory / "list_lookup.yaml", content)
+    return Workload("list_lookup", root)
+
+
+GENERATORS: Dict[str, Callable[[Path, int], Workload]] = {
+    "include_deep": include_deep,
+    "include_wide": include_wide,
+    "include_diamond": include_diamond,
+    "multi_loop": multi_loop,
+    "multi_loop_body": multi_loop_body,
+    "inline_loop": inline_loop,
+    "reference_chain": reference_chain,
+    "reference_many": reference_many,
+    "list_lookup": list_lookup,
+}
@@ -0,0 +1,248 @@
+"""
+Runs the benchmark workloads and compares results against a stored baseline.
+
+Every workload is resolved stage by stage in the same order as XYmlFile.resolve, so the time spent in each
+resolver can be measured separately. The fused stage replaces the inline loop and reference stages in the
+fused pipeline. The end to end time resolves and saves the workload through XYmlFile.
+For each stage the minimum of all repetitions is reported.
+Optionally the peak memory allocated within each stage is measured in an additional run using tracemalloc,
+and the time to write and read the resolved content is measured for every output format.
+"""
+from __future__ import annotations
+
+import copy
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterable, List
+
+import yaml_extender
+from yaml_extender import indexed_format, output_formats, yaml_loader, yaml_writer
+from yaml_extender.resolver.fused_resolver import FusedResolver
+from yaml_extender.resolver.include_resolver import IncludeResolver
+from yaml_extender.resolver.inline_loop_resolver import InlineLoopResolver
+from yaml_extender.resolver.loop_resolver import LoopResolver
+from yaml_extender.resolver.reference_resolver import ReferenceResolver
+from yaml_extender.xyml_file import ENV_KEY, PARAM_KEY, XYmlFile
+
+from benchmarks.generators import GENERATORS, Workload
+
+RESULT_FORMAT_VERSION = 1
+STAGES = ["load", "include", "loop", "inline_loop", "reference", "fused", "dump", "end_to_end"]
+# Json lines are written like json, they are only supported for top level lists
+FORMATS = [output_formats.YAML_FORMAT, output_formats.JSON_FORMAT, output_formats.SNAPSHOT_FORMAT,
+           output_formats.INDEXED_FORMAT]
+# Indexed files are decoded completely, opening them only reads the header
+FORMAT_READERS = {
+    output_formats.YAML_FORMAT: yaml_loader.parse_file,
+    output_formats.JSON_FORMAT: lambda path: json.loads(Path(path).read_text()),
+    output_formats.SNAPSHOT_FORMAT: output_formats.load_snapshot,
+    output_formats.INDEXED_FORMAT: lambda path: indexed_format.to_python(indexed_format.load_indexed(path)),
+}
+DEFAULT_THRESHOLD = 10.0
+# Stages faster than this are too noisy to be compared
+DEFAULT_MIN_TIME = 0.001
+
+
+@contextmanager
+def timed(timings: Dict[str, float], stage: str):
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+
+
+@contextmanager
+def traced(peaks: Dict[str, float], stage: str):
+    """Measures the peak of memory allocated within the stage in bytes, tracemalloc has to be started"""
+    tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    yield
+    peaks[stage] = tracemalloc.get_traced_memory()[1] - start
+
+
+def run_stages(workload: Workload,
+               measure: Callable[[Dict[str, float], str], ContextManager] = timed) -> Dict[str, float]:
+    """
+    Resolves the workload once and returns the measurement of every stage
+
+    Parameters
+        measure: timed to measure the duration in seconds, traced to measure the peak memory in bytes
+    """
+    timings = {}
+    # Parse every file again in every repetition
+    yaml_loader.invalidate_cache()
+    include_dirs = list(workload.include_dirs) + [workload.root.parent]
+    with measure(timings, "load"):
+        content = yaml_loader.load(str(workload.root))
+    with measure(timings, "include"):
+        content = IncludeResolver(include_dirs, False).resolve(content)
+    with measure(timings, "loop"):
+        content = LoopResolver(False).resolve(content)
+    fused_content = copy.deepcopy(content)
+    with measure(timings, "inline_loop"):
+        content = InlineLoopResolver(False).resolve(content)
+    with measure(timings, "reference"):
+        content = ReferenceResolver(False, dependency_order=True).resolve(content, reference_config(content, workload))
+    # Inline loops and references resolved in a single pass, replaces the two stages above
+    with measure(timings, "fused"):
+        FusedResolver(False, dependency_order=True).resolve(fused_content, reference_config(fused_content, workload))
+    with measure(timings, "dump"):
+        yaml_writer.stream_dump(content, io.StringIO())
+    yaml_loader.invalidate_cache()
+    with tempfile.TemporaryDirectory() as output_dir:
+        with measure(timings, "end_to_end"):
+            xyml_file = XYmlFile(workload.root, dict(workload.params), list(workload.include_dirs))
+            xyml_file.save(Path(output_dir) / "output.yaml")
+    return timings
+
+
+def run_formats(workload: Workload, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Returns the fastest write and read time in seconds and the file size in bytes of every output format"""
+    yaml_loader.invalidate_cache()
+    xyml_file = XYmlFile(workload.root, dict(workload.params), list(workload.include_dirs))
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for output_format in FORMATS:
+            path = Path(output_dir) / f"output.{output_format}"
+            writes = []
+            reads = []
+            for _ in range(repeat):
+                timings = {}
+                with timed(timings, "write"):
+                    xyml_file.save(path, output_format=output_format)
+                with timed(timings, "read"):
+                    FORMAT_READERS[output_format](path)
+                writes.append(timings["write"])
+                reads.append(timings["read"])
+            results[output_format] = {"write": min(writes), "read": min(reads), "size": path.stat().st_size}
+    return results
+
+
+def reference_config(content: Any, workload: Workload) -> dict:
+    config = content.copy() if isinstance(content, dict) else {}
+    config["xyml"] = {ENV_KEY: os.environ, PARAM_KEY: workload.params}
+    return config
+
+
+def run(names: Iterable[str] | None = None, scale: int = 1, repeat: int = 3, memory: bool = False,
+        formats: bool = False) -> dict:
+    """
+    Generates and runs the workloads, returns the results as json serializable dict
+
+    Parameters
+        memory: Measure the peak memory of every stage in an additional run, stored in "memory"
+        formats: Measure writing and reading the resolved content in every output format, stored in "formats"
+    """
+    names = list(names) if names else list(GENERATORS)
+    results = {}
+    peaks = {}
+    format_results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            workload = GENERATORS[name](Path(directory) / name, scale)
+            runs = [run_stages(workload) for _ in range(repeat)]
+            results[name] = {stage: min(timings[stage] for timings in runs) for stage in STAGES}
+            if memory:
+                tracemalloc.start()
+                try:
+                    peaks[name] = run_stages(workload, traced)
+                finally:
+                    tracemalloc.stop()
+            if formats:
+                format_results[name] = run_formats(workload, repeat)
+    output = {
+        "version": RESULT_FORMAT_VERSION,
+        "yaml_extender": yaml_extender.__version__,
+        "python": platform.python_version(),
+        "libyaml": yaml_loader.use_libyaml(yaml_loader.DEFAULT_YAML_BACKEND),
+        "scale": scale,
+        "repeat": repeat,
+        "results": results,
+    }
+    if memory:
+        output["memory"] = peaks
+    if formats:
+        output["formats"] = format_results
+    return output
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD,
+            min_time: float = DEFAULT_MIN_TIME) -> List[str]:
+    """
+    Returns a description of every stage, which is more than threshold percent slower than in the baseline.
+
+    Parameters
+        min_time: Stages taking less seconds than this in both results are ignored
+    """
+    if baseline.get("scale") != current.get("scale"):
+        return [f"Scale {current.get('scale')} differs from baseline scale {baseline.get('scale')}"]
+    regressions = []
+    for name, timings in current["results"].items():
+        baseline_timings = baseline["results"].get(name)
+        if baseline_timings is None:
+            continue
+        for stage, duration in timings.items():
+            baseline_duration = baseline_timings.get(stage)
+            if baseline_duration is None or max(duration, baseline_duration) < min_time:
+                continue
+            change = (duration - baseline_duration) / baseline_duration * 100 if baseline_duration else float("inf")
+            if change > threshold:
+                regressions.append(f"{name}.{stage}: {baseline_duration * 1000:.2f}ms -> {duration * 1000:.2f}ms "
+                                   f"(+{change:.1f}%)")
+    # Memory is only compared if both results contain it
+    for name, peaks in current.get("memory", {}).items():
+        baseline_peaks = baseline.get("memory", {}).get(name, {})
+        for stage, peak in peaks.items():
+            baseline_peak = baseline_peaks.get(stage)
+            if not baseline_peak:
+                continue
+            change = (peak - baseline_peak) / baseline_peak * 100
+            if change > threshold:
+                regressions.append(f"{name}.{stage} memory: {baseline_peak / 1e6:.2f}MB -> {peak / 1e6:.2f}MB "
+                                   f"(+{change:.1f}%)")
+    return regressions
+
+
+def report(results: dict, baseline: dict | None = None) -> str:
+    lines = [f"{'workload':<18}" + "".join(f"{stage:>13}" for stage in STAGES)]
+    for name, timings in results["results"].items():
+        lines.append(f"{name:<18}" + "".join(f"{timings[stage] * 1000:>11.2f}ms" for stage in STAGES))
+        baseline_timings = (baseline or {}).get("results", {}).get(name)
+        if baseline_timings:
+            changes = []
+            for stage in STAGES:
+                if baseline_timings.get(stage):
+                    changes.append(f"{(timings[stage] / baseline_timings[stage] - 1) * 100:>+12.1f}%")
+                else:
+                    changes.append(f"{'-':>13}")
+            lines.append(f"{'  vs baseline':<18}" + "".join(changes))
+    if "memory" in results:
+        lines.append("")
+        lines.append(f"{'peak memory':<18}" + "".join(f"{stage:>13}" for stage in STAGES))
+        for name, peaks in results["memory"].items():
+            lines.append(f"{name:<18}" + "".join(f"{peaks[stage] / 1e6:>11.2f}MB" for stage in STAGES))
+    if "formats" in results:
+        lines.append("")
+        lines.append(f"{'format':<18}{'':<10}" + "".join(f"{output_format:>13}" for output_format in FORMATS))
+        for name, format_results in results["formats"].items():
+            for measure, unit, factor in (("write", "ms", 1000), ("read", "ms", 1000), ("size", "MB", 1e-6)):
+                lines.append(f"{name if measure == 'write' else '':<18}{measure:<10}"
+                             + "".join(f"{format_results[output_format][measure] * factor:>11.2f}{unit}"
+                                       for output_format in FORMATS))
+    return "\n".join(lines)
+
+
+def save(results: dict, path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + "\n")
+
+
+def load(path: Path) -> dict:
+    return json.loads(Path(path).read_text())
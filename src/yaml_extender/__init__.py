@@ -1,3 +1,16 @@
 __version__ = '0.3.1'
 
-from yaml_extender.xyml_file import XYmlFile
+import importlib
+
+# Imported on first access, so the client does not import yaml and the resolvers
+LAZY_EXPORTS = {
+    "XYmlFile": "yaml_extender.xyml_file",
+    "load_snapshot": "yaml_extender.output_formats",
+    "load_indexed": "yaml_extender.indexed_format",
+}
+
+
+def __getattr__(name):
+    if name in LAZY_EXPORTS:
+        return getattr(importlib.import_module(LAZY_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
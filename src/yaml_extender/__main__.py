@@ -1,6 +1,10 @@
 import sys
 
-from yaml_extender.cli import main
+from yaml_extender.client import CLIENT_COMMAND, client_main
 
 if __name__ == "__main__":
+    # The client does not need the resolvers, don't import them
+    if sys.argv[1:2] == [CLIENT_COMMAND]:
+        sys.exit(client_main(sys.argv[2:]))
+    from yaml_extender.cli import main
     sys.exit(main())
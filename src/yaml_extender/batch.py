@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from yaml_extender import yaml_loader
+from yaml_extender.result_cache import DEFAULT_MAX_CACHE_SIZE
+from yaml_extender.xyml_exception import ExtYamlSyntaxError
+from yaml_extender.xyml_file import DEFAULT_PIPELINE, XYmlFile
+
+MANIFEST_JOBS_KEY = "jobs"
+DEFAULT_OUTPUT_SUFFIX = ".yaml"
+
+
+class BatchJob:
+    """Single input file to be resolved into an output file"""
+
+    def __init__(self, input: Path, output: Path, params: Dict | None = None):
+        self.input = Path(input)
+        self.output = Path(output)
+        self.params = params or {}
+
+    def __repr__(self):
+        return f"BatchJob({self.input} -> {self.output})"
+
+
+class BatchResult:
+
+    def __init__(self, job: BatchJob, duration: float, error: Optional[str] = None):
+        self.job = job
+        self.duration = duration
+        self.error = error
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        if self.success:
+            return f"OK      {self.job.input} -> {self.job.output} ({self.duration:.3f}s)"
+        return f"FAILED  {self.job.input} ({self.duration:.3f}s): {self.error}"
+
+
+class BatchSummary:
+
+    def __init__(self, results: List[BatchResult], duration: float):
+        self.results = results
+        self.duration = duration
+
+    @property
+    def failed(self) -> List[BatchResult]:
+        return [result for result in self.results if not result.success]
+
+    @property
+    def success(self) -> bool:
+        return not self.failed
+
+    def report(self) -> str:
+        lines = [repr(result) for result in self.results]
+        lines.append(f"Resolved {len(self.results) - len(self.failed)} of {len(self.results)} files "
+                     f"in {self.duration:.3f}s, {len(self.failed)} failed.")
+        return "\n".join(lines)
+
+
+def load_manifest(path: Path) -> List[BatchJob]:
+    """
+    Reads batch jobs from a yaml manifest. Relative paths are relative to the manifest.
+
+    The manifest is either a list of jobs or a dict containing the list under the key "jobs".
+    Every job is a dict with the keys "input", "output" and optionally "params".
+    """
+    path = Path(path)
+    content = yaml_loader.load(str(path), use_cache=False)
+    entries = content.get(MANIFEST_JOBS_KEY) if isinstance(content, dict) else content
+    if not isinstance(entries, list):
+        raise ExtYamlSyntaxError(f"Batch manifest {path} does not contain a list of jobs.")
+    jobs = []
+    for entry in entries:
+        if not isinstance(entry, dict) or "input" not in entry or "output" not in entry:
+            raise ExtYamlSyntaxError(f"Invalid batch job {entry}, input and output are required.")
+        jobs.append(BatchJob(path.parent / entry["input"], path.parent / entry["output"], entry.get("params")))
+    return jobs
+
+
+def jobs_from_glob(pattern: str, output_dir: Path, suffix: str = DEFAULT_OUTPUT_SUFFIX) -> List[BatchJob]:
+    """Creates a job for every file matching pattern, outputs keep their path relative to the pattern base"""
+    base = Path(pattern)
+    while glob.has_magic(str(base)):
+        base = base.parent
+    jobs = []
+    for match in sorted(glob.glob(pattern, recursive=True)):
+        relative_path = Path(os.path.relpath(match, base))
+        jobs.append(BatchJob(Path(match), Path(output_dir) / relative_path.with_suffix(suffix)))
+    return jobs
+
+
+def resolve_job(job: BatchJob, params: Dict, include_dirs: List[Path] | None, options: Dict[str, Any]) -> BatchResult:
+    """Resolves a single job, errors are reported in the result instead of being raised"""
+    start = time.perf_counter()
+    try:
+        save_job(job, load_job(job, params, include_dirs, options), options)
+    except Exception as e:
+        return BatchResult(job, time.perf_counter() - start, error_message(e))
+    return BatchResult(job, time.perf_counter() - start)
+
+
+def load_job(job: BatchJob, params: Dict, include_dirs: List[Path] | None, options: Dict[str, Any]) -> XYmlFile:
+    """Resolves the input of a job, the parameters of the job update params"""
+    job_params = dict(params)
+    job_params.update(job.params)
+    inc_dirs = list(include_dirs) if include_dirs else None
+    return XYmlFile(job.input, job_params, inc_dirs,
+                    yaml_backend=options.get("yaml_backend", yaml_loader.DEFAULT_YAML_BACKEND),
+                    include_workers=options.get("include_workers", 1),
+                    cache_dir=options.get("cache_dir"),
+                    max_cache_size=options.get("max_cache_size", DEFAULT_MAX_CACHE_SIZE),
+                    multi_document=options.get("multi_document", False),
+                    pipeline=options.get("pipeline", DEFAULT_PIPELINE),
+                    loop_workers=options.get("loop_workers", 1),
+                    environ=options.get("environ"),
+                    cwd=options.get("cwd"))
+
+
+def save_job(job: BatchJob, xyml_file: XYmlFile, options: Dict[str, Any]):
+    """Writes the resolved file to the output of a job and its depfile if requested"""
+    job.output.parent.mkdir(exist_ok=True, parents=True)
+    xyml_file.save(job.output, options.get("sort_keys", False), options.get("output_format"))
+    if options.get("depfile"):
+        xyml_file.dependencies.write_depfile(job.output.with_name(job.output.name + ".d"), job.output)
+
+
+def error_message(error: Exception) -> str:
+    message = getattr(error, "message", None) or str(error)
+    return f"{type(error).__name__}: {message}"
+
+
+def run_batch(jobs: Iterable[BatchJob], params: Dict | None = None, include_dirs: List[Path] | None = None,
+              workers: int = 1, **options) -> BatchSummary:
+    """
+    Resolves all jobs in this process or in a pool of worker processes.
+
+    Parsed files are cached per process, so include files shared by several jobs are only parsed once per worker.
+    Failing jobs do not abort the batch, they are reported in the returned summary.
+
+    Parameters
+        params: Parameters used for all jobs, updated by the parameters of each job
+        workers: Number of worker processes, 1 resolves all jobs in the current process
+        options: Additional arguments: sort_keys, yaml_backend, include_workers, cache_dir, max_cache_size, depfile,
+            multi_document, pipeline, loop_workers, output_format
+    """
+    jobs = list(jobs)
+    params = params or {}
+    start = time.perf_counter()
+    if workers <= 1 or len(jobs) <= 1:
+        results = [resolve_job(job, params, include_dirs, options) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            futures = [executor.submit(resolve_job, job, params, include_dirs, options) for job in jobs]
+            results = [future.result() for future in futures]
+    return BatchSummary(results, time.perf_counter() - start)
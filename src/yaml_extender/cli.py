@@ -1,36 +1,140 @@
+from __future__ import annotations
+
 import argparse
+import os
 import sys
 
 from pathlib import Path
 from typing import List, Dict
 
-from yaml_extender import yaml_loader
+from yaml_extender import batch, output_formats, server, yaml_loader
+from yaml_extender.client import CLIENT_COMMAND, DEFAULT_SOCKET_PATH, client_main
 from yaml_extender.resolver import reference_resolver
-from yaml_extender.xyml_file import XYmlFile
+from yaml_extender.result_cache import DEFAULT_MAX_CACHE_SIZE
+from yaml_extender.xyml_file import DEFAULT_PIPELINE, PIPELINES, XYmlFile
 from yaml_extender.logger import get_logger
 
 LOGGER = get_logger()
 
+BATCH_COMMAND = "batch"
+SERVE_COMMAND = "serve"
+
 
-def main():
+def main(argv: List[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == BATCH_COMMAND:
+        return batch_main(argv[1:])
+    if argv and argv[0] == SERVE_COMMAND:
+        return serve_main(argv[1:])
+    if argv and argv[0] == CLIENT_COMMAND:
+        return client_main(argv[1:])
     parser = argparse.ArgumentParser()
     parser.add_argument("input", help="Input yaml file to be parsed", type=Path)
     parser.add_argument("output", help="Output file to save to", type=Path)
-    parser.add_argument("-i", "--include", help="Include paths", type=Path, action="append")
-    parser.add_argument("--sort-keys", help="When set output file will have keys sorted", action="store_true")
-    args, unknown_args = parser.parse_known_args()
+    add_common_arguments(parser)
+    args, unknown_args = parser.parse_known_args(argv)
 
     if not args.input.is_file:
         raise FileNotFoundError(f"Path {args.input} is no valid file.")
     additional_args = parse_unknown_args(unknown_args)
     LOGGER.info("Additional parameters:\n" + "\n".join([f"{k}: {v}" for k, v in additional_args.items()]))
-    xyml_file = XYmlFile(args.input, additional_args, args.include)
+    cache_dir = None if args.no_cache else args.cache_dir
+    xyml_file = XYmlFile(args.input, additional_args, args.include, args.yaml_backend, args.include_workers,
+                         cache_dir, args.cache_size * 1024 * 1024, args.multi_document, args.pipeline,
+                         loop_workers=args.loop_workers)
     output_dir: Path = args.output.parent
     output_dir.mkdir(exist_ok=True, parents=True)
-    xyml_file.save(args.output, args.sort_keys)
+    xyml_file.save(args.output, args.sort_keys, args.format)
+    if args.depfile or args.write_depfile:
+        depfile = args.depfile or args.output.with_name(args.output.name + ".d")
+        xyml_file.dependencies.write_depfile(depfile, args.output)
     return 0
 
 
+def batch_main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog=f"yaml_extender {BATCH_COMMAND}",
+                                     description="Resolves many input files within one process")
+    parser.add_argument("-m", "--manifest", help="Yaml manifest listing jobs with input, output and optional params",
+                        type=Path, action="append", default=[])
+    parser.add_argument("--pair", help="Input and output file to be resolved", type=Path, nargs=2, action="append",
+                        metavar=("INPUT", "OUTPUT"), default=[])
+    parser.add_argument("--glob", help="Resolve all files matching the pattern, requires --output-dir",
+                        action="append", default=[])
+    parser.add_argument("--output-dir", help="Output directory for files matched by --glob", type=Path)
+    parser.add_argument("-j", "--workers", help="Number of worker processes", type=int, default=os.cpu_count() or 1)
+    add_common_arguments(parser)
+    args, unknown_args = parser.parse_known_args(argv)
+
+    jobs = []
+    for manifest in args.manifest:
+        jobs.extend(batch.load_manifest(manifest))
+    jobs.extend(batch.BatchJob(inp, out) for inp, out in args.pair)
+    if args.glob and not args.output_dir:
+        parser.error("--glob requires --output-dir")
+    for pattern in args.glob:
+        jobs.extend(batch.jobs_from_glob(pattern, args.output_dir,
+                                         output_formats.suffix_for_format(args.format, batch.DEFAULT_OUTPUT_SUFFIX)))
+    if not jobs:
+        parser.error("No files to resolve, provide a manifest, --pair or --glob")
+    if args.depfile:
+        parser.error("A depfile path is not supported in batch mode, -MD writes <output>.d for every file")
+    additional_args = parse_unknown_args(unknown_args)
+    summary = batch.run_batch(jobs, additional_args, args.include, args.workers,
+                              sort_keys=args.sort_keys, yaml_backend=args.yaml_backend,
+                              include_workers=args.include_workers,
+                              cache_dir=None if args.no_cache else args.cache_dir,
+                              max_cache_size=args.cache_size * 1024 * 1024,
+                              depfile=args.write_depfile, multi_document=args.multi_document,
+                              pipeline=args.pipeline, loop_workers=args.loop_workers,
+                              output_format=args.format)
+    LOGGER.info("Batch summary:\n" + summary.report())
+    return 0 if summary.success else 1
+
+
+def serve_main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog=f"yaml_extender {SERVE_COMMAND}",
+                                     description="Resolves files requested by yaml_extender client, "
+                                                 "parsed files stay cached between requests")
+    parser.add_argument("--socket", help="Unix socket to listen on", type=Path, default=DEFAULT_SOCKET_PATH)
+    add_common_arguments(parser)
+    args, unknown_args = parser.parse_known_args(argv)
+    if args.depfile:
+        parser.error("A depfile path is not supported in server mode, -MD writes <output>.d for every request")
+    server.serve(args.socket, parse_unknown_args(unknown_args), args.include,
+                 sort_keys=args.sort_keys, yaml_backend=args.yaml_backend, include_workers=args.include_workers,
+                 cache_dir=None if args.no_cache else args.cache_dir, max_cache_size=args.cache_size * 1024 * 1024,
+                 depfile=args.write_depfile, multi_document=args.multi_document, pipeline=args.pipeline,
+                 loop_workers=args.loop_workers, output_format=args.format)
+    return 0
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-i", "--include", help="Include paths", type=Path, action="append")
+    parser.add_argument("--sort-keys", help="When set output file will have keys sorted", action="store_true")
+    parser.add_argument("--yaml-backend", help="Yaml implementation used for loading and saving, "
+                                               "'auto' uses libyaml if available",
+                        choices=yaml_loader.YAML_BACKENDS, default=yaml_loader.DEFAULT_YAML_BACKEND)
+    parser.add_argument("--include-workers", help="Number of threads loading include files concurrently",
+                        type=int, default=1)
+    parser.add_argument("--loop-workers", help="Number of processes expanding loops with many items",
+                        type=int, default=1)
+    parser.add_argument("--cache-dir", help="Directory to cache resolved files in, "
+                                            "unchanged inputs are not resolved again", type=Path)
+    parser.add_argument("--cache-size", help="Maximum size of the cache directory in MB",
+                        type=int, default=DEFAULT_MAX_CACHE_SIZE // (1024 * 1024))
+    parser.add_argument("--no-cache", help="Bypass the cache directory", action="store_true")
+    parser.add_argument("--multi-document", help="Resolve and write every document of a multi document file separately",
+                        action="store_true")
+    parser.add_argument("--pipeline", help="'staged' resolves inline loops and references in separate passes, "
+                                           "'fused' in a single pass", choices=PIPELINES, default=DEFAULT_PIPELINE)
+    parser.add_argument("--format", help="Output format, selected by the suffix of the output file by default",
+                        choices=output_formats.OUTPUT_FORMATS)
+    parser.add_argument("-M", "--depfile", help="Write a make style depfile listing all included files to the path",
+                        type=Path)
+    parser.add_argument("-MD", "--write-depfile", help="Write a make style depfile listing all included files to "
+                                                       "<output>.d", action="store_true")
+
+
 def parse_unknown_args(args: List) -> Dict:
     arg_dict = dict(zip(args[:-1:2], args[1::2]))
     ret_val = {}
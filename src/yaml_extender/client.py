@@ -0,0 +1,91 @@
+"""
+Client of the resolve server, see server.ResolveServer.
+
+Only uses the standard library, so the client starts without importing yaml or the resolvers.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def default_socket_path() -> str:
+    """
+    Returns the socket within the runtime directory of the user or within a directory of the user in the temp
+    directory. Every user has its own server, which only the user can connect to.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "yaml_extender.sock")
+    return os.path.join(tempfile.gettempdir(), f"yaml_extender-{os.getuid()}", "server.sock")
+
+
+DEFAULT_SOCKET_PATH = default_socket_path()
+CLIENT_COMMAND = "client"
+
+
+def send_request(request: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH) -> Dict[str, Any]:
+    """Sends a request as a line of json and returns the response of the server"""
+    # Sockets created by other users might be used to collect requests
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"Socket {socket_path} is not owned by the current user")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as reader:
+            response = reader.readline()
+    if not response:
+        raise ConnectionError(f"Server at {socket_path} closed the connection without a response")
+    return json.loads(response)
+
+
+def client_main(argv: List[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog=f"yaml_extender {CLIENT_COMMAND}",
+                                     description="Resolves a file within a running yaml_extender server")
+    parser.add_argument("input", help="Input yaml file to be parsed", type=Path)
+    parser.add_argument("output", help="Output file to save to", type=Path)
+    parser.add_argument("-i", "--include", help="Include paths", type=Path, action="append", default=[])
+    parser.add_argument("--socket", help="Unix socket of the server", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--sort-keys", help="When set output file will have keys sorted", action="store_true",
+                        default=None)
+    parser.add_argument("--format", help="Output format, selected by the suffix of the output file by default")
+    args, unknown_args = parser.parse_known_args(argv)
+
+    # The server does not share the working directory of the client, send absolute paths only
+    request = {
+        "input": str(args.input.absolute()),
+        "output": str(args.output.absolute()),
+        "cwd": os.getcwd(),
+        "include_dirs": [str(path.absolute()) for path in args.include],
+        # Parameters are parsed by the server like the ones of the other commands
+        "args": unknown_args,
+        # xyml.env references the environment of the client, not the one of the server.
+        # Only the referenced variables are sent, the server responds with their names
+        "env": {},
+    }
+    if args.sort_keys is not None:
+        request["sort_keys"] = args.sort_keys
+    if args.format is not None:
+        request["output_format"] = args.format
+    response = send_request(request, args.socket)
+    while not response.get("success") and (response.get("env") or response.get("env_complete")):
+        requested = {name: os.environ.get(name) for name in response.get("env") or []}
+        if response.get("env_complete") and not request.get("env_complete"):
+            request["env_complete"] = True
+            requested.update(os.environ)
+        elif requested.items() <= request["env"].items():
+            # The server requests no new variables
+            break
+        request["env"].update(requested)
+        response = send_request(request, args.socket)
+    if not response.get("success"):
+        print(f"Failed to resolve {args.input}: {response.get('error')}", file=sys.stderr)
+        return 1
+    return 0
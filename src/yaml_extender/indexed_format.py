@@ -0,0 +1,329 @@
+"""
+Indexed binary format, which is read through a memory map without decoding the whole content.
+
+Layout, all numbers are little endian:
+
+- Header: magic, format version, slot of the root value and the offset of the string table
+- Containers: every dict and list contained in the content, children are written before their parents
+    - Lists: number of elements followed by a slot per element
+    - Dicts: number of items followed by a key slot and a value slot per item in the order of the dict and an index
+      of (key hash, item number) pairs sorted by hash, used to look up keys by binary search
+- String table: number of strings, offset of every string and the end of the last one, followed by the strings
+
+A slot is a type tag and a 64 bit payload: the value of ints and floats, the number of a string within the string
+table or the offset of a container. Strings are stored once no matter how often they are used. Big ints are stored
+as decimal strings, other objects as pickles within the string table.
+Processes reading the same file share its pages through the page cache instead of each holding its own objects.
+"""
+from __future__ import annotations
+
+import mmap
+import pickle
+import struct
+import zlib
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Tuple
+
+from yaml_extender.xyml_exception import SnapshotFormatError
+
+INDEXED_MAGIC = b"XYMLIDX\0"
+INDEXED_FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIBqq")
+SLOT = struct.Struct("<Bq")
+ITEM = struct.Struct("<BqBq")
+INDEX_ENTRY = struct.Struct("<II")
+COUNT = struct.Struct("<q")
+FLOAT = struct.Struct("<d")
+
+NONE_TAG = 0
+FALSE_TAG = 1
+TRUE_TAG = 2
+INT_TAG = 3
+FLOAT_TAG = 4
+STRING_TAG = 5
+BIG_INT_TAG = 6
+PICKLE_TAG = 7
+MAPPING_TAG = 8
+SEQUENCE_TAG = 9
+
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 63 - 1
+SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
+def key_hash(key: Any) -> int:
+    """Returns a hash of key, which is the same in every process"""
+    if isinstance(key, str):
+        return zlib.crc32(key.encode())
+    return zlib.crc32(b"\0" + repr(key).encode())
+
+
+def is_sequence(value: Any) -> bool:
+    return isinstance(value, Sequence) and not isinstance(value, (str, bytes, bytearray))
+
+
+def container_tag(value: Any) -> int | None:
+    """Returns MAPPING_TAG or SEQUENCE_TAG for dicts and lists, which includes lazy proxies, None for other values"""
+    value_type = type(value)
+    if value_type is dict:
+        return MAPPING_TAG
+    if value_type is list:
+        return SEQUENCE_TAG
+    if value_type in SCALAR_TYPES:
+        return None
+    if isinstance(value, Mapping):
+        return MAPPING_TAG
+    if is_sequence(value):
+        return SEQUENCE_TAG
+    return None
+
+
+class IndexedWriter:
+    """Writes a content in the indexed format, dicts and lists contained more than once are only written once"""
+
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self.__base = stream.tell()
+        self.__strings: List[bytes] = []
+        self.__string_numbers: Dict[str, int] = {}
+        # Offsets of the written dicts and lists by their id, the nodes are kept alive
+        self.__offsets: Dict[int, Tuple[Any, int]] = {}
+
+    def write(self, content: Any):
+        self.stream.write(bytes(HEADER.size))
+        self.__write_containers(content)
+        root_tag, root_payload = self.__slot(content)
+        strings_offset = self.__write_strings()
+        end = self.stream.tell()
+        self.stream.seek(self.__base)
+        self.stream.write(HEADER.pack(INDEXED_MAGIC, INDEXED_FORMAT_VERSION, root_tag, root_payload, strings_offset))
+        self.stream.seek(end)
+
+    def __write_containers(self, content: Any):
+        """Writes all dicts and lists of content, children are written before their parents without recursion"""
+        if container_tag(content) is None:
+            return
+        stack = [(content, container_tag(content), False)]
+        while stack:
+            node, tag, expanded = stack.pop()
+            if id(node) in self.__offsets:
+                continue
+            children = list(node.values()) if tag == MAPPING_TAG else list(node)
+            if not expanded:
+                stack.append((node, tag, True))
+                for child in children:
+                    child_tag = container_tag(child)
+                    if child_tag is not None:
+                        stack.append((child, child_tag, False))
+                continue
+            offset = self.stream.tell() - self.__base
+            if tag == MAPPING_TAG:
+                self.__write_mapping(node)
+            else:
+                self.stream.write(COUNT.pack(len(children)))
+                self.stream.write(b"".join(SLOT.pack(*self.__slot(child)) for child in children))
+            self.__offsets[id(node)] = (node, offset)
+
+    def __write_mapping(self, node: Mapping):
+        items = list(node.items())
+        self.stream.write(COUNT.pack(len(items)))
+        self.stream.write(b"".join(ITEM.pack(*self.__slot(key), *self.__slot(value)) for key, value in items))
+        index = sorted((key_hash(key), i) for i, (key, _) in enumerate(items))
+        self.stream.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in index))
+
+    def __write_strings(self) -> int:
+        offset = self.stream.tell() - self.__base
+        data_offset = offset + COUNT.size * (len(self.__strings) + 2)
+        offsets = [data_offset]
+        for string in self.__strings:
+            offsets.append(offsets[-1] + len(string))
+        self.stream.write(COUNT.pack(len(self.__strings)))
+        self.stream.write(struct.pack(f"<{len(offsets)}q", *offsets))
+        self.stream.write(b"".join(self.__strings))
+        return offset
+
+    def __string(self, value: str) -> int:
+        number = self.__string_numbers.get(value)
+        if number is None:
+            number = self.__string_numbers[value] = self.__blob(value.encode())
+        return number
+
+    def __blob(self, value: bytes) -> int:
+        self.__strings.append(value)
+        return len(self.__strings) - 1
+
+    def __slot(self, value: Any) -> Tuple[int, int]:
+        if value is None:
+            return NONE_TAG, 0
+        if value is True:
+            return TRUE_TAG, 0
+        if value is False:
+            return FALSE_TAG, 0
+        value_type = type(value)
+        if value_type is str:
+            return STRING_TAG, self.__string(value)
+        if value_type is int:
+            if MIN_INT <= value <= MAX_INT:
+                return INT_TAG, value
+            return BIG_INT_TAG, self.__string(str(value))
+        if value_type is float:
+            return FLOAT_TAG, COUNT.unpack(FLOAT.pack(value))[0]
+        tag = container_tag(value)
+        if tag is not None:
+            return tag, self.__offsets[id(value)][1]
+        return PICKLE_TAG, self.__blob(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class IndexedFile:
+    """Memory map of a file in the indexed format, values are decoded when they are accessed"""
+
+    def __init__(self, path: str | Path):
+        self.path = path
+        with open(path, 'rb') as file:
+            try:
+                self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotFormatError(path, "File is empty")
+        if len(self.buffer) < HEADER.size:
+            raise SnapshotFormatError(path, "File is too short")
+        magic, version, root_tag, root_payload, strings_offset = HEADER.unpack_from(self.buffer)
+        if magic != INDEXED_MAGIC:
+            raise SnapshotFormatError(path, "File is no indexed snapshot")
+        if version != INDEXED_FORMAT_VERSION:
+            raise SnapshotFormatError(path, f"Unsupported indexed snapshot version {version}, "
+                                            f"expected {INDEXED_FORMAT_VERSION}")
+        self.root = (root_tag, root_payload)
+        self.__string_offsets = strings_offset + COUNT.size
+
+    def value(self, tag: int, payload: int) -> Any:
+        """Decodes the value of a slot, dicts and lists are returned as views"""
+        if tag == STRING_TAG:
+            return self.string(payload).decode()
+        if tag == INT_TAG:
+            return payload
+        if tag == MAPPING_TAG:
+            return IndexedMapping(self, payload)
+        if tag == SEQUENCE_TAG:
+            return IndexedSequence(self, payload)
+        if tag == NONE_TAG:
+            return None
+        if tag == TRUE_TAG:
+            return True
+        if tag == FALSE_TAG:
+            return False
+        if tag == FLOAT_TAG:
+            return FLOAT.unpack(COUNT.pack(payload))[0]
+        if tag == BIG_INT_TAG:
+            return int(self.string(payload))
+        if tag == PICKLE_TAG:
+            return pickle.loads(self.string(payload))
+        raise SnapshotFormatError(self.path, f"Unknown value type {tag}")
+
+    def string(self, number: int) -> bytes:
+        start, end = struct.unpack_from("<qq", self.buffer, self.__string_offsets + number * COUNT.size)
+        return self.buffer[start:end]
+
+
+class IndexedMapping(Mapping):
+    """Read only view of a dict within an indexed file, keys are looked up through the index of the dict"""
+
+    def __init__(self, file: IndexedFile, offset: int):
+        self.__file = file
+        self.__offset = offset + COUNT.size
+        self.__length = COUNT.unpack_from(file.buffer, offset)[0]
+        self.__index = self.__offset + self.__length * ITEM.size
+
+    def __getitem__(self, key: Any) -> Any:
+        buffer = self.__file.buffer
+        target = key_hash(key)
+        # Binary search for the first entry with the hash of key, followed by all other keys with the same hash
+        low, high = 0, self.__length
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(buffer, self.__index + middle * INDEX_ENTRY.size)[0] < target:
+                low = middle + 1
+            else:
+                high = middle
+        for position in range(low, self.__length):
+            entry_hash, number = INDEX_ENTRY.unpack_from(buffer, self.__index + position * INDEX_ENTRY.size)
+            if entry_hash != target:
+                break
+            key_tag, key_payload, value_tag, value_payload = ITEM.unpack_from(buffer,
+                                                                              self.__offset + number * ITEM.size)
+            if self.__file.value(key_tag, key_payload) == key:
+                return self.__file.value(value_tag, value_payload)
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        for number in range(self.__length):
+            key_tag, key_payload = SLOT.unpack_from(self.__file.buffer, self.__offset + number * ITEM.size)
+            yield self.__file.value(key_tag, key_payload)
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def iter_items(self) -> Iterator[Tuple[Any, Any]]:
+        """Yields the items in the order of the dict, without looking up the keys like items()"""
+        file = self.__file
+        for number in range(self.__length):
+            key_tag, key_payload, value_tag, value_payload = ITEM.unpack_from(file.buffer,
+                                                                              self.__offset + number * ITEM.size)
+            yield file.value(key_tag, key_payload), file.value(value_tag, value_payload)
+
+    def __repr__(self):
+        return f"IndexedMapping({self.__length} items)"
+
+
+class IndexedSequence(Sequence):
+    """Read only view of a list within an indexed file"""
+
+    def __init__(self, file: IndexedFile, offset: int):
+        self.__file = file
+        self.__offset = offset + COUNT.size
+        self.__length = COUNT.unpack_from(file.buffer, offset)[0]
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.__length))]
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError("list index out of range")
+        return self.__file.value(*SLOT.unpack_from(self.__file.buffer, self.__offset + index * SLOT.size))
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __eq__(self, other: Any) -> bool:
+        if not is_sequence(other):
+            return NotImplemented
+        return len(self) == len(other) and all(x == y for x, y in zip(self, other))
+
+    def __repr__(self):
+        return f"IndexedSequence({self.__length} values)"
+
+
+def write_indexed(content: Any, stream: IO[bytes]):
+    """Writes content in the indexed format, Mappings and Sequences are written like dicts and lists"""
+    IndexedWriter(stream).write(content)
+
+
+def load_indexed(path: str | Path) -> Any:
+    """
+    Maps an indexed file into memory and returns its content as IndexedMapping or IndexedSequence view.
+
+    Only the header is read, values are decoded when they are accessed. The file is unmapped once all views
+    are released.
+    """
+    file = IndexedFile(path)
+    return file.value(*file.root)
+
+
+def to_python(value: Any) -> Any:
+    """Decodes all values of a view and returns them as plain dicts and lists"""
+    if isinstance(value, IndexedMapping):
+        return {k: to_python(v) for k, v in value.iter_items()}
+    if isinstance(value, IndexedSequence):
+        return [to_python(x) for x in value]
+    return value
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import datetime
+import json
+import pickle
+import struct
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, IO, Iterable
+
+from yaml_extender.xyml_exception import SnapshotFormatError
+
+YAML_FORMAT = "yaml"
+JSON_FORMAT = "json"
+JSON_LINES_FORMAT = "jsonl"
+SNAPSHOT_FORMAT = "snapshot"
+# Memory mapped snapshot, see indexed_format
+INDEXED_FORMAT = "indexed"
+OUTPUT_FORMATS = [YAML_FORMAT, JSON_FORMAT, JSON_LINES_FORMAT, SNAPSHOT_FORMAT, INDEXED_FORMAT]
+# Output files with other suffixes are written as yaml
+FORMAT_SUFFIXES = {".json": JSON_FORMAT, ".jsonl": JSON_LINES_FORMAT, ".snapshot": SNAPSHOT_FORMAT,
+                   ".xidx": INDEXED_FORMAT}
+
+SNAPSHOT_MAGIC = b"XYMLSNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+# Magic and format version, followed by the pickled content
+SNAPSHOT_HEADER = struct.Struct(f"<{len(SNAPSHOT_MAGIC)}sI")
+SNAPSHOT_PICKLE_PROTOCOL = 5
+
+
+def format_for_path(path: str | Path) -> str:
+    """Returns the output format selected by the suffix of path"""
+    return FORMAT_SUFFIXES.get(Path(path).suffix.lower(), YAML_FORMAT)
+
+
+def suffix_for_format(output_format: str | None, default: str) -> str:
+    """Returns the file suffix of output_format, default for yaml or if no format is given"""
+    for suffix, suffix_format in FORMAT_SUFFIXES.items():
+        if suffix_format == output_format:
+            return suffix
+    return default
+
+
+def json_default(value: Any) -> Any:
+    """Converts values json does not support, lazy proxies are converted to dicts and lists"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(content: Any, sort_keys: bool = False) -> str:
+    # json.dump and indentation are not supported by the C encoder, encode the whole content at once
+    return json.dumps(content, sort_keys=sort_keys, default=json_default)
+
+
+def write_json(content: Any, stream: IO, sort_keys: bool = False):
+    stream.write(encode_json(content, sort_keys))
+    stream.write("\n")
+
+
+def write_json_lines(documents: Iterable[Any], stream: IO, sort_keys: bool = False):
+    """Writes every document as a single line of json"""
+    for document in documents:
+        stream.write(encode_json(document, sort_keys))
+        stream.write("\n")
+
+
+def write_snapshot(content: Any, stream: IO[bytes]):
+    """Writes content as versioned pickle, which can be loaded by load_snapshot"""
+    stream.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION))
+    pickle.dump(content, stream, protocol=SNAPSHOT_PICKLE_PROTOCOL)
+
+
+def load_snapshot(path: str | Path) -> Any:
+    """Loads the content of a snapshot written by XYmlFile.save"""
+    with open(path, 'rb') as file:
+        header = file.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            raise SnapshotFormatError(path, "File is too short")
+        magic, version = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotFormatError(path, "File is no snapshot")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotFormatError(path, f"Unsupported snapshot version {version}, "
+                                            f"expected {SNAPSHOT_FORMAT_VERSION}")
+        return pickle.load(file)
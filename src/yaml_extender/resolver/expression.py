@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import operator
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple
+
+from yaml_extender import yaml_loader
+
+EXPRESSION_CACHE_SIZE = 4096
+# Binding strength and implementation of the binary operators
+OPERATORS = {"+": (1, operator.add),
+             "-": (1, operator.sub),
+             "*": (2, operator.mul),
+             "/": (2, operator.truediv)}
+PARENTHESES = "()"
+
+NUMBER = "number"
+REFERENCE = "reference"
+OPERATOR = "operator"
+PARENTHESIS = "parenthesis"
+
+Token = Tuple[str, Any]
+# Compiled (sub) expression, called with a function returning the value of a reference or None if it is not found
+Evaluator = Callable[[Callable[[str], Any]], Any]
+
+
+class Expression:
+    """
+    Compiled arithmetic expression like "replicas * 2 + offset".
+
+    Operands are int and float literals or references. Evaluating returns None if any reference is not found.
+    """
+
+    __slots__ = ("text", "references", "evaluate")
+
+    def __init__(self, text: str, references: List[str], evaluate: Evaluator):
+        self.text = text
+        self.references = references
+        self.evaluate = evaluate
+
+    def __repr__(self):
+        return f"Expression({self.text})"
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Splits text into numbers, references, operators and parentheses.
+
+    An operator within a word is only an operator if it is followed by a digit, a parenthesis, a whitespace or the
+    end of the expression, so references like "my-value" or "path/x" stay intact while "count-1" is a subtraction.
+    """
+    tokens = []
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char.isspace():
+            i += 1
+        elif char in OPERATORS:
+            tokens.append((OPERATOR, char))
+            i += 1
+        elif char in PARENTHESES:
+            tokens.append((PARENTHESIS, char))
+            i += 1
+        else:
+            start = i
+            while i < length:
+                char = text[i]
+                if char.isspace() or char in PARENTHESES:
+                    break
+                if char in OPERATORS and (i + 1 == length or text[i + 1].isdigit() or text[i + 1].isspace()
+                                          or text[i + 1] in PARENTHESES):
+                    break
+                i += 1
+            tokens.append(word_token(text[start:i]))
+    return tokens
+
+
+def word_token(word: str) -> Token:
+    if word[0].isdigit() or word[0] == ".":
+        try:
+            return NUMBER, yaml_loader.parse_numeric_value(word)
+        except ValueError:
+            pass
+    return REFERENCE, word
+
+
+class ExpressionParser:
+    """Precedence climbing parser compiling tokens into nested closures"""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.position = 0
+        self.references: List[str] = []
+
+    def parse(self) -> Evaluator:
+        evaluator = self.__parse_binary(1)
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.tokens[self.position][1]}")
+        return evaluator
+
+    def __peek(self) -> Optional[Token]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def __next(self) -> Token:
+        token = self.__peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        self.position += 1
+        return token
+
+    def __parse_binary(self, min_precedence: int) -> Evaluator:
+        left = self.__parse_unary()
+        token = self.__peek()
+        while token is not None and token[0] == OPERATOR and OPERATORS[token[1]][0] >= min_precedence:
+            self.position += 1
+            precedence, function = OPERATORS[token[1]]
+            right = self.__parse_binary(precedence + 1)
+            left = binary(function, left, right)
+            token = self.__peek()
+        return left
+
+    def __parse_unary(self) -> Evaluator:
+        kind, value = self.__next()
+        if kind == OPERATOR and value in "+-":
+            operand = self.__parse_unary()
+            return operand if value == "+" else binary(operator.sub, constant(0), operand)
+        if kind == PARENTHESIS and value == "(":
+            evaluator = self.__parse_binary(1)
+            if self.__next() != (PARENTHESIS, ")"):
+                raise ValueError("Missing closing parenthesis")
+            return evaluator
+        if kind == NUMBER:
+            return constant(value)
+        if kind == REFERENCE:
+            self.references.append(value)
+            return reference(value)
+        raise ValueError(f"Unexpected token {value}")
+
+
+def constant(value: Any) -> Evaluator:
+    return lambda lookup: value
+
+
+def reference(name: str) -> Evaluator:
+    def evaluate(lookup):
+        value = lookup(name)
+        if value is None or isinstance(value, (int, float)):
+            return value
+        return yaml_loader.parse_numeric_value(value)
+    return evaluate
+
+
+def binary(function: Callable[[Any, Any], Any], left: Evaluator, right: Evaluator) -> Evaluator:
+    def evaluate(lookup):
+        x = left(lookup)
+        if x is None:
+            return None
+        y = right(lookup)
+        if y is None:
+            return None
+        return function(x, y)
+    return evaluate
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(text: str) -> Optional[Expression]:
+    """
+    Compiles text into an Expression.
+
+    Returns None if text is no arithmetic expression, e.g. a single reference, and should be used as reference.
+    """
+    tokens = tokenize(text)
+    if len(tokens) < 2:
+        return None
+    parser = ExpressionParser(tokens)
+    try:
+        evaluate = parser.parse()
+    except ValueError:
+        return None
+    return Expression(text, parser.references, evaluate)
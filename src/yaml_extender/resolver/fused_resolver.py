@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Any
+
+from yaml_extender.resolver.inline_loop_resolver import InlineLoopResolver
+from yaml_extender.resolver.reference_resolver import ReferenceResolver
+from yaml_extender.resolver.reference_template import ReferenceSlot
+
+INLINE_LOOP_MARKER = "xyml.for"
+
+
+class FusedResolver(ReferenceResolver):
+    """
+    Resolves inline loops and references in a single traversal.
+
+    Every string is passed through the inline loop resolution right before its references are resolved,
+    including values of the config, which are looked up before the traversal reached them.
+    Lists are only rebuilt once for both stages and lists without changes are kept.
+
+    The result equals the one of InlineLoopResolver followed by ReferenceResolver. Loops and includes change the
+    structure of the content, so they have to be resolved before.
+    """
+
+    def __init__(self, fail_on_resolve: bool = True, use_index: bool = False, dependency_order: bool = False):
+        super().__init__(fail_on_resolve, use_index, dependency_order)
+        self.inline_loop_resolver = InlineLoopResolver(fail_on_resolve)
+
+    def resolve_reference(self, value: Any, config: dict, depth: int = 0) -> Any:
+        if isinstance(value, str) and INLINE_LOOP_MARKER in value:
+            value = self.inline_loop_resolver.resolve_inline_loop(value, config)
+        return super().resolve_reference(value, config, depth)
+
+    def resolve_path_string(self, value: str, config: dict) -> str:
+        # The inline loop pass of the staged pipeline expanded the string before, it is never extended by subrefs
+        if INLINE_LOOP_MARKER in value:
+            return self.inline_loop_resolver.resolve_inline_loop(value, config)
+        return value
+
+    def resolve_slot(self, slot: ReferenceSlot, config: dict) -> Any:
+        ref_val = super().resolve_slot(slot, config)
+        if isinstance(ref_val, (dict, list)):
+            # Dicts and lists of the config may be referenced before the traversal reached their inline loops
+            ref_val = self.inline_loop_resolver.traverse(ref_val, config, copy_on_write=True)
+        return ref_val
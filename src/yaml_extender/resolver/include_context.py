@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from yaml_extender.xyml_exception import IncludeCycleError
+import yaml_extender.yaml_loader as yaml_loader
+
+IncludeKey = Tuple[str, Tuple, Tuple[Path, ...]]
+
+
+class IncludeFrame:
+    """Include instance currently being resolved"""
+
+    def __init__(self, key: IncludeKey, file: Path):
+        self.key = key
+        self.file = file
+        # Cleared if the content depends on more than the file, its parameters and include directories
+        self.cacheable = True
+
+
+class IncludeContext:
+    """
+    Per run state shared by all include resolvers.
+
+    Memoizes the include resolved content of every include instance, which is identified by the absolute
+    file path, its include parameters and the include directories used for nested includes.
+    The stack of include instances being resolved is used to detect include cycles.
+    """
+
+    def __init__(self):
+        self.__memo: Dict[IncludeKey, Any] = {}
+        self.__active: Set[IncludeKey] = set()
+        self.stack: List[IncludeFrame] = []
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__memo)
+
+    @staticmethod
+    def key(file: Path, parameters: Dict, include_dirs: List[Path]) -> IncludeKey:
+        # Include parameters are always scalars, see IncludeResolver.__parse_include_parameters
+        return str(Path(file).absolute()), tuple(sorted(parameters.items())), tuple(include_dirs)
+
+    def lookup(self, key: IncludeKey) -> Tuple[bool, Any]:
+        """Returns whether key has been resolved before and an isolated copy of its content"""
+        if key in self.__memo:
+            self.hits += 1
+            return True, yaml_loader.copy_content(self.__memo[key])
+        self.misses += 1
+        return False, None
+
+    @contextmanager
+    def enter(self, key: IncludeKey, file: Path) -> Iterator[IncludeFrame]:
+        """Pushes an include instance onto the stack, raises IncludeCycleError if it is already being resolved"""
+        if key in self.__active:
+            start = next(i for i, frame in enumerate(self.stack) if frame.key == key)
+            raise IncludeCycleError([frame.file for frame in self.stack[start:]] + [file])
+        frame = IncludeFrame(key, file)
+        self.stack.append(frame)
+        self.__active.add(key)
+        try:
+            yield frame
+        finally:
+            self.__active.discard(key)
+            self.stack.pop()
+
+    def mark_dynamic(self):
+        """Excludes all include instances on the stack from memoization"""
+        for frame in self.stack:
+            frame.cacheable = False
+
+    def store(self, frame: IncludeFrame, content: Any):
+        if frame.cacheable:
+            self.__memo[frame.key] = yaml_loader.copy_content(content)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+class IncludeGraph:
+    """
+    Records which file includes which other files and the include parameters used for it.
+
+    Edges are stored in the order the include statements have been resolved.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root
+        self.edges: Dict[Optional[Path], List[Tuple[Path, Dict]]] = {}
+
+    def __repr__(self):
+        return f"IncludeGraph({self.root}, {self.edges})"
+
+    def add(self, parent: Optional[Path], child: Path, parameters: Dict | None = None):
+        self.edges.setdefault(parent, []).append((child, parameters or {}))
+
+    def includes(self, path: Optional[Path]) -> List[Tuple[Path, Dict]]:
+        """Returns the files directly included by path with the parameters used"""
+        return self.edges.get(path, [])
+
+    @property
+    def files(self) -> List[Path]:
+        """Returns the root and all transitively included files without duplicates"""
+        files = {} if self.root is None else {self.root: None}
+        for children in self.edges.values():
+            for child, _ in children:
+                files[child] = None
+        return list(files)
+
+    def to_depfile(self, target: Path) -> str:
+        """Returns a make style depfile, which declares all files as dependencies of target"""
+        dependencies = " \\\n  ".join(escape_make_path(str(path)) for path in self.files)
+        return f"{escape_make_path(str(target))}: {dependencies}\n"
+
+    def write_depfile(self, path: Path, target: Path):
+        Path(path).write_text(self.to_depfile(target))
+
+    def to_dict(self) -> dict:
+        return {"root": None if self.root is None else str(self.root),
+                "edges": [[None if parent is None else str(parent),
+                           [[str(child), params] for child, params in children]]
+                          for parent, children in self.edges.items()]}
+
+    @staticmethod
+    def from_dict(value: dict) -> IncludeGraph:
+        graph = IncludeGraph(None if value["root"] is None else Path(value["root"]))
+        for parent, children in value["edges"]:
+            for child, params in children:
+                graph.add(None if parent is None else Path(parent), Path(child), params)
+        return graph
+
+
+def escape_make_path(path: str) -> str:
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
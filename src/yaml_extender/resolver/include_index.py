@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class IncludePathIndex:
+    """
+    Per run index of include file lookups.
+
+    Maps (include directory, include name) to the resolved file or to None if the include directory
+    does not contain it. Entries are probed lazily, so every candidate path is checked at most once per run.
+    """
+
+    def __init__(self):
+        self.__entries: Dict[Tuple[Path, str], Optional[Path]] = {}
+        # Candidates which have been probed, but do not exist
+        self.missing: Set[Path] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def find(self, include_dirs: List[Path], file_path: str) -> Optional[Path]:
+        """Returns the first match of file_path respecting the order of include_dirs"""
+        for include_dir in include_dirs:
+            resolved = self.lookup(include_dir, file_path)
+            if resolved is not None:
+                return resolved
+        return None
+
+    def lookup(self, include_dir: Path, file_path: str) -> Optional[Path]:
+        key = (include_dir, file_path)
+        if key in self.__entries:
+            self.hits += 1
+            return self.__entries[key]
+        self.misses += 1
+        resolved = self.__probe(include_dir / file_path)
+        self.__entries[key] = resolved
+        return resolved
+
+    def __probe(self, path: Path) -> Optional[Path]:
+        if path.is_file():
+            return path
+        self.missing.add(path)
+        return None
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from yaml_extender import yaml_loader
+from yaml_extender.resolver.include_index import IncludePathIndex
+from yaml_extender.resolver.include_resolver import INCLUDE_KEY, INCLUDE_REGEX
+
+
+class IncludePrefetcher:
+    """
+    Reads and parses include files concurrently ahead of the include resolution.
+
+    Every file is loaded at most once, concurrent requests for the same file share the same load.
+    The include resolver still merges the contents sequentially, so the result does not depend on the
+    order in which the files finish loading.
+    """
+
+    def __init__(self, workers: int, path_index: IncludePathIndex | None = None,
+                 yaml_backend: str = yaml_loader.DEFAULT_YAML_BACKEND):
+        self.workers = workers
+        self.path_index = path_index if path_index is not None else IncludePathIndex()
+        self.yaml_backend = yaml_backend
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xyml-include")
+        self.__futures: Dict[str, Future] = {}
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=True)
+
+    def prefetch(self, content: Any, include_dirs: List[Path], cwd: Path | None = None):
+        """
+        Starts loading all include files of content, whose path does not contain references
+
+        Parameters
+            cwd: Working directory used as last include path, the working directory of the process if not given
+        """
+        include_dirs = [inc.absolute() for inc in include_dirs]
+        cwd = Path.cwd() if cwd is None else cwd
+        if cwd not in include_dirs:
+            include_dirs.append(cwd)
+        for file_path in find_static_includes(content):
+            self.prefetch_file(file_path, include_dirs)
+
+    def prefetch_file(self, file_path: str, include_dirs: List[Path]):
+        if Path(file_path).is_absolute():
+            path = Path(file_path)
+        else:
+            path = self.path_index.find(include_dirs, file_path)
+            if path is None:
+                # The include resolver reports missing files in the original order
+                return
+        nested_include_dirs = include_dirs.copy()
+        if path.parent not in nested_include_dirs:
+            nested_include_dirs.append(path.parent)
+        self.__get_future(path, nested_include_dirs)
+
+    def load(self, path: Path, include_dirs: List[Path]) -> Any:
+        """Returns an isolated copy of the content of path, waits for a running load if necessary"""
+        content = self.__get_future(path, include_dirs).result()
+        return yaml_loader.copy_content(content)
+
+    def __get_future(self, path: Path, include_dirs: List[Path]) -> Future:
+        key = str(path)
+        with self.__lock:
+            future = self.__futures.get(key)
+            if future is None:
+                future = self.__executor.submit(self.__load, path, include_dirs)
+                self.__futures[key] = future
+        return future
+
+    def __load(self, path: Path, include_dirs: List[Path]) -> Any:
+        content = yaml_loader.load(str(path), backend=self.yaml_backend)
+        # Continue with the includes of the included file
+        for file_path in find_static_includes(content):
+            self.prefetch_file(file_path, include_dirs)
+        return content
+
+
+def find_static_includes(content: Any) -> Iterator[str]:
+    """Yields the file paths of all include statements in content, which do not contain references"""
+    queue = deque([content])
+    while queue:
+        value = queue.popleft()
+        if isinstance(value, dict):
+            for k, v in value.items():
+                if k == INCLUDE_KEY:
+                    statements = v if isinstance(v, list) else [v]
+                    for statement in statements:
+                        match = re.match(INCLUDE_REGEX, statement) if isinstance(statement, str) else None
+                        if match and "{{" not in match.group(1):
+                            yield match.group(1)
+                else:
+                    queue.append(v)
+        elif isinstance(value, list):
+            queue.extend(value)
@@ -3,62 +3,70 @@ from __future__ import annotations
 import os
 import re
 from pathlib import Path
-from typing import Any, List
+from typing import TYPE_CHECKING, Any, List
 
+from yaml_extender.resolver.include_context import IncludeContext
+from yaml_extender.resolver.include_graph import IncludeGraph
+from yaml_extender.resolver.include_index import IncludePathIndex
 from yaml_extender.resolver.reference_resolver import ReferenceResolver
-from yaml_extender.resolver.resolver import Resolver
+from yaml_extender.resolver.resolver import SKIP, Resolver
 from yaml_extender.xyml_exception import ExtYamlError, ExtYamlSyntaxError
 import yaml_extender.logger as logger
 import yaml_extender.yaml_loader as yaml_loader
 
+if TYPE_CHECKING:
+    from yaml_extender.resolver.include_prefetcher import IncludePrefetcher
 
 INCLUDE_REGEX = r'([^<]+)\s*(?:<<(.*)>>)?'
 INCLUDE_KEY = "xyml.include"
 
 
 class IncludeResolver(Resolver):
+    hook_keys = frozenset([INCLUDE_KEY])
 
-    def __init__(self, include_dirs: List[Path] | None = None, fail_on_resolve: bool = True):
+    def __init__(self, include_dirs: List[Path] | None = None, fail_on_resolve: bool = True,
+                 yaml_backend: str = yaml_loader.DEFAULT_YAML_BACKEND, path_index: IncludePathIndex | None = None,
+                 prefetcher: IncludePrefetcher | None = None, include_graph: IncludeGraph | None = None,
+                 current_file: Path | None = None, context: IncludeContext | None = None, cwd: Path | None = None):
+        """
+        Parameters
+            include_graph: Records the resolved includes, shared with all nested include resolvers
+            current_file: File containing the content to be resolved, None for the root content
+            context: Memo of resolved include instances and include stack, shared with all nested include resolvers
+            cwd: Working directory used as last include path, the working directory of the process if not given
+        """
+        self.yaml_backend = yaml_backend
+        # The path index and the prefetcher are shared with all nested include resolvers
+        self.path_index = path_index if path_index is not None else IncludePathIndex()
+        self.prefetcher = prefetcher
+        self.include_graph = include_graph if include_graph is not None else IncludeGraph()
+        self.current_file = current_file if current_file is not None else self.include_graph.root
+        self.context = context if context is not None else IncludeContext()
         if include_dirs:
             self.include_dirs: List[Path] = [inc.absolute() for inc in include_dirs]
         else:
             self.include_dirs: List[Path] = []
-        if Path.cwd() not in self.include_dirs:
-            self.include_dirs.append(Path.cwd())
+        self.cwd = Path.cwd() if cwd is None else cwd
+        if self.cwd not in self.include_dirs:
+            self.include_dirs.append(self.cwd)
         super().__init__(fail_on_resolve)
 
-    def _Resolver__resolve(self, cur_value: Any, config: dict) -> dict:
-        return self.__resolve_inc(cur_value, config)
-
-    def __resolve_inc(self, cur_value: Any, config: dict) -> Any:
+    def visit_key(self, node: dict, key: Any, config: dict, path: str | None) -> Any:
         """
-        Resolves all include statements in value
+        Resolves include statements, the included content is merged into node or replaces node if it is no dict
 
             Returns:
-                The content of the original file with all includes resolved.
+                SKIP for merged include statements or the included content if it replaces node
         """
-        if isinstance(cur_value, dict):
-            for k, v in list(cur_value.items()):
-                if k != INCLUDE_KEY:
-                    cur_value[k] = self.__resolve_inc(cur_value[k], config)
-                else:
-                    include_content = self.__resolve_include_statement(cur_value[INCLUDE_KEY], config)
-                    if isinstance(include_content, dict):
-                        self.update_content_with_include_content(cur_value, include_content)
-                        del cur_value[INCLUDE_KEY]
-                    else:
-                        return include_content
-        elif isinstance(cur_value, list):
-            new_content = []
-            for i, x in enumerate(cur_value):
-                new_value = (self.__resolve_inc(x, config))
-                if isinstance(new_value, list):
-                    new_content.extend(new_value)
-                else:
-                    new_content.append(new_value)
-            if new_content:
-                cur_value = new_content
-        return cur_value
+        include_content = self.__resolve_include_statement(node[INCLUDE_KEY], config)
+        if isinstance(include_content, dict):
+            self.update_content_with_include_content(node, include_content)
+            del node[INCLUDE_KEY]
+            return SKIP
+        return include_content
+
+    def leave_list(self, node: list, items: list, flattened: bool, config: dict, path: str | None) -> Any:
+        return items if items else node
 
     def __resolve_include_statement(self, value: List | str, config: dict) -> dict:
         """Resolves an include statement and return the content"""
@@ -68,26 +76,51 @@ class IncludeResolver(Resolver):
             statements = value
         # Resolve all references in statement
         ref_resolver = ReferenceResolver(False)
+        matches = [re.match(INCLUDE_REGEX, statement) for statement in statements]
+        # Resolve references in filenames
+        inc_file_paths = [ref_resolver.resolve(match.group(1), config) for match in matches]
+        if self.prefetcher:
+            # Start loading all files of the statement, the contents are still merged in order
+            for inc_file_path in inc_file_paths:
+                self.prefetcher.prefetch_file(inc_file_path, self.include_dirs)
+        if any("{{" in match.group(1) for match in matches):
+            # Include paths referencing the config can not be memoized by file and parameters
+            self.context.mark_dynamic()
         inc_contents = None
-        for statement in statements:
-            # Resolve include parameters
-            match = re.match(INCLUDE_REGEX, statement)
-            # Resolve references in filenames
-            inc_file_path = ref_resolver.resolve(match.group(1), config)
+        for match, inc_file_path in zip(matches, inc_file_paths):
             logger.info(f"Resolving Include '{inc_file_path}'")
-            inc_content = self.__read_included_yaml(inc_file_path)
-            # Resolve parameters in included file
+            inc_file = self.__find_included_yaml(inc_file_path)
+            parameters = {}
             if match.group(2):
                 parameters = self.__parse_include_parameters(match.group(2))
-                inc_content = ref_resolver.resolve(inc_content, parameters)
-            # Add include content to current content
-            include_dirs = self.include_dirs.copy()
-            include_dirs.append(Path(inc_file_path).parent)
-            inc_resolver = IncludeResolver(include_dirs, self.fail_on_resolve)
-            inc_content = inc_resolver.__resolve_inc(inc_content, config)
+            self.include_graph.add(self.current_file, inc_file, parameters)
+            inc_include_dirs = self.__nested_include_dirs(inc_file)
+            key = self.context.key(inc_file, parameters, inc_include_dirs)
+            found, inc_content = self.context.lookup(key)
+            if not found:
+                with self.context.enter(key, inc_file) as frame:
+                    inc_content = self.__read_included_yaml(inc_file, inc_include_dirs)
+                    # Resolve parameters in included file
+                    if parameters:
+                        inc_content = ref_resolver.resolve(inc_content, parameters)
+                    # Add include content to current content
+                    inc_resolver = IncludeResolver(inc_include_dirs, self.fail_on_resolve, self.yaml_backend,
+                                                   self.path_index, self.prefetcher, self.include_graph, inc_file,
+                                                   self.context, self.cwd)
+                    inc_content = inc_resolver.traverse(inc_content, config)
+                    self.context.store(frame, inc_content)
             inc_contents = self.update_inc_content(inc_contents, inc_content)
         return inc_contents
 
+    def __nested_include_dirs(self, inc_file: Path) -> List[Path]:
+        """Adds the directory of the included file, so its relative includes are found next to it"""
+        include_dirs = self.include_dirs.copy()
+        inc_dir = inc_file.parent
+        # A directory already contained can not change the lookup result, skipping it keeps the memo keys stable
+        if inc_dir not in include_dirs:
+            include_dirs.append(inc_dir)
+        return include_dirs
+
     def update_content_with_include_content(self, existing_content, include_content):
         for k, v in include_content.items():
             if k in existing_content:
@@ -123,14 +156,16 @@ class IncludeResolver(Resolver):
             parameters[key] = yaml_loader.parse_any_value(value)
         return parameters
 
-    def __read_included_yaml(self, file_path: str):
+    def __find_included_yaml(self, file_path: str) -> Path:
         # Try path with all include dirs respecting the order
-        file = Path(file_path)
-        if not file.is_absolute():
-            for path in self.include_dirs:
-                file = path / file_path
-                if file.is_file():
-                    return yaml_loader.load(str(file))
-        else:
-            return yaml_loader.load(str(file))
-        raise ExtYamlError(f"Include file '{file_path}' not found. Are include directories provided?")
+        if Path(file_path).is_absolute():
+            return Path(file_path)
+        file = self.path_index.find(self.include_dirs, file_path)
+        if file is None:
+            raise ExtYamlError(f"Include file '{file_path}' not found. Are include directories provided?")
+        return file
+
+    def __read_included_yaml(self, file: Path, include_dirs: List[Path]) -> Any:
+        if self.prefetcher:
+            return self.prefetcher.load(file, include_dirs)
+        return yaml_loader.load(str(file), backend=self.yaml_backend)
@@ -1,16 +1,16 @@
 from __future__ import annotations
 
-import copy
 import re
-from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator, Tuple
 
 from yaml_extender.resolver.reference_resolver import ReferenceResolver
+from yaml_extender.resolver.reference_template import ReferenceSlot, ReferenceTemplate, compile_template
 from yaml_extender.resolver.resolver import Resolver
-from yaml_extender.xyml_exception import RecursiveReferenceError, ReferenceNotFoundError, ExtYamlSyntaxError
+from yaml_extender.xyml_exception import ExtYamlSyntaxError
 
 LOOP_KEY = "xyml.for"
-INLINE_LOOP_REGEX = r'(\{\{\s*xyml\.for\s*:\s*([^:]+)\s*:\s*([^:]+)\s*:(.+)\}\})'
+# Start of an inline loop statement up to its content, the content ends at the matching "}}"
+INLINE_LOOP_HEADER_REGEX = r'\{\{\s*xyml\.for\s*:([^:]+):([^:]+):'
 MAXIMUM_REFERENCE_DEPTH = 30
 
 
@@ -20,42 +20,124 @@ class InlineLoopResolver(Resolver):
         super().__init__(fail_on_resolve)
         self.ref_resolver = ReferenceResolver(False)
 
-    def _Resolver__resolve(self, cur_value: Any, config: dict):
-        """Resolves all references in a given value using the provided content dict"""
-        new_value = cur_value
-        if isinstance(cur_value, dict):
-            for k in cur_value.keys():
-                cur_value[k] = self._Resolver__resolve(cur_value[k], config)
-        elif isinstance(cur_value, list):
-            new_list = []
-            for i, x in enumerate(cur_value):
-                resolved_value = self._Resolver__resolve(x, config)
-                if isinstance(resolved_value, list):
-                    # If the returned value is also a list, extend the current list with it
-                    new_list.extend(resolved_value)
-                else:
-                    new_list.append(self._Resolver__resolve(x, config))
-            new_value = new_list
-        elif isinstance(cur_value, str):
-            new_value = self.resolve_inline_loop(cur_value, config)
-        return new_value
+    def visit_value(self, value: Any, config: dict, path: str | None) -> Any:
+        if isinstance(value, str):
+            return self.resolve_inline_loop(value, config)
+        return value
 
     def resolve_inline_loop(self, value: str, config: dict):
-        new_value = value
-        for match in re.findall(INLINE_LOOP_REGEX, value):
-            full_match = match[0]
-            iterator = match[1]
-            iteration_value = match[2]
-            content = match[3]
-            iter_content = config[iteration_value]
-            if not isinstance(iter_content, list):
-                raise ExtYamlSyntaxError(f"{iteration_value} is not iterable and therefore cannot be used in a loop.")
-            new_content = self.get_loop_content(content, iterator, iter_content)
-            new_value = new_value.replace(full_match, new_content)
-        return new_value
-
-    def get_loop_content(self, content: str, iterator: str, iteration_value: list):
-        new_content = ""
+        """Replaces every inline loop statement {{xyml.for:iterator:source:content}} of value by its content"""
+        parts = []
+        position = 0
+        for start, end in self.find_inline_loops(value):
+            parts.append(value[position:start])
+            parts.append(self.expand_inline_loop(value[start:end], config))
+            position = end
+        if not parts:
+            return value
+        parts.append(value[position:])
+        return "".join(parts)
+
+    @staticmethod
+    def find_inline_loops(value: str) -> Iterator[Tuple[int, int]]:
+        """
+        Yields start and end index of every outermost inline loop statement of value in a single scan.
+
+        Statements end at the "}}" matching their "{{", so the content may contain references and other loops.
+        Unterminated statements are ignored.
+        """
+        length = len(value)
+        start = value.find("{{")
+        while start != -1:
+            header = start + 2
+            while header < length and value[header].isspace():
+                header += 1
+            is_loop = value.startswith(LOOP_KEY, header)
+            if is_loop:
+                header += len(LOOP_KEY)
+                while header < length and value[header].isspace():
+                    header += 1
+                is_loop = value.startswith(":", header)
+            if not is_loop:
+                start = value.find("{{", start + 2)
+                continue
+            depth = 1
+            position = start + 2
+            while depth:
+                next_start = value.find("{{", position)
+                next_end = value.find("}}", position)
+                if next_end == -1:
+                    return
+                if next_start != -1 and next_start < next_end:
+                    depth += 1
+                    position = next_start + 2
+                else:
+                    depth -= 1
+                    position = next_end + 2
+            yield start, position
+            start = value.find("{{", position)
+
+    def expand_inline_loop(self, statement: str, config: dict) -> str:
+        """Returns the content of a single inline loop statement rendered for every item"""
+        match = re.match(INLINE_LOOP_HEADER_REGEX, statement)
+        if not match:
+            raise ExtYamlSyntaxError(f"No valid inline loop statement: {statement}")
+        iterator, iteration_value = match[1].strip(), match[2].strip()
+        content = statement[match.end():-2]
+        # Missing sources raise even without fail_on_resolve, the statement would be read as a reference with a default
+        iter_content = self.ref_resolver.resolve_subrefs(iteration_value, config)
+        if not isinstance(iter_content, list):
+            raise ExtYamlSyntaxError(f"{iteration_value} is not iterable and therefore cannot be used in a loop.")
+        return self.get_loop_content(content, iterator, iter_content, config)
+
+    def get_loop_content(self, content: str, iterator: str, iteration_value: list, config: dict | None = None):
+        """
+        Renders content for every item and joins the results.
+
+        The content is compiled once into a template and all items are joined at once. Reference slots not
+        containing the iterator are resolved only once for all items. Nested inline loops are expanded first for
+        every item, using config.
+        """
+        if config is not None and any(True for _ in self.find_inline_loops(content)):
+            return "".join(str(self.ref_resolver.resolve_reference(self.resolve_inline_loop(content, config),
+                                                                   {iterator: item}))
+                           for item in iteration_value)
+        template = compile_template(content)
+        getters = [self.__slot_getter(slot, iterator, template.whole) for slot in template.slots]
+        # Indices of the slots depending on the item, only their values may contain new references
+        dynamic = [i for i, slot in enumerate(template.slots) if iterator in slot.reference]
+        literals = template.literals
+        parts = []
         for item in iteration_value:
-            new_content += str(self.ref_resolver.resolve(content, {iterator: item}))
-        return new_content
+            values = [get(item) for get in getters]
+            if not template.whole and all(type(values[i]) is str and "{" not in values[i] for i in dynamic):
+                # Plain strings are joined directly, without rendering the template
+                parts.append(literals[0])
+                for value, literal in zip(values, literals[1:]):
+                    parts.append(value)
+                    parts.append(literal)
+                continue
+            rendered = template.render(values)
+            if isinstance(rendered, str) and any(self.__contains_reference(values[i]) for i in dynamic):
+                # Values containing references are resolved recursively like ReferenceResolver.resolve_reference
+                rendered = self.ref_resolver.resolve_reference(rendered, {iterator: item}, 1)
+            parts.append(str(rendered))
+        return "".join(parts)
+
+    def __slot_getter(self, slot: ReferenceSlot, iterator: str, whole: bool) -> Callable[[Any], Any]:
+        """Returns a function returning the value of slot for an item"""
+        if iterator not in slot.reference:
+            # Slots without the iterator resolve to the same value for all items, rendered once into text
+            value = self.ref_resolver.resolve_slot(slot, {})
+            if not whole:
+                value = ReferenceTemplate(slot.text, ["", ""], [slot]).render([value])
+            return lambda item: value
+        if slot.reference == iterator:
+            return lambda item: item
+        return lambda item: self.ref_resolver.resolve_slot(slot, {iterator: item})
+
+    @staticmethod
+    def __contains_reference(value: Any) -> bool:
+        if isinstance(value, str):
+            return "{" in value
+        return isinstance(value, list) and any(isinstance(x, str) and "{" in x for x in value)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List
+
+from yaml_extender.resolver.fused_resolver import FusedResolver
+from yaml_extender.resolver.resolver import child_path
+
+
+class LazyResolver:
+    """
+    Resolves inline loops and references of content on access instead of in a single pass.
+
+    Includes and loops change the structure of the content and have to be resolved before.
+    Dicts and lists are wrapped into LazyMapping and LazySequence proxies, scalars are resolved through
+    FusedResolver.resolve_node when they are read the first time. Resolved values are memoized by their path,
+    so referenced values are resolved only once, no matter if they are read directly or through a reference.
+    Dicts and lists referenced as a whole are wrapped as well and resolved on access.
+    """
+
+    def __init__(self, config: dict, fail_on_resolve: bool = False):
+        """
+        Parameters
+            config: Content extended by the xyml statements, see XYmlFile.reference_config
+        """
+        self.config = config
+        self.resolver = FusedResolver(fail_on_resolve, dependency_order=True)
+        self.resolver.prepare(config)
+
+    def wrap(self, content: Any) -> Any:
+        """Returns content as proxy, which is found at the top level of config"""
+        return self.resolve_value(content, "")
+
+    def resolve_value(self, value: Any, path: str | None) -> Any:
+        """
+        Returns a proxy for dicts and lists and the resolved value for scalars.
+
+        Parameters
+            path: Path of value in config, None for values which were referenced as a whole
+        """
+        if isinstance(value, dict):
+            return LazyMapping(self, value, path)
+        if isinstance(value, list):
+            return LazySequence(self, value, path)
+        if path is None:
+            resolved = self.resolver.resolve_reference(value, self.config)
+        else:
+            resolved = self.resolver.resolve_node(path, value, self.config)
+        if isinstance(resolved, (dict, list)):
+            return self.resolve_value(resolved, None)
+        return resolved
+
+
+class LazyMapping(Mapping):
+    """Read only dict proxy, resolving every value on its first access"""
+
+    def __init__(self, resolver: LazyResolver, node: dict, path: str | None):
+        self.__resolver = resolver
+        self.__node = node
+        self.__path = path
+        self.__values: Dict[Any, Any] = {}
+
+    def __getitem__(self, key: Any) -> Any:
+        if key in self.__values:
+            return self.__values[key]
+        value = self.__resolver.resolve_value(self.__node[key], child_path(self.__path, key))
+        self.__values[key] = value
+        return value
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.__node)
+
+    def __len__(self) -> int:
+        return len(self.__node)
+
+    def __repr__(self):
+        return f"LazyMapping({self.__path!r}, {len(self.__values)}/{len(self.__node)} resolved)"
+
+
+class LazySequence(Sequence):
+    """
+    Read only list proxy.
+
+    Values resolving to a list are flattened into the list like in ReferenceResolver, so all values of the list
+    are resolved on the first access. Dicts within the list are still resolved on access.
+    """
+
+    def __init__(self, resolver: LazyResolver, node: list, path: str | None):
+        self.__resolver = resolver
+        self.__node = node
+        self.__path = path
+        self.__items: List[Any] | None = None
+
+    def __items_list(self) -> List[Any]:
+        if self.__items is None:
+            items = []
+            for i, value in enumerate(self.__node):
+                resolved = self.__resolver.resolve_value(value, child_path(self.__path, i))
+                if isinstance(resolved, LazySequence):
+                    items.extend(resolved)
+                else:
+                    items.append(resolved)
+            self.__items = items
+        return self.__items
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.__items_list()[index]
+
+    def __len__(self) -> int:
+        return len(self.__items_list())
+
+    def __repr__(self):
+        return f"LazySequence({self.__path!r}, {len(self.__node)} values)"
+
+
+def materialize(value: Any) -> Any:
+    """Resolves all values of proxies and returns them as plain dicts and lists"""
+    if isinstance(value, LazyMapping):
+        return {k: materialize(v) for k, v in value.items()}
+    if isinstance(value, LazySequence):
+        return [materialize(x) for x in value]
+    return value
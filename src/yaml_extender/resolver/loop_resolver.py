@@ -1,48 +1,163 @@
 from __future__ import annotations
 
-import copy
 import re
-from typing import Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Set, Tuple
 
+from yaml_extender import yaml_loader
 from yaml_extender.resolver.reference_resolver import ReferenceResolver
-from yaml_extender.resolver.resolver import Resolver
+from yaml_extender.resolver.resolver import DESCEND, Resolver
 from yaml_extender.xyml_exception import RecursiveReferenceError, ReferenceNotFoundError, ExtYamlSyntaxError
 
 LOOP_KEY = "xyml.for"
 LOOP_CONTENT_KEY = "xyml.content"
 LOOP_REGEX = r'(.+):(.+)'
 MAXIMUM_REFERENCE_DEPTH = 30
+# Minimum number of items of a loop to be expanded in parallel
+DEFAULT_PARALLEL_THRESHOLD = 1000
+
+
+class LoopBodyRenderer(Resolver):
+    """
+    Resolves the references of a loop body for a single item like ReferenceResolver.resolve, without modifying it.
+
+    Returns the body itself if nothing changed, otherwise only the changed dicts and lists are rebuilt and all
+    other nodes are shared with the body.
+    """
+
+    def __init__(self, ref_resolver: ReferenceResolver):
+        super().__init__(False)
+        self.ref_resolver = ref_resolver
+        # Ids of referenced dicts and lists inserted without copies, which are copied once the loop is expanded.
+        # None to copy them for every insertion
+        self.inserted: Set[int] | None = None
+        # Flag for every dict and list if rendering may change it, the nodes are kept alive
+        self.__dynamic: Dict[int, Tuple[Any, bool]] = {}
+
+    def render(self, value: Any, config: dict, inserted: Set[int] | None) -> Any:
+        self.inserted = inserted
+        return self.traverse(value, config, copy_on_write=True)
+
+    def clear(self):
+        self.__dynamic.clear()
+
+    def visit_node(self, node: Any, config: dict, path: str | None) -> Any:
+        return DESCEND if self.is_dynamic(node) else node
+
+    def visit_value(self, value: Any, config: dict, path: str | None) -> Any:
+        if not isinstance(value, str) or "{{" not in value:
+            return value
+        resolved = self.ref_resolver.resolve_reference(value, config)
+        if isinstance(resolved, (dict, list)):
+            if self.inserted is None:
+                return yaml_loader.copy_content(resolved)
+            self.inserted.add(id(resolved))
+            if isinstance(resolved, list):
+                self.inserted.update(id(x) for x in resolved)
+        return resolved
+
+    def leave_list(self, node: list, items: list, flattened: bool, config: dict, path: str | None) -> Any:
+        if len(items) == len(node) and all(x is y for x, y in zip(items, node)):
+            return node
+        return items
+
+    def is_dynamic(self, value: Any) -> bool:
+        """Checks if value contains references or nested lists, which are flattened by rendering"""
+        if isinstance(value, str):
+            return "{{" in value
+        if not isinstance(value, (dict, list)):
+            return False
+        # Children are evaluated before their parents, without recursion
+        stack = [(value, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in self.__dynamic:
+                continue
+            children = list(node.values()) if isinstance(node, dict) else node
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((x, False) for x in children if isinstance(x, (dict, list)))
+                continue
+            dynamic = False
+            for x in children:
+                if isinstance(x, list) and isinstance(node, list):
+                    dynamic = True
+                elif isinstance(x, (dict, list)):
+                    dynamic = self.__dynamic[id(x)][1]
+                else:
+                    dynamic = isinstance(x, str) and "{{" in x
+                if dynamic:
+                    break
+            self.__dynamic[id(node)] = (node, dynamic)
+        return self.__dynamic[id(value)][1]
+
+
+# Renderer of a worker process, created by the first chunk the worker expands
+WORKER_RENDERER: LoopBodyRenderer | None = None
+
+
+def expand_chunk(loop_config: Any, iterator: str, items: List[Any]) -> List[Any]:
+    """Renders loop_config for every item of a chunk within a worker process, see LoopResolver.get_loop_content"""
+    global WORKER_RENDERER
+    if WORKER_RENDERER is None:
+        WORKER_RENDERER = LoopBodyRenderer(ReferenceResolver(False))
+    loop_values = []
+    for item in items:
+        # The result is pickled for the parent process, so nothing has to be copied here
+        target_value = WORKER_RENDERER.render(loop_config, {iterator: item}, set())
+        if isinstance(target_value, list):
+            loop_values.extend(target_value)
+        else:
+            loop_values.append(target_value)
+    WORKER_RENDERER.clear()
+    return loop_values
 
 
 class LoopResolver(Resolver):
 
-    def __init__(self, fail_on_resolve: bool = True):
+    def __init__(self, fail_on_resolve: bool = True, workers: int = 1,
+                 parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD):
+        """
+        Parameters
+            workers: Number of worker processes expanding large loops, 1 expands all loops in this process
+            parallel_threshold: Minimum number of items of a loop to be expanded by the worker processes
+        """
         super().__init__(fail_on_resolve)
         self.ref_resolver = ReferenceResolver(False)
+        self.body_renderer = LoopBodyRenderer(self.ref_resolver)
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        # Started by the first parallel loop and shut down at the end of resolve
+        self.__executor: ProcessPoolExecutor | None = None
 
-    def _Resolver__resolve(self, cur_value: Any, config: dict):
-        """Resolves all references in a given value using the provided content dict"""
-        new_value = cur_value
-        if isinstance(cur_value, dict):
-            for k, v in cur_value.items():
-                new_value[k] = self._Resolver__resolve(v, config)
-            if LOOP_KEY in cur_value:
-                new_value = self.resolve_loop(cur_value[LOOP_KEY], copy.deepcopy(new_value), config)
-        elif isinstance(cur_value, list):
-            for i, x in enumerate(cur_value):
-                resolved_loop_content = self._Resolver__resolve(x, config)
-                if isinstance(resolved_loop_content, list):
-                    # Keep list flat; don't create list of lists
-                    del new_value[i]
-                    for j, value in enumerate(resolved_loop_content):
-                        # Make sure to insert the element at the position of loop statement
-                        # Also take care of already inserted loop elements
-                        new_value.insert(i + j, value)
-                else:
-                    new_value[i] = resolved_loop_content
-        return new_value
+    def resolve(self, content: Any, config: dict = None) -> dict:
+        try:
+            return super().resolve(content, config)
+        finally:
+            if self.__executor is not None:
+                self.__executor.shutdown()
+                self.__executor = None
+
+    def leave_dict(self, node: dict, config: dict, path: str | None) -> Any:
+        if LOOP_KEY in node:
+            # The loop statements are removed from a shallow copy, the loop body is shared by all iterations
+            return self.resolve_loop(node[LOOP_KEY], dict(node), config)
+        return node
+
+    def leave_list(self, node: list, items: list, flattened: bool, config: dict, path: str | None) -> Any:
+        if flattened:
+            # Loops within the list were spliced into items, keep list flat; don't create list of lists
+            node[:] = items
+        return node
 
     def resolve_loop(self, loop_desc, loop_config, config):
+        """
+        Expands the loop body loop_config for every item of the loop.
+
+        Subtrees of the body, which do not change for an item, are shared between all iterations instead of being
+        copied for every item and loop level. The shared nodes are copied once they are emitted into the result,
+        so the result contains no shared nodes, like the output of a deepcopy for every item.
+        """
         other_content = []
         # Remove loop statement from dict
         del loop_config[LOOP_KEY]
@@ -55,9 +170,14 @@ class LoopResolver(Resolver):
                 other_content = [loop_config]
         else:
             loop_values = [loop_config]
+        # Nodes of the body are copied wherever they are emitted, so the result does not alias the content
+        body = loop_values
+        body_nodes = self.__container_ids(body)
+        # Values of the last loop are copied once by __unshare, values of the outer loops are copied per insertion
+        inserted: Set[int] = set()
         # Iterate over possible multiloops
         loops = loop_desc.split(",")
-        for loop in loops:
+        for i, loop in enumerate(loops):
             # Retrieve value and iterator
             match = re.search(LOOP_REGEX, loop)
             if not match or len(match.groups()) < 2:
@@ -68,19 +188,83 @@ class LoopResolver(Resolver):
                 raise ExtYamlSyntaxError(f"No valid loop statement: {loop}")
 
             # Replace the content with filled content
-            loop_values = self.get_loop_content(loop_values, iteration_value, iterator)
+            loop_values = self.get_loop_content(loop_values, iteration_value, iterator,
+                                                inserted if i == len(loops) - 1 else None)
+        loop_values = self.__unshare(loop_values, body_nodes, inserted)
+        self.body_renderer.clear()
         if other_content:
             loop_values = other_content + loop_values
         return loop_values
 
-    def get_loop_content(self, loop_configs: list[dict], iteration_value: list, iterator: str):
+    def get_loop_content(self, loop_configs: list, iteration_value: list, iterator: str,
+                         inserted: Set[int] | None = None):
+        """
+        Renders every loop config for every item, the rendered values share all unchanged nodes with loop_configs.
+        Loops with at least parallel_threshold items are expanded by the worker processes, if there are any.
+
+        Parameters
+            inserted: Ids of referenced dicts and lists are added to inserted, which are inserted without copies and
+                have to be copied afterwards. If not given, referenced dicts and lists are copied for every insertion.
+        """
+        if self.workers > 1 and len(iteration_value) >= self.parallel_threshold:
+            return self.__expand_parallel(loop_configs, iteration_value, iterator)
         loop_values = []
         for loop_config in loop_configs:
             for item in iteration_value:
-                target_value = copy.deepcopy(loop_config)
-                target_value = self.ref_resolver.resolve(target_value, {iterator: item})
+                target_value = self.body_renderer.render(loop_config, {iterator: item}, inserted)
                 if isinstance(target_value, list):
                     loop_values.extend(target_value)
                 else:
                     loop_values.append(target_value)
         return loop_values
+
+    def __expand_parallel(self, loop_configs: list, iteration_value: list, iterator: str) -> list:
+        """
+        Splits the items into one chunk per worker and expands the chunks in the worker processes.
+
+        Every loop config is sent once per chunk instead of once per item. The chunks are concatenated in the
+        order of the items, so the result equals the one of the sequential expansion.
+        """
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+        chunk_size = -(-len(iteration_value) // self.workers)
+        futures = [self.__executor.submit(expand_chunk, loop_config, iterator, iteration_value[i:i + chunk_size])
+                   for loop_config in loop_configs
+                   for i in range(0, len(iteration_value), chunk_size)]
+        loop_values = []
+        for future in futures:
+            loop_values.extend(future.result())
+        return loop_values
+
+    @staticmethod
+    def __unshare(value: Any, shared: Set[int], inserted: Set[int]) -> Any:
+        """
+        Replaces every node in shared or inserted and every node reached more than once by a copy.
+
+        Inserted nodes are still part of the config, like the results of the worker processes they must not be
+        written as aliases. Visited nodes are added to shared.
+        """
+        root = [value]
+        stack = [(root, 0)]
+        while stack:
+            parent, key = stack.pop()
+            node = parent[key]
+            if not isinstance(node, (dict, list)):
+                continue
+            if id(node) in shared or id(node) in inserted:
+                parent[key] = yaml_loader.copy_content(node)
+                continue
+            shared.add(id(node))
+            stack.extend((node, k) for k in (list(node) if isinstance(node, dict) else range(len(node))))
+        return root[0]
+
+    @staticmethod
+    def __container_ids(value: Any) -> Set[int]:
+        ids = set()
+        stack = [value]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (dict, list)) and id(node) not in ids:
+                ids.add(id(node))
+                stack.extend(node.values() if isinstance(node, dict) else node)
+        return ids
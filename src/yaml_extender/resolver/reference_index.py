@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+NOT_FOUND = object()
+
+
+class ReferenceIndex:
+    """
+    Lazy index of dotted reference paths into a config.
+
+    Maps paths like "a.b.c" to the dict or list found at that path, so the value of "a.b.c.d" is a single lookup
+    in the container of "a.b.c". Only containers are indexed, leaf values are always read from the config.
+    Paths are indexed when they are requested. Paths that can not be resolved by plain dict keys and list indices,
+    e.g. lists of dicts or nested references, are not indexed and have to be resolved by the caller.
+    """
+
+    def __init__(self, config: Any):
+        self.config = config
+        self.__containers: Dict[str, Any] = {}
+        # Incremented whenever paths of indexed containers may have changed
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__containers)
+
+    def invalidate(self):
+        self.__containers.clear()
+        self.generation += 1
+
+    def lookup(self, path: str) -> Any:
+        """Returns the value at path or NOT_FOUND if path can not be resolved through the index"""
+        if not path:
+            return self.config
+        parent_path, _, key = path.rpartition(".")
+        parent = self.container(parent_path)
+        if parent is None:
+            return NOT_FOUND
+        return self.__child(parent, key)
+
+    def container(self, path: str) -> Optional[Any]:
+        """Returns the dict or list at path or None"""
+        if not path:
+            return self.config if isinstance(self.config, (dict, list)) else None
+        container = self.__containers.get(path)
+        if container is not None:
+            self.hits += 1
+            return container
+        # Walk up to the closest indexed parent and index the missing paths from there, without recursion
+        missing = [path]
+        parent_path = path.rpartition(".")[0]
+        while parent_path and parent_path not in self.__containers:
+            missing.append(parent_path)
+            parent_path = parent_path.rpartition(".")[0]
+        self.misses += len(missing)
+        if parent_path:
+            self.hits += 1
+            container = self.__containers[parent_path]
+        elif isinstance(self.config, (dict, list)):
+            container = self.config
+        else:
+            return None
+        for missing_path in reversed(missing):
+            value = self.__child(container, missing_path.rpartition(".")[2])
+            if not isinstance(value, (dict, list)):
+                return None
+            self.__containers[missing_path] = value
+            container = value
+        return container
+
+    @staticmethod
+    def __child(container: Any, key: str) -> Any:
+        if isinstance(container, dict):
+            return container.get(key, NOT_FOUND)
+        if key.isdigit() and int(key) < len(container):
+            return container[int(key)]
+        return NOT_FOUND
+
+
+class ReferenceMemo:
+    """
+    Resolved values of reference statements within one resolve pass over the config of index.
+
+    Values are keyed by ReferenceSlot.key, which contains the reference, the default value and the operation.
+    The memo is cleared whenever the index is invalidated.
+    """
+
+    def __init__(self, index: ReferenceIndex):
+        self.index = index
+        self.__values: Dict[Tuple, Any] = {}
+        self.__generation = index.generation
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__values)
+
+    def get(self, key: Tuple) -> Any:
+        """Returns the memoized value of key or NOT_FOUND"""
+        if self.__generation != self.index.generation:
+            self.__values.clear()
+            self.__generation = self.index.generation
+        value = self.__values.get(key, NOT_FOUND)
+        if value is NOT_FOUND:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def store(self, key: Tuple, value: Any):
+        self.__values[key] = value
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.__values),
+                "generation": self.__generation}
@@ -1,73 +1,200 @@
 from __future__ import annotations
 
 import re
-from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, List, Set, Tuple
 
 from yaml_extender import yaml_loader
+from yaml_extender.resolver.reference_index import NOT_FOUND, ReferenceIndex, ReferenceMemo
+from yaml_extender.resolver.reference_template import ReferenceSlot, compile_template
 from yaml_extender.resolver.resolver import Resolver
-from yaml_extender.xyml_exception import RecursiveReferenceError, ReferenceNotFoundError, ExtYamlSyntaxError
+from yaml_extender.xyml_exception import RecursiveReferenceError, ReferenceCycleError, ReferenceNotFoundError
 
 REFERENCE_REGEX = r'\{\{(.+?)(?::(.*))?\}\}'
 ARRAY_REGEX = r'(.*)?\[(\d*)\]'
-LIST_FLATTEN_CHARACTER = " "
 
 MAXIMUM_REFERENCE_DEPTH = 30
 
 
-class ArithmeticOperation:
-
-    SUPPORTED_FUNCS = {"+": lambda x, y: x + y,
-                       "-": lambda x, y: x - y,
-                       "*": lambda x, y: x * y,
-                       "/": lambda x, y: x / y}
-    ARITHMETIC_REGEX = r'(.+)([' + ''.join(["\\" + k for k in SUPPORTED_FUNCS.keys()]) + r'])\s*(\d+)'
+class ReferenceResolver(Resolver):
 
-    def __init__(self, reference: str, operation: str, value: str):
-        self.reference = reference.strip()
-        self.operation = operation.strip()
-        self.value = yaml_loader.parse_numeric_value(value.strip())
+    def __init__(self, fail_on_resolve: bool = True, use_index: bool = False, dependency_order: bool = False):
+        """
+        Parameters
+            use_index: Look up references through a ReferenceIndex of the config, built lazily for every resolve call.
+                Resolved reference statements are memoized in a ReferenceMemo for the same call.
+            dependency_order: Resolve referenced values of the config before the values referencing them.
+                Every value is resolved only once and reference cycles raise a ReferenceCycleError.
+                Implies use_index.
+        """
+        self.use_index = use_index or dependency_order
+        self.dependency_order = dependency_order
+        self.lookup_index: ReferenceIndex | None = None
+        self.memo: ReferenceMemo | None = None
+        # Resolved values by their path in the config and paths currently being resolved
+        self.__resolved: Dict[str, Any] = {}
+        self.__resolving: List[str] = []
+        self.__kept_lists: Set[int] = set()
+        # Dicts and lists substituted for references by their id, copied after the pass if they are reached twice
+        self.__substituted: Dict[int, Any] = {}
+        super().__init__(fail_on_resolve)
 
-    def __repr__(self):
-        return f"{self.reference} {self.operation} {self.value}"
+    def resolve(self, content: Any, config: dict = None) -> dict:
+        if not config:
+            config = content
+        self.prepare(config)
+        if self.dependency_order and self.__shares_paths(content, config):
+            resolved = self.traverse(content, config, "")
+        else:
+            resolved = super().resolve(content, config)
+        return self.__unshare(resolved)
 
-    def apply(self, value):
-        num_val = yaml_loader.parse_numeric_value(value)
-        return ArithmeticOperation.SUPPORTED_FUNCS[self.operation](self.value, num_val)
+    def prepare(self, config: Any):
+        """Starts a new resolve pass over config, resets the index and all memoized values"""
+        self.lookup_index = ReferenceIndex(config) if self.use_index else None
+        self.memo = ReferenceMemo(self.lookup_index) if self.use_index else None
+        self.__resolved = {}
+        self.__resolving = []
+        self.__kept_lists = set()
+        self.__substituted = {}
 
-    @staticmethod
-    def parse(expression: str) -> Optional[ArithmeticOperation]:
-        match = re.search(ArithmeticOperation.ARITHMETIC_REGEX, expression)
-        if match:
-            return ArithmeticOperation(match[1], match[2], match[3])
+    def visit_value(self, value: Any, config: dict, path: str | None) -> Any:
+        """Resolves value through resolve_node if its path in config is known"""
+        if path is not None:
+            resolved = self.resolve_node(path, value, config)
         else:
-            return None
+            resolved = self.resolve_reference(value, config)
+        if isinstance(resolved, (dict, list)):
+            self.__substituted[id(resolved)] = resolved
+        return resolved
 
+    def leave_list(self, node: list, items: list, flattened: bool, config: dict, path: str | None) -> Any:
+        if len(items) == len(node) and all(x is y for x, y in zip(items, node)) \
+                and id(node) not in self.__kept_lists:
+            # Keep the list, which is still referenced by the index. Lists reached more than once,
+            # e.g. through yaml aliases, are copied, so they are not written as aliases
+            self.__kept_lists.add(id(node))
+            return node
+        if flattened:
+            # Flattened lists shift the paths of all following elements. Otherwise the replaced list
+            # only differs by resolved values, which resolve to the same values again
+            if self.lookup_index is not None:
+                self.lookup_index.invalidate()
+            self.__resolved.clear()
+        return items
 
-class ReferenceResolver(Resolver):
+    def resolve_node(self, path: str, value: Any, config: dict) -> Any:
+        """Resolves the value found at path in config, which is resolved only once per resolve call"""
+        if not isinstance(value, str) or "{" not in value:
+            return value
+        if path in self.__resolved:
+            return self.__resolved[path]
+        if path in self.__resolving:
+            raise ReferenceCycleError(self.__resolving[self.__resolving.index(path):] + [path])
+        self.__resolve_dependencies(path, value, config)
+        return self.__resolve_node(path, value, config)
 
-    def __init__(self, fail_on_resolve: bool = True):
-        super().__init__(fail_on_resolve)
+    def __resolve_node(self, path: str, value: str, config: dict) -> Any:
+        self.__resolving.append(path)
+        try:
+            resolved = self.resolve_reference(value, config)
+        finally:
+            self.__resolving.pop()
+        self.__resolved[path] = resolved
+        return resolved
 
-    def _Resolver__resolve(self, cur_value: Any, config: dict):
-        """Resolves all references in a given value using the provided content dict"""
-        new_value = cur_value
-        if isinstance(cur_value, dict):
-            for k in cur_value.keys():
-                cur_value[k] = self._Resolver__resolve(cur_value[k], config)
-        elif isinstance(cur_value, list):
-            new_list = []
-            for i, x in enumerate(cur_value):
-                resolved_value = self._Resolver__resolve(x, config)
-                if isinstance(resolved_value, list):
-                    # If the returned value is also a list, extend the current list with it
-                    new_list.extend(resolved_value)
-                else:
-                    new_list.append(self._Resolver__resolve(x, config))
-            new_value = new_list
-        else:
-            new_value = self.resolve_reference(cur_value, config)
-        return new_value
+    def __resolve_dependencies(self, path: str, value: str, config: dict):
+        """
+        Resolves the strings referenced by value and their references before value, depth first using an explicit
+        stack, so reference chains are not limited by recursion. Nested references are resolved on demand.
+        """
+        if self.lookup_index is None or config is not self.lookup_index.config:
+            return
+        # Paths and values to resolve, paths are resolved once all of their references are resolved
+        stack: List[Tuple[str, str, bool]] = [(path, value, False)]
+        # Paths of the stack whose references are being resolved, in order and as set
+        chain: List[str] = []
+        in_chain: Set[str] = set()
+        while stack:
+            node_path, node_value, expanded = stack.pop()
+            if expanded:
+                in_chain.discard(chain.pop())
+                if node_path != path:
+                    self.__resolve_node(node_path, node_value, config)
+                continue
+            if node_path in self.__resolved:
+                continue
+            if node_path in in_chain or node_path in self.__resolving:
+                cycle = self.__resolving + chain
+                raise ReferenceCycleError(cycle[cycle.index(node_path):] + [node_path])
+            chain.append(node_path)
+            in_chain.add(node_path)
+            stack.append((node_path, node_value, True))
+            for slot in compile_template(node_value).slots:
+                references = [slot.reference] if slot.expression is None else slot.expression.references
+                for reference in references:
+                    if "{" in reference or reference in self.__resolved:
+                        continue
+                    ref_val = self.lookup_index.lookup(reference)
+                    if isinstance(ref_val, str) and "{" in ref_val:
+                        stack.append((reference, ref_val, False))
+
+    def resolve_container(self, path: str, container: Any, config: dict) -> Any:
+        """
+        Resolves the references within the dict or list found at path in config, before it is substituted for a
+        reference. Dicts are resolved in place, which is done only once per resolve call.
+        """
+        if path in self.__resolved:
+            return self.__resolved[path]
+        if path in self.__resolving:
+            raise ReferenceCycleError(self.__resolving[self.__resolving.index(path):] + [path])
+        self.__resolving.append(path)
+        try:
+            resolved = self.traverse(container, config, path)
+        finally:
+            self.__resolving.pop()
+        self.__resolved[path] = resolved
+        return resolved
+
+    def __unshare(self, content: Any) -> Any:
+        """
+        Replaces substituted dicts and lists and their children by a copy, if they are reached more than once.
+
+        Kept lists and memoized values are still part of the config and must not be written as yaml aliases.
+        """
+        if not self.__substituted:
+            return content
+        substituted = set()
+        stack = list(self.__substituted.values())
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (dict, list)) and id(node) not in substituted:
+                substituted.add(id(node))
+                stack.extend(node.values() if isinstance(node, dict) else node)
+        visited = set()
+        root = [content]
+        stack = [(root, 0)]
+        while stack:
+            parent, key = stack.pop()
+            node = parent[key]
+            if not isinstance(node, (dict, list)):
+                continue
+            if id(node) in visited:
+                if id(node) in substituted:
+                    parent[key] = yaml_loader.copy_content(node)
+                continue
+            visited.add(id(node))
+            stack.extend((node, k) for k in (list(node) if isinstance(node, dict) else range(len(node))))
+        self.__substituted = {}
+        return root[0]
+
+    @staticmethod
+    def __shares_paths(content: Any, config: Any) -> bool:
+        """Checks if the values of content are found at the same paths in config"""
+        if content is config:
+            return True
+        if not isinstance(content, dict) or not isinstance(config, dict):
+            return False
+        return all(k in config and config[k] is v for k, v in content.items())
 
     @staticmethod
     def parse_references(value: str):
@@ -99,43 +226,10 @@ class ReferenceResolver(Resolver):
     def resolve_reference(self, value: Any, config: dict, depth: int = 0) -> Any:
         if not isinstance(value, str) or "{" not in value:
             return value
-        if depth > 30:
+        if depth > MAXIMUM_REFERENCE_DEPTH:
             raise RecursiveReferenceError(value)
-        new_value = value
-        # In order to store the full match the whole regex is packed into a group
-        for ref_match in ReferenceResolver.parse_references(value):
-            ref = ref_match[1]
-            default_value = ref_match[2]
-            if default_value is not None:
-                default_value = yaml_loader.parse_any_value(default_value.strip())
-            # Resolve arithmetic operation
-            operation = ArithmeticOperation.parse(ref)
-            if operation:
-                ref = operation.reference
-            # Resolve reference, including subrefs
-            try:
-                ref_val = self.resolve_subrefs(ref, config)
-            except ReferenceNotFoundError as ref_err:
-                if default_value is not None:
-                    ref_val = default_value
-                elif self.fail_on_resolve:
-                    raise ref_err
-                else:
-                    ref_val = None
-
-            if ref_val is not None:
-                if operation:
-                    ref_val = operation.apply(ref_val)
-                # Check if the reference to be resolved is part of a string.
-                if ref_match[0] == value:
-                    # Preserve float & int and list types if reference is part of a string
-                    new_value = ref_val
-                else:
-                    # If resolved value is of type list, flatten it
-                    if isinstance(ref_val, list):
-                        ref_val = LIST_FLATTEN_CHARACTER.join(ref_val)
-                    # Replace the reference string within the value
-                    new_value = new_value.replace(ref_match[0], str(ref_val))
+        template = compile_template(value)
+        new_value = template.render([self.resolve_slot(slot, config) for slot in template.slots])
 
         if new_value == value:
             if self.fail_on_resolve:
@@ -147,47 +241,103 @@ class ReferenceResolver(Resolver):
         new_value = self.resolve_reference(new_value, config, depth + 1)
         return new_value
 
-    def resolve_subrefs(self, fullref: str, current_config: dict):
-        if not fullref:
-            return current_config
-        if "." in fullref:
-            ref, sub_ref = fullref.split(".", maxsplit=1)
-        else:
-            ref = fullref
-            sub_ref = None
-        # If subref is specifying more than config can resolve, e.g. for include parameter dicts
-        # And the resolved value is another reference, append the subref and resolve later
-        if isinstance(current_config, str):
-            match = re.match(REFERENCE_REGEX, current_config)
-            if match:
-                # If the current config represents another reference and there are more subrefs specified
-                # then extend the reference by the remaining subref
-                current_config = match.group(1).strip()
-                if match.group(2):
-                    current_config += f":{match.group(2)}"
-                return "{{" + current_config + f".{fullref}" + "}}"
+    def resolve_slot(self, slot: ReferenceSlot, config: dict) -> Any:
+        """Returns the value of a single reference statement or None if it can not be resolved"""
+        if self.memo is None or config is not self.memo.index.config:
+            return self.__resolve_slot(slot, config)
+        ref_val = self.memo.get(slot.key)
+        if ref_val is NOT_FOUND:
+            ref_val = self.__resolve_slot(slot, config)
+            # Lists collected from lists of dicts are created for every statement and must not be shared
+            if not isinstance(ref_val, (dict, list)) or self.lookup_index.lookup(slot.reference) is not NOT_FOUND:
+                self.memo.store(slot.key, ref_val)
+        return ref_val
+
+    def __resolve_slot(self, slot: ReferenceSlot, config: dict) -> Any:
+        if slot.expression is None:
+            return self.resolve_operand(slot.reference, slot.default, config)
+        try:
+            value = slot.expression.evaluate(lambda reference: self.resolve_operand(reference, slot.default, config))
+        except ReferenceNotFoundError:
+            value = None
+        if value is None:
+            # Keys may contain operator characters, e.g. "path/x", look up the whole statement as reference
+            return self.resolve_operand(slot.reference, slot.default, config)
+        return value
+
+    def resolve_operand(self, reference: str, default: Any, config: dict) -> Any:
+        """Returns the value of reference, default if it is not found or None if there is no default"""
+        if self.dependency_order and self.lookup_index is not None and config is self.lookup_index.config:
+            ref_val = self.lookup_index.lookup(reference)
+            if ref_val is not NOT_FOUND:
+                # Resolve the referenced value first instead of rescanning its references after substitution
+                if isinstance(ref_val, (dict, list)):
+                    return self.resolve_container(reference, ref_val, config)
+                return self.resolve_node(reference, ref_val, config)
+        # Resolve reference, including subrefs
+        try:
+            return self.resolve_subrefs(reference, config)
+        except ReferenceNotFoundError as ref_err:
+            if default is not None:
+                return default
+            elif self.fail_on_resolve:
+                raise ref_err
             else:
-                # Fail, because the reference specifies more than can be resolved
-                raise ReferenceNotFoundError(fullref)
-        elif isinstance(current_config, list):
-            if ref.isdigit():
-                if len(current_config) > int(ref):
-                    current_config = current_config[int(ref)]
-                else:
-                    raise ReferenceNotFoundError(fullref, ref)
+                return None
+
+    def resolve_subrefs(self, fullref: str, current_config: dict, config: dict | None = None):
+        """Returns the value of fullref within current_config, config is the whole config or current_config"""
+        config = current_config if config is None else config
+        if self.lookup_index is not None and current_config is self.lookup_index.config:
+            value = self.lookup_index.lookup(fullref)
+            if value is not NOT_FOUND:
+                return value
+        # Walks down one path segment per iteration
+        while fullref:
+            if "." in fullref:
+                ref, sub_ref = fullref.split(".", maxsplit=1)
             else:
-                # Resolve list of dicts
-                value_list = []
-                for elem in current_config:
-                    try:
-                        value_list.append(self.resolve_subrefs(fullref, elem))
-                    except ReferenceNotFoundError:
-                        pass
-                return value_list
-        else:
-            if ref in current_config:
-                current_config = current_config[ref]
+                ref = fullref
+                sub_ref = None
+            # If subref is specifying more than config can resolve, e.g. for include parameter dicts
+            # And the resolved value is another reference, append the subref and resolve later
+            if isinstance(current_config, str):
+                current_config = self.resolve_path_string(current_config, config)
+                match = re.match(REFERENCE_REGEX, current_config)
+                if match:
+                    # If the current config represents another reference and there are more subrefs specified
+                    # then extend the reference by the remaining subref
+                    current_config = match.group(1).strip()
+                    if match.group(2):
+                        current_config += f":{match.group(2)}"
+                    return "{{" + current_config + f".{fullref}" + "}}"
+                else:
+                    # Fail, because the reference specifies more than can be resolved
+                    raise ReferenceNotFoundError(fullref)
+            elif isinstance(current_config, list):
+                if ref.isdigit():
+                    if len(current_config) > int(ref):
+                        current_config = current_config[int(ref)]
+                    else:
+                        raise ReferenceNotFoundError(fullref, ref)
+                else:
+                    # Resolve list of dicts
+                    value_list = []
+                    for elem in current_config:
+                        try:
+                            value_list.append(self.resolve_subrefs(fullref, elem, config))
+                        except ReferenceNotFoundError:
+                            pass
+                    return value_list
             else:
-                # Fail, because the reference cannot be found in config
-                raise ReferenceNotFoundError(fullref)
-        return self.resolve_subrefs(sub_ref, current_config)
+                if ref in current_config:
+                    current_config = current_config[ref]
+                else:
+                    # Fail, because the reference cannot be found in config
+                    raise ReferenceNotFoundError(fullref)
+            fullref = sub_ref
+        return current_config
+
+    def resolve_path_string(self, value: str, config: dict) -> str:
+        """Returns a string, which a reference continues into, before it is extended by the remaining subrefs"""
+        return value
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from yaml_extender import yaml_loader
+from yaml_extender.resolver.expression import compile_expression
+
+LIST_FLATTEN_CHARACTER = " "
+TEMPLATE_CACHE_SIZE = 4096
+
+
+class ReferenceSlot:
+    """
+    Reference statement {{reference:default}} of a template with its default value decoded.
+
+    If reference is an arithmetic expression, it is compiled into expression. The default value is used for every
+    reference of the expression, which is not found.
+    """
+
+    __slots__ = ("text", "reference", "default", "expression", "key")
+
+    def __init__(self, text: str, reference: str, default: Optional[str]):
+        self.text = text
+        self.reference = reference
+        self.expression = compile_expression(reference)
+        self.default = None if default is None else yaml_loader.parse_any_value(default.strip())
+        # Equal for all statements resolving to the same value, repr keeps e.g. 1 and true apart
+        self.key = (self.reference, repr(self.default))
+
+    def __repr__(self):
+        return f"ReferenceSlot({self.text})"
+
+
+class ReferenceTemplate:
+    """
+    Scalar split into literal segments and reference slots.
+
+    literals always contains one segment more than slots, the value is literals[0] + slots[0] + literals[1] + ...
+    Templates are shared by all users of the same string and must not be modified.
+    """
+
+    __slots__ = ("value", "literals", "slots", "whole")
+
+    def __init__(self, value: str, literals: List[str], slots: List[ReferenceSlot]):
+        self.value = value
+        self.literals = literals
+        self.slots = slots
+        # Values consisting of a single reference keep the type of the referenced value
+        self.whole = len(slots) == 1 and slots[0].text == value
+
+    def __repr__(self):
+        return f"ReferenceTemplate({self.value})"
+
+    def render(self, values: List[Any]) -> Any:
+        """
+        Fills the slots with values, slots with a value of None keep their reference statement.
+
+        Lists are flattened using LIST_FLATTEN_CHARACTER, unless they replace the whole value.
+        """
+        if self.whole:
+            return self.value if values[0] is None else values[0]
+        parts = [self.literals[0]]
+        for slot, value, literal in zip(self.slots, values, self.literals[1:]):
+            if value is None:
+                parts.append(slot.text)
+            elif isinstance(value, list):
+                parts.append(LIST_FLATTEN_CHARACTER.join(value))
+            else:
+                parts.append(str(value))
+            parts.append(literal)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(value: str) -> ReferenceTemplate:
+    """Returns the template of value, templates of recently used values are cached"""
+    literals = []
+    slots = []
+    position = 0
+    start_idx = value.find("{{")
+    while start_idx != -1:
+        # Same scan as ReferenceResolver.parse_references, nested statements are part of the outer statement
+        end_idx = value.find("}}", start_idx + 2)
+        start_idx_2 = value.find("{{", start_idx + 2)
+        while start_idx_2 != -1 and start_idx_2 < end_idx:
+            end_idx = value.find("}}", end_idx + 2)
+            start_idx_2 = value.find("{{", start_idx_2 + 2)
+        if end_idx == -1:
+            # Unterminated statements stay literal text
+            break
+        ref = value[start_idx + 2:end_idx]
+        if ":" in ref:
+            reference, default = [x.strip() for x in ref.split(":", maxsplit=1)]
+        else:
+            reference, default = ref.strip(), None
+        literals.append(value[position:start_idx])
+        slots.append(ReferenceSlot(value[start_idx:end_idx + 2], reference, default))
+        position = end_idx + 2
+        start_idx = value.find("{{", position)
+    literals.append(value[position:])
+    return ReferenceTemplate(value, literals, slots)
@@ -1,11 +1,24 @@
 from __future__ import annotations
 
 import abc
-from pathlib import Path
 from typing import Any
 
+# Returned by visit_node and visit_key to traverse the value as usual
+DESCEND = object()
+# Returned by visit_key to leave the value of a key untouched
+SKIP = object()
+
+
+def child_path(path: str | None, key: Any) -> str | None:
+    """Returns the path of key within the value at path, None if path is unknown"""
+    if path is None:
+        return None
+    return f"{path}.{key}" if path else str(key)
+
 
 class Resolver(abc.ABC):
+    # Keys of dicts passed to visit_key before their values are resolved
+    hook_keys: frozenset = frozenset()
 
     def __init__(self, fail_on_resolve: bool = True):
         """
@@ -20,6 +33,154 @@ class Resolver(abc.ABC):
             config = content
         return self.__resolve(content, config)
 
-    @abc.abstractmethod
     def __resolve(self, cur_value: Any, config: dict) -> dict:
-        raise NotImplementedError
+        return self.traverse(cur_value, config)
+
+    def traverse(self, content: Any, config: Any, path: str | None = None, copy_on_write: bool = False) -> Any:
+        """
+        Resolves content bottom up using an explicit stack, so the nesting depth is not limited by recursion.
+
+        Scalars are resolved by visit_value. Dicts and lists are passed to visit_node before and to leave_dict or
+        leave_list after their children were resolved. Resolved values of a dict are assigned to the dict in
+        place, resolved elements of a list are collected into a new list, lists returned for an element are
+        spliced into it. visit_key is called for the keys in hook_keys only.
+
+        Parameters
+            path: Path of content in config, the hooks get the path of every value. None if it is unknown
+            copy_on_write: Assign resolved values to a shallow copy of the dict, created on the first change
+        """
+        # Hooks which are not overridden are skipped
+        visit_value = self.visit_value if type(self).visit_value is not Resolver.visit_value else None
+        visit_node = self.visit_node if type(self).visit_node is not Resolver.visit_node else None
+        leave_dict = self.leave_dict if type(self).leave_dict is not Resolver.leave_dict else None
+        leave_list = self.leave_list
+        hook_keys = self.hook_keys
+        if not isinstance(content, (dict, list)):
+            return content if visit_value is None else visit_value(content, config, path)
+        if visit_node is not None:
+            result = visit_node(content, config, path)
+            if result is not DESCEND:
+                return result
+        # State of the dict or list being resolved, the states of its parents are kept on the stack
+        node = content
+        node_path = path
+        node_key = None
+        if isinstance(node, dict):
+            # Keys may be added and removed by visit_key, iterate over a copy
+            entries = iter(list(node.items())) if hook_keys and not hook_keys.isdisjoint(node) else iter(node.items())
+            node_result = node
+            items = None
+        else:
+            entries = enumerate(node)
+            node_result = None
+            items = []
+        flattened = False
+        # Paths of children are only known if the path of content is known
+        path = None
+        stack = []
+        while True:
+            finished = False
+            # Resolve the children until a dict or list is reached, which is resolved before the remaining ones
+            for key, value in entries:
+                if hook_keys and items is None and key in hook_keys:
+                    if key not in node:
+                        continue
+                    action = self.visit_key(node, key, config, node_path)
+                    if action is SKIP:
+                        continue
+                    if action is not DESCEND:
+                        # The value replaces the whole dict
+                        result = action
+                        finished = True
+                        break
+                    value = node[key]
+                if node_path is not None:
+                    path = f"{node_path}.{key}" if node_path else str(key)
+                if isinstance(value, (dict, list)):
+                    resolved = DESCEND if visit_node is None else visit_node(value, config, path)
+                    if resolved is DESCEND:
+                        stack.append((node, node_path, node_key, entries, node_result, items, flattened))
+                        node = value
+                        node_path = path
+                        node_key = key
+                        if isinstance(node, dict):
+                            entries = iter(list(node.items())) if hook_keys and not hook_keys.isdisjoint(node) \
+                                else iter(node.items())
+                            node_result = node
+                            items = None
+                        else:
+                            entries = enumerate(node)
+                            node_result = None
+                            items = []
+                        flattened = False
+                        break
+                elif visit_value is None:
+                    resolved = value
+                else:
+                    resolved = visit_value(value, config, path)
+                if items is not None:
+                    if isinstance(resolved, list):
+                        items.extend(resolved)
+                        flattened = True
+                    else:
+                        items.append(resolved)
+                elif resolved is not value:
+                    if copy_on_write and node_result is node:
+                        node_result = dict(node)
+                    node_result[key] = resolved
+            else:
+                # All children are resolved
+                if items is not None:
+                    result = leave_list(node, items, flattened, config, node_path)
+                elif leave_dict is not None:
+                    result = leave_dict(node_result, config, node_path)
+                else:
+                    result = node_result
+                finished = True
+            if not finished:
+                continue
+            if not stack:
+                return result
+            # Continue with the parent, storing the result like the result of any other child
+            key = node_key
+            node, node_path, node_key, entries, node_result, items, flattened = stack.pop()
+            if items is not None:
+                if isinstance(result, list):
+                    items.extend(result)
+                    flattened = True
+                else:
+                    items.append(result)
+            elif result is not node[key]:
+                if copy_on_write and node_result is node:
+                    node_result = dict(node)
+                node_result[key] = result
+
+    def visit_value(self, value: Any, config: Any, path: str | None) -> Any:
+        """Returns the resolved value of a scalar"""
+        return value
+
+    def visit_node(self, node: Any, config: Any, path: str | None) -> Any:
+        """Called before the children of a dict or list are resolved, returns DESCEND or the resolved node"""
+        return DESCEND
+
+    def visit_key(self, node: dict, key: Any, config: Any, path: str | None) -> Any:
+        """
+        Called for every key in hook_keys of a dict before its value is resolved.
+
+        Returns DESCEND to resolve the value, SKIP to keep it or a value replacing the whole dict.
+        """
+        return DESCEND
+
+    def leave_dict(self, node: dict, config: Any, path: str | None) -> Any:
+        """Returns the resolved dict, after all its values were resolved"""
+        return node
+
+    def leave_list(self, node: list, items: list, flattened: bool, config: Any, path: str | None) -> Any:
+        """
+        Returns the resolved list, after all its elements were resolved
+
+        Parameters
+            items: Resolved elements of node
+            flattened: Flag if elements resolved to lists, which were spliced into items
+        """
+        return items
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import yaml_extender
+import yaml_extender.logger as logger
+from yaml_extender.resolver.include_graph import IncludeGraph
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_MAX_CACHE_SIZE = 256 * 1024 * 1024
+MANIFEST_SUFFIX = ".json"
+CONTENT_SUFFIX = ".pickle"
+
+
+class EnvironmentRecorder(Mapping):
+    """Read only view of the environment, which records every variable that is looked up"""
+
+    def __init__(self, environ: Mapping):
+        self.__environ = environ
+        self.accessed: Dict[str, Optional[str]] = {}
+        # Set if the whole environment has been accessed, e.g. by referencing xyml.env itself
+        self.complete = False
+
+    def __getitem__(self, key):
+        self.accessed[key] = self.__environ.get(key)
+        return self.__environ[key]
+
+    def __contains__(self, key):
+        self.accessed[key] = self.__environ.get(key)
+        return key in self.__environ
+
+    def __iter__(self):
+        self.complete = True
+        return iter(self.__environ)
+
+    def __len__(self):
+        self.complete = True
+        return len(self.__environ)
+
+
+class ResultCache:
+    """
+    Persistent cache of fully resolved files.
+
+    An entry is looked up by the root file, the parameters and the include directories.
+    It is only used if the content hashes of the root file and all included files, the absence of
+    include candidates that did not exist and the referenced environment variables are unchanged.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int = DEFAULT_MAX_CACHE_SIZE, environ: Mapping | None = None):
+        """
+        Parameters
+            environ: Environment the entries are validated against, os.environ if not given
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.environ = os.environ if environ is None else environ
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filepath: Path, params: Dict | None, include_dirs: List[Path], cwd: Path | None = None) -> str:
+        description = json.dumps({
+            "version": yaml_extender.__version__,
+            "format": CACHE_FORMAT_VERSION,
+            "file": str(Path(filepath).absolute()),
+            "cwd": str(Path.cwd() if cwd is None else cwd),
+            "params": params or {},
+            "include_dirs": [str(Path(inc).absolute()) for inc in include_dirs],
+        }, sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, IncludeGraph]]:
+        """Returns the cached content and its include graph for key or None if there is no valid entry"""
+        manifest_path = self.cache_dir / (key + MANIFEST_SUFFIX)
+        content_path = self.cache_dir / (key + CONTENT_SUFFIX)
+        try:
+            manifest = json.loads(manifest_path.read_text())
+            if manifest["version"] != CACHE_FORMAT_VERSION or not self.__is_valid(manifest):
+                self.misses += 1
+                return None
+            with open(content_path, "rb") as file:
+                content = pickle.load(file)
+            dependencies = IncludeGraph.from_dict(manifest["dependencies"])
+        except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # Keep recently used entries from being evicted
+        os.utime(manifest_path)
+        self.hits += 1
+        logger.info(f"Using cached result {content_path}")
+        return content, dependencies
+
+    def store(self, key: str, content: Any, dependencies: IncludeGraph, missing: Iterable[Path] = (),
+              environment: EnvironmentRecorder | None = None):
+        manifest = {
+            "version": CACHE_FORMAT_VERSION,
+            "files": {str(path): file_hash(path) for path in dependencies.files},
+            "dependencies": dependencies.to_dict(),
+            "missing": sorted(str(path) for path in missing),
+            "env": environment.accessed if environment else {},
+            "environment": environment_hash(self.environ) if environment and environment.complete else None,
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write the content first, so a manifest always points to complete content
+        self.__write_atomic(self.cache_dir / (key + CONTENT_SUFFIX),
+                            pickle.dumps(content, protocol=pickle.HIGHEST_PROTOCOL))
+        self.__write_atomic(self.cache_dir / (key + MANIFEST_SUFFIX), json.dumps(manifest).encode())
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is smaller than max_size"""
+        entries = []
+        total_size = 0
+        for manifest_path in self.cache_dir.glob("*" + MANIFEST_SUFFIX):
+            content_path = manifest_path.with_suffix(CONTENT_SUFFIX)
+            try:
+                size = manifest_path.stat().st_size + content_path.stat().st_size
+                entries.append((manifest_path.stat().st_mtime_ns, manifest_path, content_path, size))
+            except OSError:
+                continue
+            total_size += size
+        entries.sort()
+        while total_size > self.max_size and entries:
+            _, manifest_path, content_path, size = entries.pop(0)
+            for path in (manifest_path, content_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total_size -= size
+
+    def clear(self):
+        for path in list(self.cache_dir.glob("*" + MANIFEST_SUFFIX)) + list(self.cache_dir.glob("*" + CONTENT_SUFFIX)):
+            path.unlink()
+
+    def __is_valid(self, manifest: dict) -> bool:
+        for path, digest in manifest["files"].items():
+            try:
+                if file_hash(Path(path)) != digest:
+                    return False
+            except OSError:
+                return False
+        if any(Path(path).is_file() for path in manifest["missing"]):
+            return False
+        if any(self.environ.get(name) != value for name, value in manifest["env"].items()):
+            return False
+        if manifest["environment"] is not None and manifest["environment"] != environment_hash(self.environ):
+            return False
+        return True
+
+    def __write_atomic(self, path: Path, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def file_hash(path: Path) -> str:
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def environment_hash(environ: Mapping) -> str:
+    return hashlib.sha256(json.dumps(sorted(environ.items())).encode()).hexdigest()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import errno
+import json
+import os
+import socket
+import socketserver
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from yaml_extender import batch, yaml_loader
+from yaml_extender.client import DEFAULT_SOCKET_PATH
+from yaml_extender.logger import get_logger
+from yaml_extender.result_cache import EnvironmentRecorder
+
+LOGGER = get_logger()
+
+# Options of a request overriding the options of the server
+REQUEST_OPTIONS = ["sort_keys", "output_format"]
+# Only the owner may connect to the socket
+SOCKET_MODE = 0o600
+SOCKET_DIR_MODE = 0o700
+
+
+class ResolveRequestHandler(socketserver.StreamRequestHandler):
+    """Answers every line of json received on a connection with a line of json"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request is no json object")
+            except ValueError as e:
+                response = {"success": False, "error": f"Invalid request: {e}"}
+            else:
+                response = self.server.resolve(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class ResolveServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long running process resolving files on request, received as lines of json on a unix socket.
+
+    Parsed files stay cached between requests and are only parsed again if their stat signature changes, see
+    yaml_loader.ParsedFileCache. Every connection is served by its own thread, a connection may send any number
+    of requests.
+
+    Request: {"input": path, "output": path, "cwd": path, "params": {}, "args": [], "include_dirs": [], "env": {},
+    "env_complete": bool, "sort_keys": bool, "output_format": str}, only input and output are required.
+    args are parameters given like on the command line. cwd is the working directory of the client, relative paths
+    are resolved against it and it is the last include path. The directory of the input is used if not given, never
+    the working directory of the server.
+    env are the values of environment variables referenced by xyml.env, null for unset variables. The environment of
+    the server is used if not given. env_complete is set if env contains the whole environment of the client.
+    Response: {"success": bool, "error": str or null, "duration": seconds, "env": [], "env_complete": bool}
+    If the file references variables, which are not part of env, nothing is written and the response lists them in
+    env, env_complete is set if the whole environment is referenced. The client repeats the request with them.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str | Path = DEFAULT_SOCKET_PATH, params: Dict | None = None,
+                 include_dirs: List[Path] | None = None, **options):
+        """
+        Parameters
+            params: Parameters used for all requests, updated by the parameters of each request
+            include_dirs: Include paths searched before the include paths of each request
+            options: Options of the resolution like in batch.run_batch
+        """
+        self.socket_path = Path(socket_path)
+        self.params = params or {}
+        self.include_dirs = include_dirs or []
+        self.options = options
+        if not self.socket_path.parent.exists():
+            self.socket_path.parent.mkdir(SOCKET_DIR_MODE, parents=True)
+        # Remove the socket of a server, which was not shut down, but never the one of a running server
+        if self.socket_path.is_socket():
+            if is_listening(self.socket_path):
+                raise OSError(errno.EADDRINUSE, f"A server is already listening on {self.socket_path}")
+            self.socket_path.unlink()
+        super().__init__(str(self.socket_path), ResolveRequestHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.socket_path, SOCKET_MODE)
+
+    def server_close(self):
+        super().server_close()
+        if self.socket_path.is_socket():
+            self.socket_path.unlink()
+
+    def resolve(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Resolves the file of a request, errors are reported in the response"""
+        start = time.perf_counter()
+        if "input" not in request or "output" not in request:
+            return {"success": False, "error": "Request requires input and output", "duration": 0.0}
+        args = request.get("args", [])
+        params = {k.strip("-"): yaml_loader.parse_any_value(v) for k, v in zip(args[:-1:2], args[1::2])}
+        params.update(request.get("params") or {})
+        cwd = Path(request["cwd"]) if "cwd" in request else Path(request["input"]).parent
+        job = batch.BatchJob(cwd / request["input"], cwd / request["output"], params)
+        include_dirs = self.include_dirs + [Path(path) for path in request.get("include_dirs", [])]
+        options = dict(self.options)
+        options.update((key, request[key]) for key in REQUEST_OPTIONS if key in request)
+        options["cwd"] = cwd
+        environment = None
+        if "env" in request:
+            if not isinstance(request["env"], dict):
+                return {"success": False, "error": "Invalid request: env is no json object", "duration": 0.0}
+            environment = EnvironmentRecorder({k: v for k, v in request["env"].items() if v is not None})
+            options["environ"] = environment
+        try:
+            xyml_file = batch.load_job(job, self.params, include_dirs, options)
+            response = self.__missing_environment(request, environment)
+            if response is None:
+                batch.save_job(job, xyml_file, options)
+                # Multi document files are resolved while they are written
+                response = self.__missing_environment(request, environment)
+        except Exception as e:
+            response = {"success": False, "error": batch.error_message(e)}
+        response = response or {"success": True, "error": None}
+        response["duration"] = time.perf_counter() - start
+        LOGGER.info(f"Resolved {job.input} in {response['duration']:.3f}s" if response["success"]
+                    else f"FAILED  {job.input}: {response['error']}")
+        return response
+
+    @staticmethod
+    def __missing_environment(request: Dict[str, Any], environment: EnvironmentRecorder | None) -> Dict | None:
+        """Returns the response requesting the referenced variables, which the client did not send, or None"""
+        if environment is None:
+            return None
+        missing = sorted(name for name in environment.accessed if name not in request["env"])
+        complete = environment.complete and not request.get("env_complete", False)
+        if not missing and not complete:
+            return None
+        return {"success": False, "error": "Environment variables required", "env": missing,
+                "env_complete": complete}
+
+
+def is_listening(socket_path: Path) -> bool:
+    """Checks if a server accepts connections on socket_path"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def serve(socket_path: str | Path = DEFAULT_SOCKET_PATH, params: Dict | None = None,
+          include_dirs: List[Path] | None = None, **options):
+    """Serves requests until the process is interrupted"""
+    with ResolveServer(socket_path, params, include_dirs, **options) as server:
+        LOGGER.info(f"Serving on {server.socket_path} (pid {os.getpid()})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
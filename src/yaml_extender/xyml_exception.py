@@ -21,3 +21,26 @@ class RecursiveReferenceError(RecursionError):
     def __init__(self, reference):
         self.message = f"Maximum recursive depth reached, while resolving {reference}." \
                        f"Is there a loop in your configuration?"
+
+
+class ReferenceCycleError(RecursiveReferenceError):
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        self.message = "Reference cycle detected: " + " -> ".join(cycle)
+
+
+class IncludeCycleError(ExtYamlError):
+
+    def __init__(self, chain):
+        self.chain = chain
+        self.message = "Include cycle detected: " + " -> ".join(str(file) for file in chain)
+        super().__init__(self.message)
+
+
+class SnapshotFormatError(ExtYamlError):
+
+    def __init__(self, path, reason):
+        self.path = path
+        self.message = f"Unable to load snapshot {path}: {reason}"
+        super().__init__(self.message)
@@ -2,58 +2,207 @@ from __future__ import annotations
 
 import os
 import yaml
-from typing import Dict, List
+from typing import Any, Dict, Iterator, List, Mapping
 from pathlib import Path
 
-from yaml_extender import yaml_loader
+from yaml_extender import indexed_format, output_formats, yaml_loader, yaml_writer
+from yaml_extender.resolver.fused_resolver import FusedResolver
+from yaml_extender.resolver.include_context import IncludeContext
+from yaml_extender.resolver.include_graph import IncludeGraph
+from yaml_extender.resolver.include_index import IncludePathIndex
+from yaml_extender.resolver.include_prefetcher import IncludePrefetcher
 from yaml_extender.resolver.include_resolver import IncludeResolver
 from yaml_extender.resolver.inline_loop_resolver import InlineLoopResolver
+from yaml_extender.resolver.lazy_resolver import LazyResolver, LazySequence, materialize
 from yaml_extender.resolver.loop_resolver import LoopResolver
 from yaml_extender.resolver.reference_resolver import ReferenceResolver
+from yaml_extender.result_cache import DEFAULT_MAX_CACHE_SIZE, EnvironmentRecorder, ResultCache
 
 ENV_KEY = "env"
 PARAM_KEY = "param"
+STAGED_PIPELINE = "staged"
+FUSED_PIPELINE = "fused"
+PIPELINES = [STAGED_PIPELINE, FUSED_PIPELINE]
+DEFAULT_PIPELINE = STAGED_PIPELINE
+OUTPUT_BUFFER_SIZE = 1024 * 1024
 
 
 class XYmlFile:
 
-    def __init__(self, filepath: Path, params: Dict = None, include_dirs: List[Path] | None = None):
+    def __init__(self, filepath: Path, params: Dict = None, include_dirs: List[Path] | None = None,
+                 yaml_backend: str = yaml_loader.DEFAULT_YAML_BACKEND, include_workers: int = 1,
+                 cache_dir: Path | None = None, max_cache_size: int = DEFAULT_MAX_CACHE_SIZE,
+                 multi_document: bool = False, pipeline: str = DEFAULT_PIPELINE, lazy: bool = False,
+                 loop_workers: int = 1, environ: Mapping[str, str] | None = None, cwd: Path | None = None):
+        """
+        Parameters
+            include_workers: Number of threads loading include files concurrently, 1 loads them sequentially
+            cache_dir: Directory to persistently cache resolved contents in, no caching if not given
+            multi_document: Resolve every document of a multi document file independently while iterating
+                documents() or saving. content stays None in this mode.
+            pipeline: "staged" resolves inline loops and references in separate passes over the content,
+                "fused" resolves both in a single pass, see FusedResolver
+            lazy: Resolve inline loops and references of a value when it is read the first time. content and the
+                documents are read only LazyMapping or LazySequence proxies, see materialize(). Includes and loops
+                are still resolved right away. Lazy contents are not cached.
+            loop_workers: Number of processes expanding loops with many items, 1 expands all loops in this process
+            environ: Environment variables referenced by xyml.env, os.environ if not given
+            cwd: Working directory relative paths are resolved against and used as last default include path,
+                the working directory of the process if not given
+        """
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline {pipeline}, use one of {PIPELINES}")
+        self.pipeline = pipeline
         self.params = params
+        self.yaml_backend = yaml_backend
+        self.include_workers = include_workers
+        self.multi_document = multi_document
+        self.lazy = lazy
+        self.loop_workers = loop_workers
+        # Multi document files are streamed and therefore not cached
+        environ = os.environ if environ is None else environ
+        self.result_cache = ResultCache(cache_dir, max_cache_size, environ) \
+            if cache_dir and not multi_document and not lazy else None
+        # Include lookups and resolved include instances are shared by all documents of a pass
+        self.path_index = IncludePathIndex()
+        self.include_context = IncludeContext()
+        self.environment = EnvironmentRecorder(environ) if self.result_cache else environ
+        self.cwd = Path.cwd() if cwd is None else Path(cwd)
         if include_dirs:
-            self.include_dirs: List[Path] = include_dirs
+            self.include_dirs: List[Path] = [self.cwd / inc for inc in include_dirs]
         else:
             self.include_dirs: List[Path] = []
-        self.filepath = filepath.absolute()
-        self.root_dir = filepath.parent
+        self.filepath = self.cwd / filepath
+        self.root_dir = self.filepath.parent
         # Use root_dir and cwd as default include paths.
         if self.root_dir not in self.include_dirs:
             self.include_dirs.append(self.root_dir)
-        if Path.cwd() not in self.include_dirs:
-            self.include_dirs.append(Path.cwd())
-        self.content = yaml_loader.load(str(self.filepath))
+        if self.cwd not in self.include_dirs:
+            self.include_dirs.append(self.cwd)
+        if self.multi_document:
+            self.content = None
+            self.dependencies = IncludeGraph(self.__root_file())
+            return
+        if self.result_cache:
+            cache_key = self.result_cache.key(self.filepath, self.params, self.include_dirs, self.cwd)
+            cached_entry = self.result_cache.lookup(cache_key)
+            if cached_entry is not None:
+                self.content, self.dependencies = cached_entry
+                return
+        self.content = yaml_loader.load(str(self.filepath), backend=self.yaml_backend)
+        # Include graph of all files the content depends on
+        self.dependencies = IncludeGraph(self.__root_file())
         self.content = self.resolve()
+        if self.result_cache:
+            self.result_cache.store(cache_key, self.content, self.dependencies,
+                                    self.path_index.missing, self.environment)
 
     def __repr__(self):
-        return yaml.dump(self.content)
+        return yaml.dump(self.materialize())
 
-    def resolve(self):
-        inc_resolver = IncludeResolver(self.include_dirs, False)
-        processed_content = inc_resolver.resolve(self.content)
-        loop_resolver = LoopResolver(False)
+    def resolve(self, content: Any = None):
+        """Resolves content or the content of the file if no content is given"""
+        if content is None:
+            content = self.content
+        processed_content = self.resolve_includes(content)
+        loop_resolver = LoopResolver(False, self.loop_workers)
         processed_content = loop_resolver.resolve(processed_content)
+        if self.lazy:
+            return LazyResolver(self.reference_config(processed_content)).wrap(processed_content)
+        if self.pipeline == FUSED_PIPELINE:
+            fused_resolver = FusedResolver(False, dependency_order=True)
+            return fused_resolver.resolve(processed_content, self.reference_config(processed_content))
         inline_loop_resolver = InlineLoopResolver(False)
         processed_content = inline_loop_resolver.resolve(processed_content)
-        # Extend config for resolution by ENV and PARAM statements
-        config = processed_content.copy()
+        ref_resolver = ReferenceResolver(False, dependency_order=True)
+        processed_content = ref_resolver.resolve(processed_content, self.reference_config(processed_content))
+        return processed_content
+
+    def materialize(self) -> Any:
+        """Returns the content with all values resolved, lazy contents are resolved completely"""
+        return materialize(self.content)
+
+    def reference_config(self, content: Any) -> dict:
+        """Extends content for resolution by ENV and PARAM statements"""
+        config = content.copy() if isinstance(content, dict) else {}
         config["xyml"] = {}
-        config["xyml"][ENV_KEY] = os.environ
+        config["xyml"][ENV_KEY] = self.environment
         config["xyml"][PARAM_KEY] = self.params
-        ref_resolver = ReferenceResolver(False)
-        processed_content = ref_resolver.resolve(processed_content, config)
-        return processed_content
+        return config
+
+    def resolve_includes(self, content):
+        if self.include_workers <= 1:
+            inc_resolver = IncludeResolver(self.include_dirs, False, self.yaml_backend, self.path_index,
+                                           include_graph=self.dependencies, context=self.include_context,
+                                           cwd=self.cwd)
+            return inc_resolver.resolve(content)
+        with IncludePrefetcher(self.include_workers, self.path_index, self.yaml_backend) as prefetcher:
+            prefetcher.prefetch(content, self.include_dirs, self.cwd)
+            inc_resolver = IncludeResolver(self.include_dirs, False, self.yaml_backend, self.path_index, prefetcher,
+                                           self.dependencies, context=self.include_context, cwd=self.cwd)
+            return inc_resolver.resolve(content)
+
+    def documents(self) -> Iterator[Any]:
+        """
+        Yields the resolved documents, multi document files are read and resolved one document at a time.
+
+        Every iteration of a multi document file reads and resolves the file again and replaces dependencies by
+        the include graph of this pass. Resolved include instances are only shared within a pass, a memoized
+        instance does not record its nested includes again.
+        """
+        if not self.multi_document:
+            yield self.content
+            return
+        self.dependencies = IncludeGraph(self.__root_file())
+        self.include_context = IncludeContext()
+        for document in yaml_loader.load_all(str(self.filepath), self.yaml_backend):
+            yield self.resolve(document)
+
+    def __root_file(self) -> Path:
+        try:
+            return yaml_loader.resolve_path(str(self.filepath))
+        except FileNotFoundError:
+            return self.filepath
+
+    def save(self, path: str, sort_keys=False, output_format: str | None = None):
+        """
+        Writes the content, yaml is written while walking the content, see yaml_writer.StreamWriter.
+
+        Lazy contents are resolved value by value while they are written as yaml or json, without materializing
+        them first.
 
-    def save(self, path: str, sort_keys=False):
-        with open(path, 'w') as file:
-            yaml.dump(self.content, file, sort_keys=sort_keys)
+        Parameters
+            output_format: One of OUTPUT_FORMATS, selected by the suffix of path if not given.
+                "jsonl" writes every element of a top level list or every document of a multi document file
+                as a line of json. "snapshot" writes a binary snapshot, which is loaded by load_snapshot.
+                "indexed" writes a snapshot, which is memory mapped by load_indexed.
+        """
+        if output_format is None:
+            output_format = output_formats.format_for_path(path)
+        if output_format not in output_formats.OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}, use one of {output_formats.OUTPUT_FORMATS}")
+        if self.multi_document and output_format not in (output_formats.YAML_FORMAT,
+                                                         output_formats.JSON_LINES_FORMAT):
+            raise ValueError(f"Multi document files can not be saved as {output_format}")
+        if output_format == output_formats.JSON_LINES_FORMAT and not self.multi_document \
+                and not isinstance(self.content, (list, LazySequence)):
+            raise ValueError(f"Only top level lists can be saved as {output_format}")
+        if output_format == output_formats.SNAPSHOT_FORMAT:
+            with open(path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as file:
+                output_formats.write_snapshot(self.materialize(), file)
+            return
+        if output_format == output_formats.INDEXED_FORMAT:
+            with open(path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as file:
+                indexed_format.write_indexed(self.content, file)
+            return
+        with open(path, 'w', buffering=OUTPUT_BUFFER_SIZE) as file:
+            # Every document is written before the next one is read
+            if output_format == output_formats.YAML_FORMAT:
+                yaml_writer.stream_dump_all(self.documents(), file, sort_keys, self.yaml_backend)
+            elif output_format == output_formats.JSON_FORMAT:
+                output_formats.write_json(self.content, file, sort_keys)
+            else:
+                lines = self.documents() if self.multi_document else self.content
+                output_formats.write_json_lines(lines, file, sort_keys)
 
 
@@ -1,27 +1,197 @@
+from __future__ import annotations
+
+import copy
+import os
+import stat
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Any, Dict, IO, Iterable, Iterator, Tuple
+
 import yaml
 
+import yaml_extender.logger as logger
+
 VALID_YAML_SUFFIXES = [".yaml", ".yml", ".xyml"]
+DEFAULT_CACHE_SIZE = 512
+
+# "c" uses the libyaml bindings of PyYAML, "auto" uses them only if they are available.
+YAML_BACKENDS = ["auto", "c", "python"]
+DEFAULT_YAML_BACKEND = "auto"
+
+
+class ParsedFileCache:
+    """
+    Process wide LRU cache of parsed yaml files.
+
+    Entries are keyed by the absolute file path and the yaml implementation and validated against the stat signature
+    (mtime_ns, size, inode) of the file, so modified files are parsed again.
+    Callers always receive an isolated copy, resolvers are free to modify it in place.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries: OrderedDict[Tuple[str, bool], Tuple[Tuple[int, int, int], Any]] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def load(self, path: Path, backend: str = DEFAULT_YAML_BACKEND) -> Any:
+        """Returns a copy of the parsed content of path, parses the file only if necessary"""
+        abs_path = os.path.abspath(path)
+        try:
+            signature = stat_signature(abs_path)
+        except OSError:
+            raise FileNotFoundError(f"Unable to resolve {path}")
+        # Every yaml implementation parses the file on its own
+        key = (abs_path, use_libyaml(backend))
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+                return copy_content(entry[1])
+            self.misses += 1
+        content = parse_file(abs_path, backend)
+        with self.__lock:
+            self.__entries[key] = (signature, content)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+        return copy_content(content)
+
+    def invalidate(self, path: str | Path | None = None):
+        """Drops the entry of path or all entries if no path is given"""
+        with self.__lock:
+            if path is None:
+                self.__entries.clear()
+            else:
+                for use_c in (False, True):
+                    self.__entries.pop((os.path.abspath(path), use_c), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.__entries), "max_entries": self.max_entries}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+PARSED_FILE_CACHE = ParsedFileCache()
+
+
+def stat_signature(path: str) -> Tuple[int, int, int]:
+    """Returns (mtime_ns, size, inode) of a regular file"""
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise IsADirectoryError(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def copy_content(content: Any) -> Any:
+    """
+    Creates an isolated copy of parsed content, shared yaml anchors stay shared.
+
+    Dicts and lists are copied using an explicit stack, so the nesting depth is not limited by recursion.
+    """
+    if not isinstance(content, (dict, list)):
+        return content if isinstance(content, (str, int, float)) or content is None else copy.deepcopy(content)
+    root = content.copy()
+    copies = {id(content): root}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for key, value in (node.items() if isinstance(node, dict) else enumerate(node)):
+            if isinstance(value, (dict, list)):
+                value_copy = copies.get(id(value))
+                if value_copy is None:
+                    value_copy = copies[id(value)] = value.copy()
+                    stack.append(value_copy)
+                node[key] = value_copy
+            elif not isinstance(value, (str, int, float)) and value is not None:
+                # Other values of yaml tags like dates or sets
+                node[key] = copy.deepcopy(value)
+    return root
 
 
-def load(path: str) -> dict:
+def invalidate_cache(path: str | Path | None = None):
+    PARSED_FILE_CACHE.invalidate(path)
+
+
+def resolve_path(path: str) -> Path:
+    """Returns the existing yaml file for path, adding a valid suffix if it is missing"""
     if not any(path.endswith(suffix) for suffix in VALID_YAML_SUFFIXES):
         # Add yaml suffix if the filepath is missing it
         possible_paths = [Path(path + suffix) for suffix in VALID_YAML_SUFFIXES]
         valid_paths = [p for p in possible_paths if p.is_file()]
         if valid_paths:
-            valid_path = valid_paths[0]
-        else:
-            raise FileNotFoundError(f"Unable to resolve {path}")
-    else:
-        valid_path = Path(path)
-        if not valid_path.is_file():
-            raise FileNotFoundError(f"Unable to resolve {path}")
-    with open(valid_path, 'r') as file:
-        content = yaml.safe_load(file)
+            return valid_paths[0]
+        raise FileNotFoundError(f"Unable to resolve {path}")
+    valid_path = Path(path)
+    if not valid_path.is_file():
+        raise FileNotFoundError(f"Unable to resolve {path}")
+    return valid_path
+
+
+def use_libyaml(backend: str) -> bool:
+    """Returns True if the given backend resolves to the libyaml bindings"""
+    if backend not in YAML_BACKENDS:
+        raise ValueError(f"Unknown yaml backend {backend}, valid backends are {YAML_BACKENDS}")
+    if backend == "python":
+        return False
+    if not yaml.__with_libyaml__:
+        if backend == "c":
+            logger.warning("libyaml is not available, falling back to the python yaml backend.")
+        return False
+    return True
+
+
+def get_loader(backend: str = DEFAULT_YAML_BACKEND):
+    return yaml.CSafeLoader if use_libyaml(backend) else yaml.SafeLoader
+
+
+def get_dumper(backend: str = DEFAULT_YAML_BACKEND):
+    # Use the full dumper to keep the output identical to yaml.dump
+    return yaml.CDumper if use_libyaml(backend) else yaml.Dumper
+
+
+def parse_file(path: str | Path, backend: str = DEFAULT_YAML_BACKEND) -> Any:
+    with open(path, 'r') as file:
+        content = yaml.load(file, Loader=get_loader(backend))
     return content
 
 
+def dump(content: Any, stream: IO, sort_keys: bool = False, backend: str = DEFAULT_YAML_BACKEND):
+    yaml.dump(content, stream, Dumper=get_dumper(backend), sort_keys=sort_keys)
+
+
+def dump_all(documents: Iterable[Any], stream: IO, sort_keys: bool = False, backend: str = DEFAULT_YAML_BACKEND):
+    """Writes every document to stream before the next one is taken from documents"""
+    yaml.dump_all(documents, stream, Dumper=get_dumper(backend), sort_keys=sort_keys)
+
+
+def load_all(path: str, backend: str = DEFAULT_YAML_BACKEND) -> Iterator[Any]:
+    """Yields the documents of a multi document file one after another, documents are not cached"""
+    with open(resolve_path(path), 'r') as file:
+        yield from yaml.load_all(file, Loader=get_loader(backend))
+
+
+def load(path: str, use_cache: bool = True, backend: str = DEFAULT_YAML_BACKEND) -> dict:
+    if not use_cache:
+        return parse_file(resolve_path(path), backend)
+    if any(path.endswith(suffix) for suffix in VALID_YAML_SUFFIXES):
+        # The cache stats the file anyway, no need to check for its existence beforehand
+        return PARSED_FILE_CACHE.load(Path(path), backend)
+    return PARSED_FILE_CACHE.load(resolve_path(path), backend)
+
+
 def parse_numeric_value(value: str):
     try:
         return int(value)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from typing import Any, Dict, IO, Iterable, Iterator, List, Set, Tuple
+
+from yaml import (AliasEvent, DocumentEndEvent, DocumentStartEvent, MappingEndEvent, MappingNode, MappingStartEvent,
+                  ScalarEvent, ScalarNode, SequenceEndEvent, SequenceNode, SequenceStartEvent)
+
+from yaml_extender import yaml_loader
+from yaml_extender.resolver.lazy_resolver import LazyMapping, LazySequence
+
+MAPPING_TAG = "tag:yaml.org,2002:map"
+SEQUENCE_TAG = "tag:yaml.org,2002:seq"
+ANCHOR_TEMPLATE = "id%03d"
+
+
+class StreamWriter:
+    """
+    Writes contents to a yaml stream event by event, without building the node graph of the whole content.
+
+    Dicts and lists are walked with an explicit stack and their events are emitted as soon as they are reached,
+    scalars and other objects are represented one at a time by the representer of the dumper.
+    The output equals the one of yaml_loader.dump, including sort_keys and the aliases of dicts and lists
+    contained more than once. LazyMapping and LazySequence proxies are written like dicts and lists,
+    their values are resolved while they are written.
+    """
+
+    def __init__(self, stream: IO, sort_keys: bool = False, backend: str = yaml_loader.DEFAULT_YAML_BACKEND):
+        self.sort_keys = sort_keys
+        self.dumper = yaml_loader.get_dumper(backend)(stream, default_flow_style=False, sort_keys=sort_keys)
+
+    def __enter__(self) -> StreamWriter:
+        self.dumper.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Don't finish the stream if writing failed
+            if exc_type is None:
+                self.dumper.close()
+        finally:
+            self.dumper.dispose()
+
+    def write(self, content: Any):
+        """Writes content as the next document of the stream"""
+        emit = self.dumper.emit
+        anchors = self.__anchors(content)
+        # Ids of the shared nodes written before
+        written: Set[int] = set()
+        emit(DocumentStartEvent(explicit=False))
+        # Events of values to be written and the end event of every dict and list being written
+        stack: List[Tuple[Iterator[Any], Any]] = [(iter([content]), None)]
+        while stack:
+            values, end_event = stack[-1]
+            for value in values:
+                is_mapping = type(value) is dict or isinstance(value, LazyMapping)
+                if not is_mapping and type(value) is not list and not isinstance(value, LazySequence):
+                    self.__write_object(value)
+                    continue
+                anchor = anchors.get(id(value))
+                if anchor is not None:
+                    if id(value) in written:
+                        emit(AliasEvent(anchor))
+                        continue
+                    written.add(id(value))
+                if is_mapping:
+                    emit(MappingStartEvent(anchor, MAPPING_TAG, True, flow_style=False))
+                    stack.append((self.__mapping_values(value), MappingEndEvent))
+                else:
+                    emit(SequenceStartEvent(anchor, SEQUENCE_TAG, True, flow_style=False))
+                    stack.append((iter(value), SequenceEndEvent))
+                break
+            else:
+                stack.pop()
+                if end_event is not None:
+                    emit(end_event())
+        emit(DocumentEndEvent(explicit=False))
+
+    def __mapping_values(self, mapping: Any) -> Iterator[Any]:
+        """Yields the keys and values of mapping alternately, values are looked up after their key was written"""
+        keys: Iterable[Any] = mapping
+        if self.sort_keys:
+            try:
+                keys = sorted(mapping)
+            except TypeError:
+                pass
+        for key in keys:
+            yield key
+            yield mapping[key]
+
+    def __anchors(self, content: Any) -> Dict[int, str]:
+        """
+        Returns the anchors of all dicts and lists contained more than once by their id, proxies are not searched.
+
+        Like Serializer.anchor_node, the anchors are numbered in the order the nodes are reached the second time
+        while the content is walked in the order it is written, starting again for every document.
+        """
+        visited = set()
+        anchors: Dict[int, str] = {}
+        stack = [content]
+        while stack:
+            node = stack.pop()
+            if type(node) is dict:
+                children = node.values()
+                if self.sort_keys:
+                    try:
+                        children = [node[key] for key in sorted(node)]
+                    except TypeError:
+                        pass
+            elif type(node) is list:
+                children = node
+            else:
+                continue
+            if id(node) in visited:
+                if id(node) not in anchors:
+                    anchors[id(node)] = ANCHOR_TEMPLATE % (len(anchors) + 1)
+                continue
+            visited.add(id(node))
+            stack.extend(reversed(children))
+        return anchors
+
+    def __write_object(self, value: Any):
+        """Writes a scalar or any other object as represented by the dumper"""
+        dumper = self.dumper
+        node = dumper.represent_data(value)
+        # Reset the state of the representer, like it is done after every document
+        dumper.represented_objects = {}
+        dumper.object_keeper = []
+        dumper.alias_key = None
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node is MappingEndEvent or node is SequenceEndEvent:
+                dumper.emit(node())
+            elif isinstance(node, ScalarNode):
+                detected_tag = dumper.resolve(ScalarNode, node.value, (True, False))
+                default_tag = dumper.resolve(ScalarNode, node.value, (False, True))
+                implicit = (node.tag == detected_tag, node.tag == default_tag)
+                dumper.emit(ScalarEvent(None, node.tag, implicit, node.value, style=node.style))
+            elif isinstance(node, SequenceNode):
+                implicit = node.tag == dumper.resolve(SequenceNode, node.value, True)
+                dumper.emit(SequenceStartEvent(None, node.tag, implicit, flow_style=node.flow_style))
+                stack.append(SequenceEndEvent)
+                stack.extend(reversed(node.value))
+            elif isinstance(node, MappingNode):
+                implicit = node.tag == dumper.resolve(MappingNode, node.value, True)
+                dumper.emit(MappingStartEvent(None, node.tag, implicit, flow_style=node.flow_style))
+                stack.append(MappingEndEvent)
+                stack.extend(reversed([x for item in node.value for x in item]))
+
+
+def stream_dump(content: Any, stream: IO, sort_keys: bool = False, backend: str = yaml_loader.DEFAULT_YAML_BACKEND):
+    """Writes content like yaml_loader.dump, the events are written while the content is walked"""
+    stream_dump_all([content], stream, sort_keys, backend)
+
+
+def stream_dump_all(documents: Iterable[Any], stream: IO, sort_keys: bool = False,
+                    backend: str = yaml_loader.DEFAULT_YAML_BACKEND):
+    """Writes every document to stream before the next one is taken from documents"""
+    with StreamWriter(stream, sort_keys, backend) as writer:
+        for document in documents:
+            writer.write(document)
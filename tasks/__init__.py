@@ -151,3 +151,14 @@ def build_docs(ctx):
     args.extend(["-e", "-M", "-F", f"src/{PACKAGE_NAME}"])
     print("Building docs...")
     ctx.run("sphinx-apidoc {0}".format(" ".join(args)))
+
+
+@invoke.task
+def bench(ctx, scale=1, repeat=3, output='benchmarks/results.json', baseline=None, threshold=10.0):
+    """Run the benchmarks, fails if a stage is more than threshold percent slower than the baseline.
+    """
+    args = ['run', '--scale', str(scale), '--repeat', str(repeat), '--output', output]
+    if baseline:
+        args.extend(['--baseline', baseline, '--threshold', str(threshold)])
+    env = {'PYTHONPATH': str(ROOT.joinpath('src'))}
+    ctx.run(f'python -m benchmarks {" ".join(args)}', env=env)
@@ -0,0 +1,47 @@
+import pytest
+import yaml
+from pathlib import Path
+
+from yaml_extender import batch
+from yaml_extender.cli import main
+
+script_dir = Path(__file__).parent
+res_dir = script_dir.parent / "resources"
+
+
+def test_batch_pool(tmp_path):
+    jobs = [batch.BatchJob(res_dir / "root.yaml", tmp_path / f"out_{i}.yaml", {"user": f"user_{i}"}) for i in range(3)]
+    jobs.append(batch.BatchJob(tmp_path / "missing.yaml", tmp_path / "missing_out.yaml"))
+    summary = batch.run_batch(jobs, {"empty": ""}, [res_dir / "subdir"], workers=2)
+    assert not summary.success
+    assert [result.success for result in summary.results] == [True, True, True, False]
+    assert "FileNotFoundError" in summary.failed[0].error
+    for i in range(3):
+        content = yaml.safe_load((tmp_path / f"out_{i}.yaml").read_text())
+        assert content["user_content"] == f"user_{i}"
+
+
+def test_batch_cli(tmp_path):
+    manifest = tmp_path / "manifest.yaml"
+    manifest.write_text(f"""
+jobs:
+- input: {res_dir / "root.yaml"}
+  output: out/manifest.yaml
+  params:
+    user: manifest
+""")
+    result = main(["batch", "-m", str(manifest), "--glob", str(res_dir / "r*.yaml"),
+                   "--output-dir", str(tmp_path / "glob"), "-i", str(res_dir / "subdir"), "-j", "1",
+                   "--user", "simon", "--empty", ""])
+    assert result == 0
+    expected = yaml.safe_load((res_dir / "expected_file.yaml").read_text())
+    assert yaml.safe_load((tmp_path / "glob" / "root.yaml").read_text()) == expected
+    assert yaml.safe_load((tmp_path / "out" / "manifest.yaml").read_text())["user_content"] == "manifest"
+
+
+def test_batch_depfile_path(tmp_path):
+    with pytest.raises(SystemExit):
+        main(["batch", "--pair", str(res_dir / "root.yaml"), str(tmp_path / "out.yaml"), "-M", str(tmp_path / "d")])
+    assert main(["batch", "--pair", str(res_dir / "root.yaml"), str(tmp_path / "out.yaml"), "-MD", "-j", "1",
+                 "-i", str(res_dir / "subdir"), "--user", "simon", "--empty", ""]) == 0
+    assert (tmp_path / "out.yaml.d").read_text().startswith(f"{tmp_path / 'out.yaml'}: {res_dir / 'root.yaml'}")
@@ -1,8 +1,15 @@
+import copy
 from pathlib import Path
 from unittest import mock
+import pytest
 import yaml
 
+from yaml_extender import yaml_loader
+from src.yaml_extender.resolver.include_context import IncludeContext
+from src.yaml_extender.resolver.include_index import IncludePathIndex
+from src.yaml_extender.resolver.include_prefetcher import IncludePrefetcher
 from src.yaml_extender.resolver.include_resolver import IncludeResolver
+from yaml_extender.xyml_exception import IncludeCycleError
 
 
 @mock.patch('yaml_extender.yaml_loader.load')
@@ -300,3 +307,94 @@ xyml.include: inc.yaml<<param_value=true>>
     inc_resolver = IncludeResolver()
     result = inc_resolver.resolve(content)
     assert result == expected
+
+
+def test_include_path_index(tmp_path):
+    first_dir = tmp_path / "first"
+    second_dir = tmp_path / "second"
+    first_dir.mkdir()
+    second_dir.mkdir()
+    (second_dir / "inc.yaml").write_text("value: second")
+    (second_dir / "inc.yml").write_text("value: second_yml")
+    (first_dir / "other.xyml").write_text("value: first")
+    index = IncludePathIndex()
+    assert index.find([first_dir, second_dir], "inc.yaml") == second_dir / "inc.yaml"
+    assert index.find([first_dir, second_dir], "other.xyml") == first_dir / "other.xyml"
+    # Include names are not completed by suffixes
+    assert index.find([first_dir, second_dir], "inc") is None
+    assert index.find([first_dir, second_dir], "missing.yaml") is None
+    misses = index.misses
+    # Every lookup is only probed once, including negative results
+    (first_dir / "inc.yaml").write_text("value: first")
+    assert index.find([first_dir, second_dir], "inc.yaml") == second_dir / "inc.yaml"
+    assert index.find([first_dir, second_dir], "missing.yaml") is None
+    assert index.misses == misses
+
+
+def test_include_path_index_order(tmp_path):
+    (tmp_path / "base.yaml").write_text("value_2: xyz")
+    content = yaml.safe_load("""
+value_1: abc
+xyml.include: base.yaml
+""")
+    index = IncludePathIndex()
+    inc_resolver = IncludeResolver([tmp_path], path_index=index)
+    result = inc_resolver.resolve(content)
+    assert result == {"value_1": "abc", "value_2": "xyz"}
+    assert index.find([tmp_path], "base.yaml") == tmp_path / "base.yaml"
+    assert index.find([tmp_path], "base") is None
+
+
+def test_prefetched_include(tmp_path):
+    inc_dir = tmp_path / "inc"
+    inc_dir.mkdir()
+    for i in range(20):
+        (inc_dir / f"inc_{i}.yaml").write_text(f"value_{i}: \"{{{{param}}}}\"\nxyml.include: common.yaml\n")
+    (tmp_path / "common.yaml").write_text("common: abc\n")
+    content = {"dict_1": {"xyml.include": [f"inc/inc_{i}.yaml<<param={i}>>" for i in range(20)]}}
+    expected = IncludeResolver([tmp_path]).resolve(copy.deepcopy(content))
+    load_mock = mock.Mock(wraps=yaml_loader.load)
+    with mock.patch('yaml_extender.yaml_loader.load', load_mock):
+        with IncludePrefetcher(4) as prefetcher:
+            prefetcher.prefetch(content, [tmp_path])
+            inc_resolver = IncludeResolver([tmp_path], path_index=prefetcher.path_index, prefetcher=prefetcher)
+            result = inc_resolver.resolve(content)
+    assert yaml.dump(result) == yaml.dump(expected)
+    # Every file is only loaded once
+    assert load_mock.call_count == 21
+
+
+def test_memoized_include(tmp_path):
+    (tmp_path / "inc.yaml").write_text("value: \"{{param}}\"\nxyml.include: common.yaml\n")
+    (tmp_path / "common.yaml").write_text("common: [1, 2]\n")
+    content = {"first": {"xyml.include": "inc.yaml<<param=1>>"},
+               "second": {"xyml.include": "inc.yaml<<param=1>>"},
+               "third": {"xyml.include": "inc.yaml<<param=2>>"}}
+    context = IncludeContext()
+    result = IncludeResolver([tmp_path], context=context).resolve(content)
+    assert result["first"] == result["second"] == {"value": 1, "common": [1, 2]}
+    assert result["third"] == {"value": 2, "common": [1, 2]}
+    # inc.yaml<<param=1>> and common.yaml are only resolved once
+    assert context.hits == 2
+    assert len(context) == 3
+    # Memoized contents are isolated copies
+    result["first"]["common"].append(3)
+    assert result["second"]["common"] == [1, 2]
+
+
+def test_dynamic_include_not_memoized(tmp_path):
+    (tmp_path / "inc.yaml").write_text("xyml.include: \"{{name}}.yaml\"\n")
+    (tmp_path / "a.yaml").write_text("value: a\n")
+    context = IncludeContext()
+    inc_resolver = IncludeResolver([tmp_path], context=context)
+    assert inc_resolver.resolve({"name": "a", "xyml.include": "inc.yaml"})["value"] == "a"
+    assert len(context) == 1
+
+
+def test_include_cycle(tmp_path):
+    (tmp_path / "a.yaml").write_text("value_a: 1\nxyml.include: b.yaml\n")
+    (tmp_path / "b.yaml").write_text("value_b: 1\nxyml.include: a.yaml\n")
+    with pytest.raises(IncludeCycleError) as error:
+        IncludeResolver([tmp_path]).resolve({"xyml.include": "a.yaml"})
+    assert error.value.chain == [tmp_path / "a.yaml", tmp_path / "b.yaml", tmp_path / "a.yaml"]
+    assert "a.yaml -> " in error.value.message
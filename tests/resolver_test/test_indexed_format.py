@@ -0,0 +1,57 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+from src.yaml_extender.indexed_format import IndexedMapping, IndexedSequence, load_indexed, to_python, write_indexed
+from src.yaml_extender.xyml_file import XYmlFile
+from yaml_extender.xyml_exception import SnapshotFormatError
+
+res_dir = Path(__file__).parent.parent / "resources"
+
+
+def write(tmp_path, content):
+    path = tmp_path / "content.xidx"
+    with open(path, "wb") as file:
+        write_indexed(content, file)
+    return path
+
+
+def test_indexed_roundtrip(tmp_path):
+    shared = {"x": [1, 2]}
+    content = {"int": 1, "values": [1, 2.5, True, False, None, "text", "ü", 2 ** 70, -2 ** 63], "empty": {},
+               "list": [], "shared": shared, "nested": [shared], 1: "int key", None: "none key",
+               "date": datetime.date(2020, 1, 1), "large": {f"key_{i}": i for i in range(1000)}}
+    result = load_indexed(write(tmp_path, content))
+    assert isinstance(result, IndexedMapping)
+    assert isinstance(result["values"], IndexedSequence)
+    assert to_python(result) == content
+    assert result == content
+    assert list(result) == list(content)
+    assert result["large"]["key_999"] == 999
+    assert result[1] == "int key"
+    assert result[None] == "none key"
+    assert result["values"][-1] == -2 ** 63
+    assert result["values"][1:3] == [2.5, True]
+    assert "missing" not in result
+    with pytest.raises(KeyError):
+        result["missing"]
+    with pytest.raises(IndexError):
+        result["values"][9]
+    for root in ([1, [2, {"a": None}]], "text", 5):
+        assert to_python(load_indexed(write(tmp_path, root))) == root
+
+
+def test_indexed_invalid_file(tmp_path):
+    (tmp_path / "empty.xidx").write_bytes(b"")
+    with pytest.raises(SnapshotFormatError):
+        load_indexed(tmp_path / "empty.xidx")
+    (tmp_path / "other.xidx").write_text("a: 1\n" * 10)
+    with pytest.raises(SnapshotFormatError):
+        load_indexed(tmp_path / "other.xidx")
+
+
+def test_indexed_file(tmp_path):
+    resolved_file = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    resolved_file.save(tmp_path / "output.xidx")
+    assert load_indexed(tmp_path / "output.xidx") == resolved_file.content
@@ -1,5 +1,7 @@
+import pytest
 import yaml
 from yaml_extender.resolver.inline_loop_resolver import InlineLoopResolver
+from yaml_extender.xyml_exception import ReferenceNotFoundError
 
 
 def test_basic_inline_loop():
@@ -21,3 +23,30 @@ ref_val_1: "This string is NUM is: 123 !!! NUM is: 456 !!! nothing more."
     assert result == expected
 
 
+
+
+def test_multiple_inline_loops():
+    config = {"xs": [1, 2], "servers": {"names": ["a", "b"]}}
+    inl_loop_resolver = InlineLoopResolver()
+    assert inl_loop_resolver.resolve_inline_loop("{{xyml.for:i:xs:{{i}}}} and {{xyml.for:j:xs:{{j}},}}",
+                                                 config) == "12 and 1,2,"
+    # Dotted iteration sources
+    assert inl_loop_resolver.resolve_inline_loop("{{ xyml.for : n : servers.names :{{n}};}}", config) == "a;b;"
+    # Nested loops
+    assert inl_loop_resolver.resolve_inline_loop("{{xyml.for:i:xs:[{{xyml.for:j:xs:{{i}}{{j}} }}]}}",
+                                                 config) == "[11 12 ][21 22 ]"
+
+
+def test_large_inline_loop():
+    config = {"hosts": [f"host_{i}" for i in range(10000)]}
+    inl_loop_resolver = InlineLoopResolver()
+    result = inl_loop_resolver.resolve_inline_loop("{{xyml.for:h:hosts:{{h}}:80,}}", config)
+    assert result.startswith("host_0:80,host_1:80,")
+    assert result.count(",") == 10000
+
+
+def test_missing_inline_loop_source():
+    # The statement is never left to the reference resolution, which would read part of it as a default
+    for fail_on_resolve in (True, False):
+        with pytest.raises(ReferenceNotFoundError):
+            InlineLoopResolver(fail_on_resolve).resolve({"lst": "{{xyml.for:i:missing:{{i}},}}"})
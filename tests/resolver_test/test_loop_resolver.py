@@ -1,3 +1,5 @@
+import copy
+
 import yaml
 
 from src.yaml_extender.resolver.loop_resolver import LoopResolver
@@ -219,3 +221,75 @@ commands:
     loop_resolver = LoopResolver()
     result = loop_resolver.resolve(content)
     assert result == expected
+
+
+def test_multi_loop_shared_body():
+    content = yaml.safe_load("""
+rows: [a, b]
+columns: [1, 2]
+cells:
+  xyml.for: row:rows, column:columns
+  name: "{{row}}{{column}}"
+  static:
+    values: [1, 2]
+""")
+    loop_resolver = LoopResolver()
+    result = loop_resolver.resolve(content)
+    assert [cell["name"] for cell in result["cells"]] == ["a1", "a2", "b1", "b2"]
+    assert all(cell["static"] == {"values": [1, 2]} for cell in result["cells"])
+    # Unchanged parts of the body are not shared between the iterations
+    assert len({id(cell["static"]) for cell in result["cells"]}) == 4
+    assert "&id" not in yaml.dump(result)
+
+
+def test_loop_large_list():
+    content = {
+        "items": [1, 2],
+        "values": [{"xyml.for": "i:items", "value": "{{i}}"} if x % 2 else x for x in range(1000)],
+    }
+    loop_resolver = LoopResolver()
+    result = loop_resolver.resolve(content)
+    expected = []
+    for x in range(1000):
+        expected.extend([{"value": 1}, {"value": 2}] if x % 2 else [x])
+    assert result["values"] == expected
+
+
+def test_parallel_loop():
+    content = yaml.safe_load("""
+tenants: [a, b, c, d, e]
+sizes: [1, 2]
+static:
+  values: [1, 2]
+services:
+  xyml.for: tenant:tenants, size:sizes
+  name: "{{tenant}}-{{size}}"
+  static: "{{static}}"
+  values:
+  - "{{size}}"
+  - fixed
+""")
+    expected = LoopResolver().resolve(copy.deepcopy(content))
+    result = LoopResolver(workers=2, parallel_threshold=2).resolve(content)
+    assert result == expected
+    assert "&id" not in yaml.dump(result)
+
+
+def test_parallel_loop_items():
+    content = yaml.safe_load("""
+servers:
+- host: a
+  ports: [1, 2]
+- host: b
+  ports: [3]
+copies:
+  xyml.for: server:servers
+  xyml.content:
+  - "{{server}}"
+  - "{{server.ports}}"
+""")
+    expected = LoopResolver().resolve(copy.deepcopy(content))
+    result = LoopResolver(workers=2, parallel_threshold=1).resolve(content)
+    # Loop items are copied in both modes, the saved yaml contains no aliases of the items
+    assert yaml.dump(result) == yaml.dump(expected)
+    assert "&id" not in yaml.dump(expected)
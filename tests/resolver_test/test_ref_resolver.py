@@ -1,11 +1,17 @@
+import copy
 import os
 from pathlib import Path
 
+import pytest
 import yaml
 from unittest.mock import patch
 
 from src.yaml_extender.resolver.reference_resolver import ReferenceResolver
+from src.yaml_extender.resolver.expression import compile_expression
+from src.yaml_extender.resolver.reference_index import NOT_FOUND, ReferenceIndex
+from src.yaml_extender.resolver.reference_template import compile_template
 from src.yaml_extender.xyml_file import XYmlFile
+from yaml_extender.xyml_exception import RecursiveReferenceError, ReferenceCycleError
 
 
 def test_parse_references():
@@ -31,6 +37,22 @@ def test_parse_references():
     assert result == [["{{ ref: {{default }} }}", "ref", "{{default }}"]]
 
 
+def test_compile_template():
+    template = compile_template("path/{{ ref : 12 }}/{{count+1}}/{{unterminated")
+    assert template.literals == ["path/", "/", "/{{unterminated"]
+    assert [slot.text for slot in template.slots] == ["{{ ref : 12 }}", "{{count+1}}"]
+    assert template.slots[0].default == 12
+    assert template.slots[1].expression.references == ["count"]
+    assert not template.whole
+    assert template.render([["a", "b"], None]) == "path/a b/{{count+1}}/{{unterminated"
+    # Templates are compiled once per distinct value
+    assert compile_template("path/{{ ref : 12 }}/{{count+1}}/{{unterminated") is template
+    whole = compile_template("{{ref}}")
+    assert whole.whole
+    assert whole.render([[1, 2]]) == [1, 2]
+    assert whole.render([None]) == "{{ref}}"
+
+
 def test_basic_ref():
     content = yaml.safe_load("""
 ref_val_1: 123
@@ -448,3 +470,152 @@ def test_dict_list_ref(loader_mock):
     """)
     assert file.content == expected
 
+
+
+def test_reference_index():
+    content = yaml.safe_load("""
+    deep:
+      level_1:
+        level_2:
+          values: [a, b, c]
+          name: deep
+    servers:
+    - name: first
+    - name: second
+    nested: "{{deep.level_1}}"
+    refs:
+    - "{{deep.level_1.level_2.values.1}} {{deep.level_1.level_2.name}}"
+    - "{{deep.level_1.level_2.values.2}} {{deep.level_1.level_2.name}}"
+    - "{{servers.name}}"
+    - "{{nested.level_2.name}}"
+    - "{{deep.level_1.missing:default}}"
+    """)
+    expected = ReferenceResolver().resolve(copy.deepcopy(content))
+    ref_resolver = ReferenceResolver(use_index=True)
+    result = ref_resolver.resolve(content)
+    assert result == expected
+    assert result["refs"] == ["b deep", "c deep", "first", "second", "deep", "default"]
+    assert ref_resolver.lookup_index.hits > 0
+    # The refs list has been rebuilt, so indexed containers are dropped
+    assert ref_resolver.lookup_index.generation == 1
+
+
+def test_reference_index_lookup():
+    config = {"a": {"b": [{"c": 1}, "{{d}}"]}, "d": {"e": 2}}
+    index = ReferenceIndex(config)
+    assert index.lookup("a.b.0.c") == 1
+    assert index.lookup("a.b.1") == "{{d}}"
+    assert index.lookup("a.b.c") is NOT_FOUND
+    assert index.lookup("a.b.1.e") is NOT_FOUND
+    assert index.container("a.b") is config["a"]["b"]
+    assert len(index) == 3
+    index.invalidate()
+    assert len(index) == 0
+
+
+def test_dependency_order():
+    # Values referencing values further down the file are rescanned once per chain element
+    content = {f"chain_{i}": f"{{{{chain_{i - 1}}}}}+" for i in reversed(range(1, 100))}
+    content["chain_0"] = 0
+    content["sum"] = "{{chain_1}}"
+    content["calc"] = "{{count+2}}"
+    content["count"] = "{{chain_0}}"
+    with pytest.raises(RecursiveReferenceError):
+        ReferenceResolver().resolve({k: v for k, v in content.items() if k.startswith("chain")})
+    result = ReferenceResolver(dependency_order=True).resolve(content)
+    assert result["chain_99"] == "0" + "+" * 99
+    assert result["sum"] == "0+"
+    assert result["calc"] == 2
+
+
+def test_reference_cycle():
+    content = {"a": "x {{b.c}}", "b": {"c": "{{d.0}}"}, "d": ["{{a}}"]}
+    with pytest.raises(ReferenceCycleError) as error:
+        ReferenceResolver(dependency_order=True).resolve(content)
+    assert error.value.cycle == ["a", "b.c", "d.0", "a"]
+
+
+def test_long_reference_chain():
+    # Longer than the recursion limit
+    length = 5000
+    content = {f"a{i}": f"{{{{a{i + 1}}}}} + 1" if i % 2 else f"{{{{a{i + 1}}}}}" for i in range(length)}
+    content[f"a{length}"] = "end"
+    result = ReferenceResolver(dependency_order=True).resolve(content)
+    assert result["a0"] == "end" + " + 1" * (length // 2)
+    content = {f"a{i}": f"{{{{a{(i + 1) % length}}}}}" for i in range(length)}
+    with pytest.raises(ReferenceCycleError) as error:
+        ReferenceResolver(dependency_order=True).resolve(content)
+    assert len(error.value.cycle) == length + 1
+
+
+def test_reference_memo():
+    content = {"registry": {"url": "example.com"}, "flag": 1,
+               "images": [f"{{{{registry.url}}}}/image_{i}" for i in range(10)],
+               "values": ["{{flag:1}}", "{{flag:true}}", "{{flag+1}}", "{{missing:true}}", "{{missing:1}}"]}
+    expected = ReferenceResolver().resolve(copy.deepcopy(content))
+    ref_resolver = ReferenceResolver(use_index=True)
+    result = ref_resolver.resolve(content)
+    assert result == expected
+    assert result["values"] == [1, 1, 2, True, 1]
+    # Every distinct statement is resolved once
+    assert ref_resolver.memo.misses == 6
+    assert ref_resolver.memo.hits >= 9
+
+
+def test_compile_expression():
+    values = {"count": 4, "offset": "2", "ratio": 2.5, "my-value": 3}
+    assert compile_expression("count") is None
+    assert compile_expression("my-value") is None
+    assert compile_expression("count * (offset + 1) - 2 / 4").evaluate(values.get) == 11.5
+    assert compile_expression("count-1").evaluate(values.get) == 3
+    assert compile_expression("count*2/4").evaluate(values.get) == 2
+    assert compile_expression("path/x") is None
+    assert compile_expression("my-value * ratio").evaluate(values.get) == 7.5
+    assert compile_expression("-count + 10").evaluate(values.get) == 6
+    assert compile_expression("missing + 1").evaluate(values.get) is None
+    expression = compile_expression("offset * 1.5")
+    assert expression.references == ["offset"]
+    assert expression.evaluate(values.get) == 3.0
+    assert compile_expression("offset * 1.5") is expression
+    # Invalid expressions are used as references
+    assert compile_expression("count +") is None
+
+
+def test_arithmetic_references():
+    content = yaml.safe_load("""
+    base_port: 8000
+    replicas: "3"
+    ports:
+    - "{{ base_port + 1 }}"
+    - "{{ base_port - 1 }}"
+    - "{{ replicas * 2 + 1 }}"
+    - "{{ (replicas + 1) / 2 }}"
+    - "{{ missing + 1 : 5 }}"
+    - "{{ base_port * 0.5 }}"
+    path/x: 1
+    a - b: 2
+    keys: ["{{path/x}}", "{{ a - b }}"]
+    """)
+    result = ReferenceResolver().resolve(content)
+    assert result["ports"] == [8001, 7999, 7, 2.0, 6, 4000.0]
+    # Keys containing operators are used as references if the operands are not found
+    assert result["keys"] == [1, 2]
+
+
+def test_deep_nesting():
+    # Deeper than the recursion limit
+    content = {"value": "deep"}
+    node = content
+    for i in range(5000):
+        node["child"] = {"ref": "{{value}}"}
+        node = node["child"]
+    ref_resolver = ReferenceResolver(dependency_order=True)
+    result = ref_resolver.resolve(content)
+    node = result["child"]
+    while "child" in node:
+        assert node["ref"] == "deep"
+        node = node["child"]
+    assert node["ref"] == "deep"
+    # Long reference path
+    result = ref_resolver.resolve({"content": content, "ref": "{{content" + ".child" * 5000 + ".ref}}"})
+    assert result["ref"] == "deep"
@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src.yaml_extender.client import client_main, send_request
+from src.yaml_extender.server import ResolveServer
+from src.yaml_extender.cli import main
+
+res_dir = Path(__file__).parent.parent / "resources"
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = ResolveServer(tmp_path / "server.sock", {"user": "simon"}, [res_dir / "subdir"])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_server_resolve(server, tmp_path):
+    request = {"input": str(res_dir / "root.yaml"), "output": str(tmp_path / "output.yaml"), "args": ["--empty", ""]}
+    response = send_request(request, server.socket_path)
+    assert response["success"], response["error"]
+    expected = yaml.safe_load((res_dir / "expected_file.yaml").read_text())
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == expected
+    # Parameters of the request replace the ones of the server
+    (tmp_path / "input.yaml").write_text('user: "{{xyml.param.user}}"\n')
+    request = {"input": str(tmp_path / "input.yaml"), "output": str(tmp_path / "output.json"),
+               "params": {"user": "other"}}
+    assert send_request(request, server.socket_path)["success"]
+    assert json.loads((tmp_path / "output.json").read_text()) == {"user": "other"}
+
+
+def test_server_errors(server, tmp_path):
+    response = send_request({"input": str(tmp_path / "missing.yaml"), "output": str(tmp_path / "output.yaml")},
+                            server.socket_path)
+    assert not response["success"]
+    assert "missing.yaml" in response["error"]
+    assert not send_request({"input": "input.yaml"}, server.socket_path)["success"]
+    # The connection stays open after invalid requests
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(server.socket_path))
+        connection.sendall(b"no json\n[]\n")
+        with connection.makefile("rb") as reader:
+            assert not json.loads(reader.readline())["success"]
+            assert not json.loads(reader.readline())["success"]
+
+
+def test_client_main(server, tmp_path, monkeypatch):
+    (tmp_path / "input.yaml").write_text('user: "{{xyml.param.user}}"\nhome: "{{xyml.env.XYML_CLIENT_ENV}}"\n')
+    # The environment of the client is used instead of the one of the server
+    monkeypatch.setenv("XYML_CLIENT_ENV", "client")
+    argv = [str(tmp_path / "input.yaml"), str(tmp_path / "output.yaml"), "--socket", str(server.socket_path),
+            "--user", "other"]
+    assert client_main(argv) == 0
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == {"user": "other", "home": "client"}
+    request = {"input": str(tmp_path / "input.yaml"), "output": str(tmp_path / "output.yaml"),
+               "env": {"XYML_CLIENT_ENV": "request"}}
+    assert send_request(request, server.socket_path)["success"]
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text())["home"] == "request"
+    assert client_main([str(tmp_path / "missing.yaml"), str(tmp_path / "output.yaml"),
+                        "--socket", str(server.socket_path)]) == 1
+
+
+def test_client_environment(server, tmp_path, monkeypatch):
+    (tmp_path / "input.yaml").write_text('home: "{{xyml.env.XYML_CLIENT_ENV}}"\n')
+    monkeypatch.setenv("XYML_CLIENT_ENV", "client")
+    monkeypatch.setenv("XYML_CLIENT_SECRET", "secret")
+    requests = []
+    resolve = server.resolve
+    server.resolve = lambda request: requests.append(json.loads(json.dumps(request))) or resolve(request)
+    argv = [str(tmp_path / "input.yaml"), str(tmp_path / "output.yaml"), "--socket", str(server.socket_path)]
+    assert client_main(argv) == 0
+    # Only the referenced variables are sent
+    assert [request["env"] for request in requests] == [{}, {"XYML_CLIENT_ENV": "client"}]
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == {"home": "client"}
+    # Unset variables are sent as null and use the default value
+    (tmp_path / "input.yaml").write_text('home: "{{xyml.env.XYML_CLIENT_UNSET:none}}"\n')
+    assert client_main(argv) == 0
+    assert requests[-1]["env"] == {"XYML_CLIENT_UNSET": None}
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == {"home": "none"}
+    assert all("XYML_CLIENT_SECRET" not in request["env"] for request in requests)
+
+
+def test_socket_permissions(server, tmp_path, monkeypatch):
+    assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+    # The directory of the socket is created for the current user only
+    socket_dir = tmp_path / "runtime"
+    ResolveServer(socket_dir / "server.sock").server_close()
+    assert stat.S_IMODE(os.stat(socket_dir).st_mode) == 0o700
+    # Sockets of other users are not used
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(server.socket_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        send_request({"input": "input.yaml"}, server.socket_path)
+
+
+def test_concurrent_requests(server, tmp_path):
+    (tmp_path / "input.yaml").write_text('xyml.include: inc.yaml\nid: "{{xyml.param.id}}"\n')
+    (tmp_path / "inc.yaml").write_text("items: [1, 2, 3]\n")
+
+    def resolve(i):
+        output = tmp_path / f"output_{i}.yaml"
+        request = {"input": str(tmp_path / "input.yaml"), "output": str(output), "params": {"id": i}}
+        return send_request(request, server.socket_path), output
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(resolve, range(32)))
+    for i, (response, output) in enumerate(results):
+        assert response["success"], response["error"]
+        assert yaml.safe_load(output.read_text()) == {"items": [1, 2, 3], "id": i}
+
+
+def test_modified_include(server, tmp_path):
+    (tmp_path / "input.yaml").write_text("xyml.include: inc.yaml\n")
+    (tmp_path / "inc.yaml").write_text("value: 1\n")
+    request = {"input": str(tmp_path / "input.yaml"), "output": str(tmp_path / "output.yaml")}
+    assert send_request(request, server.socket_path)["success"]
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == {"value": 1}
+    # Parsed files are only reused while their stat signature is unchanged
+    (tmp_path / "inc.yaml").write_text("value: 22\n")
+    assert send_request(request, server.socket_path)["success"]
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text()) == {"value": 22}
+
+
+def test_client_cwd(server, tmp_path):
+    (tmp_path / "project" / "sub").mkdir(parents=True)
+    (tmp_path / "client").mkdir()
+    (tmp_path / "project" / "root.yaml").write_text("xyml.include:\n- sub/a.yaml\n- common.yaml\n")
+    (tmp_path / "project" / "sub" / "a.yaml").write_text("xyml.include: b.yaml\na: 1\n")
+    (tmp_path / "project" / "sub" / "b.yaml").write_text("b: 2\n")
+    (tmp_path / "client" / "common.yaml").write_text("common: 3\n")
+    # Relative paths and include paths of the request use the working directory of the client
+    request = {"input": "../project/root.yaml", "output": "output.yaml", "cwd": str(tmp_path / "client")}
+    response = send_request(request, server.socket_path)
+    assert response["success"], response["error"]
+    assert yaml.safe_load((tmp_path / "client" / "output.yaml").read_text()) == {"a": 1, "b": 2, "common": 3}
+
+
+def test_socket_in_use(server, tmp_path):
+    # The socket of a running server is not replaced
+    with pytest.raises(OSError):
+        ResolveServer(server.socket_path)
+    assert send_request({"input": "input.yaml"}, server.socket_path)["success"] is False
+    # The socket of a server, which was not shut down, is replaced
+    stale_path = tmp_path / "stale.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(str(stale_path))
+    assert stale_path.is_socket()
+    ResolveServer(stale_path).server_close()
+    assert not os.path.exists(stale_path)
+
+
+def test_serve_depfile_path(tmp_path):
+    with pytest.raises(SystemExit):
+        main(["serve", "--socket", str(tmp_path / "server.sock"), "-M", str(tmp_path / "d")])
+    assert not (tmp_path / "server.sock").exists()
@@ -1,10 +1,18 @@
 """
 Component Tests to test overall functionality of yaml_extender
 """
+import json
+import os
+from unittest import mock
+
+import pytest
 import yaml
 from pathlib import Path
 
+from src.yaml_extender.cli import main
+from src.yaml_extender.output_formats import load_snapshot
 from src.yaml_extender.xyml_file import XYmlFile
+from yaml_extender.xyml_exception import SnapshotFormatError
 
 script_dir = Path(__file__).parent
 res_dir = script_dir.parent / "resources"
@@ -14,3 +22,231 @@ def test_reference_file():
     resolved_file = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
     expected = yaml.safe_load((res_dir / "expected_file.yaml").read_text())
     assert resolved_file.content == expected
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="libyaml is not available")
+def test_yaml_backends_identical(tmp_path):
+    for sort_keys in (False, True):
+        outputs = []
+        for backend in ("python", "c"):
+            resolved_file = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"],
+                                     yaml_backend=backend)
+            output = tmp_path / f"{backend}.yaml"
+            resolved_file.save(output, sort_keys)
+            outputs.append(output.read_bytes())
+        assert outputs[0] == outputs[1]
+
+
+def test_concurrent_includes():
+    sequential = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    concurrent = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"],
+                          include_workers=4)
+    assert yaml.dump(concurrent.content) == yaml.dump(sequential.content)
+
+
+def test_result_cache(tmp_path):
+    (tmp_path / "root.yaml").write_text('value_1: "{{xyml.env.XYML_CACHE_TEST:default}}"\nxyml.include: inc.yaml\n')
+    (tmp_path / "inc.yaml").write_text("value_2: abc\n")
+    cache_dir = tmp_path / "cache"
+    os.environ.pop("XYML_CACHE_TEST", None)
+    resolved_file = XYmlFile(tmp_path / "root.yaml", cache_dir=cache_dir)
+    assert resolved_file.content == {"value_1": "default", "value_2": "abc"}
+    with mock.patch("yaml_extender.yaml_loader.load") as load_mock:
+        cached_file = XYmlFile(tmp_path / "root.yaml", cache_dir=cache_dir)
+        assert not load_mock.called
+    assert cached_file.content == resolved_file.content
+    assert cached_file.result_cache.hits == 1
+    # Changed include files invalidate the cached content
+    (tmp_path / "inc.yaml").write_text("value_2: xyz\n")
+    assert XYmlFile(tmp_path / "root.yaml", cache_dir=cache_dir).content["value_2"] == "xyz"
+    # Referenced environment variables invalidate the cached content
+    os.environ["XYML_CACHE_TEST"] = "env"
+    try:
+        assert XYmlFile(tmp_path / "root.yaml", cache_dir=cache_dir).content["value_1"] == "env"
+    finally:
+        del os.environ["XYML_CACHE_TEST"]
+    # Different parameters use different entries
+    cached_file = XYmlFile(tmp_path / "root.yaml", {"param": 1}, cache_dir=cache_dir)
+    assert cached_file.result_cache.misses == 1
+
+
+def test_result_cache_eviction(tmp_path):
+    cache_dir = tmp_path / "cache"
+    for i in range(3):
+        (tmp_path / f"root_{i}.yaml").write_text(f"value: {'x' * 1000}{i}\n")
+        XYmlFile(tmp_path / f"root_{i}.yaml", cache_dir=cache_dir, max_cache_size=2500)
+    assert len(list(cache_dir.glob("*.pickle"))) == 1
+
+
+def test_dependencies():
+    resolved_file = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    root = res_dir / "root.yaml"
+    assert resolved_file.dependencies.files == [root, res_dir / "exec.yaml", res_dir / "subdir" / "exec_test.yaml"]
+    assert resolved_file.dependencies.includes(root) == [(res_dir / "exec.yaml", {"executionOrder": 1}),
+                                                         (res_dir / "subdir" / "exec_test.yaml", {"executionOrder": 2})]
+    depfile = resolved_file.dependencies.to_depfile(Path("out dir/output.yaml"))
+    assert depfile == f"out\\ dir/output.yaml: {root} \\\n  {res_dir / 'exec.yaml'} \\\n" \
+                      f"  {res_dir / 'subdir' / 'exec_test.yaml'}\n"
+
+
+def test_depfile_cli(tmp_path):
+    args = [str(res_dir / "root.yaml"), str(tmp_path / "out.yaml"), "-i", str(res_dir / "subdir"), "--user", "simon",
+            "--empty", ""]
+    assert main(args + ["-M", str(tmp_path / "deps.d")]) == 0
+    assert (tmp_path / "deps.d").read_text().startswith(f"{tmp_path / 'out.yaml'}: {res_dir / 'root.yaml'}")
+    assert main(args + ["-MD"]) == 0
+    assert (tmp_path / "out.yaml.d").read_text() == (tmp_path / "deps.d").read_text()
+    # -M always takes a path, it never takes the input
+    with pytest.raises(SystemExit):
+        main(["-M", str(res_dir / "root.yaml"), str(tmp_path / "out.yaml")])
+
+
+def test_cached_dependencies(tmp_path):
+    (tmp_path / "root.yaml").write_text("xyml.include: inc.yaml<<param=1>>\n")
+    (tmp_path / "inc.yaml").write_text("value: \"{{param}}\"\n")
+    resolved_file = XYmlFile(tmp_path / "root.yaml", cache_dir=tmp_path / "cache")
+    cached_file = XYmlFile(tmp_path / "root.yaml", cache_dir=tmp_path / "cache")
+    assert cached_file.result_cache.hits == 1
+    assert cached_file.dependencies.files == resolved_file.dependencies.files
+    assert cached_file.dependencies.includes(tmp_path / "root.yaml") == [(tmp_path / "inc.yaml", {"param": 1})]
+
+
+def test_multi_document(tmp_path):
+    (tmp_path / "root.yaml").write_text('name: first\nxyml.include: inc.yaml<<param=1>>\n---\n'
+                                        'name: "{{xyml.param.user}}"\nxyml.include: inc.yaml<<param=2>>\n---\n'
+                                        'ids: [1, 2]\nitems:\n  xyml.for: i:ids\n  xyml.content:\n  - item_{{i}}\n')
+    (tmp_path / "inc.yaml").write_text("value: \"{{param}}\"\n")
+    resolved_file = XYmlFile(tmp_path / "root.yaml", {"user": "simon"}, multi_document=True)
+    assert resolved_file.content is None
+    assert list(resolved_file.documents()) == [{"name": "first", "value": 1}, {"name": "simon", "value": 2},
+                                               {"ids": [1, 2], "items": ["item_1", "item_2"]}]
+    resolved_file.save(tmp_path / "output.yaml")
+    assert list(yaml.safe_load_all((tmp_path / "output.yaml").read_text())) == list(resolved_file.documents())
+    # Every pass records the include graph again instead of adding to it
+    assert resolved_file.dependencies.includes(tmp_path / "root.yaml") == [(tmp_path / "inc.yaml", {"param": 1}),
+                                                                          (tmp_path / "inc.yaml", {"param": 2})]
+    assert resolved_file.path_index.misses == 1
+    # Nested includes are recorded by every pass, also for include instances resolved by the previous pass
+    (tmp_path / "inc.yaml").write_text("xyml.include: nested.yaml\nvalue: \"{{param}}\"\n")
+    (tmp_path / "nested.yaml").write_text("nested: 1\n")
+    resolved_file = XYmlFile(tmp_path / "root.yaml", {"user": "simon"}, multi_document=True)
+    for _ in range(2):
+        resolved_file.save(tmp_path / "output.yaml")
+        resolved_file.dependencies.write_depfile(tmp_path / "output.yaml.d", tmp_path / "output.yaml")
+        assert str(tmp_path / "nested.yaml") in (tmp_path / "output.yaml.d").read_text()
+
+
+def test_fused_pipeline(tmp_path):
+    (tmp_path / "root.yaml").write_text("""
+features: &features
+- includes
+- loops
+aliased: *features
+names: "{{xyml.for:f:features:{{f}} }}"
+first: "{{ names }}"
+nested:
+  - [a, "{{features.0}}"]
+  - "{{features}}"
+  - "{{missing}}"
+lookup: "{{nested.2}}"
+hosts: [h1, h2]
+hosts_ref: "{{host_list}}"
+host_list: ["{{xyml.for:h:hosts:{{h}},}}", b]
+servers:
+  xyml.for: feature:features
+  xyml.content:
+  - name: "{{feature}}"
+    port: "{{ xyml.param.port + 1 }}"
+""")
+    outputs = []
+    for pipeline in ("staged", "fused"):
+        resolved_file = XYmlFile(tmp_path / "root.yaml", {"port": 8000}, pipeline=pipeline)
+        output = tmp_path / f"{pipeline}.yaml"
+        resolved_file.save(output)
+        outputs.append(output.read_text())
+    assert outputs[0] == outputs[1]
+    # References continuing into a string with an inline loop see the expanded string
+    (tmp_path / "subref.yaml").write_text("""
+items: [1, 2]
+lst: "{{xyml.for:i:items:{{i}},}}"
+a: "{{lst.0:7}}"
+m: "{{lst.0}}"
+""")
+    staged = XYmlFile(tmp_path / "subref.yaml")
+    fused = XYmlFile(tmp_path / "subref.yaml", pipeline="fused")
+    assert fused.content == staged.content
+    assert fused.content["a"] == 7 and fused.content["m"] == "{{lst.0}}"
+    staged = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    fused = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"], pipeline="fused")
+    assert yaml.dump(fused.content) == yaml.dump(staged.content)
+
+
+def test_lazy_content(tmp_path):
+    eager = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    lazy = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"], lazy=True)
+    assert lazy.materialize() == eager.content
+    (tmp_path / "root.yaml").write_text('a: "{{b}}"\nb: "{{c.d}} x"\nc:\n  d: 1\nl:\n  - "{{e}}"\n  - 3\ne: [1, 2]\n')
+    lazy = XYmlFile(tmp_path / "root.yaml", lazy=True)
+    assert lazy.content["a"] == "1 x"
+    assert list(lazy.content["l"]) == [1, 2, 3]
+    assert len(lazy.content["c"]) == 1
+    lazy.save(tmp_path / "output.yaml")
+    assert yaml.safe_load((tmp_path / "output.yaml").read_text())["b"] == "1 x"
+
+
+def test_output_formats(tmp_path):
+    resolved_file = XYmlFile(res_dir / "root.yaml", {"user": "simon", "empty": ""}, [res_dir / "subdir"])
+    resolved_file.save(tmp_path / "output.json")
+    assert json.loads((tmp_path / "output.json").read_text()) == json.loads(json.dumps(resolved_file.content))
+    resolved_file.save(tmp_path / "output.snapshot")
+    assert load_snapshot(tmp_path / "output.snapshot") == resolved_file.content
+    resolved_file.save(tmp_path / "output", output_format="snapshot")
+    assert load_snapshot(tmp_path / "output") == resolved_file.content
+    with pytest.raises(ValueError):
+        resolved_file.save(tmp_path / "output.jsonl")
+    with pytest.raises(SnapshotFormatError):
+        load_snapshot(tmp_path / "output.json")
+    (tmp_path / "list.yaml").write_text('values: [1, 2]\nlist:\n- name: a\n  values: "{{values}}"\n- name: b\n')
+    list_file = XYmlFile(tmp_path / "list.yaml", lazy=True)
+    list_file.content = list_file.content["list"]
+    list_file.save(tmp_path / "output.jsonl")
+    lines = (tmp_path / "output.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [{"name": "a", "values": [1, 2]}, {"name": "b"}]
+
+
+def test_reference_copies(tmp_path):
+    (tmp_path / "root.yaml").write_text('l: [1, {b: [2, 3]}]\nd:\n  a: 1\nw: "{{l}}"\nx: "{{l}}"\ne: "{{d}}"\n')
+    for pipeline in ("staged", "fused"):
+        resolved_file = XYmlFile(tmp_path / "root.yaml", pipeline=pipeline)
+        resolved_file.save(tmp_path / "output.yaml")
+        output = (tmp_path / "output.yaml").read_text()
+        # Referenced values are written like the values they reference
+        assert "&id" not in output
+        assert yaml.safe_load(output) == {"l": [1, {"b": [2, 3]}], "d": {"a": 1}, "w": [1, {"b": [2, 3]}],
+                                          "x": [1, {"b": [2, 3]}], "e": {"a": 1}}
+
+
+def test_referenced_container_references(tmp_path):
+    (tmp_path / "root.yaml").write_text('a: "{{b}}"\nb:\n  c: "{{d}}"\nd: 5\n'
+                                        'x: "{{lst}}"\nlst: ["{{later}}", "{{b}}"]\nlater: 3\n')
+    for pipeline in ("staged", "fused"):
+        resolved_file = XYmlFile(tmp_path / "root.yaml", pipeline=pipeline)
+        # References within referenced dicts and lists are resolved before they are substituted
+        assert resolved_file.content == {"a": {"c": 5}, "b": {"c": 5}, "d": 5, "x": [3, {"c": 5}],
+                                         "lst": [3, {"c": 5}], "later": 3}
+        resolved_file.save(tmp_path / "output.yaml")
+        assert "&id" not in (tmp_path / "output.yaml").read_text()
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="libyaml is not available")
+def test_deep_file(tmp_path):
+    # Deeper than the recursion limit, the composer of the python backend is recursive
+    depth = 3000
+    (tmp_path / "root.yaml").write_text("value: deep\nroot:\n" +
+                                        "".join("  " * i + "child:\n" for i in range(1, depth + 1)) +
+                                        "  " * (depth + 1) + 'ref: "{{value}}"\n')
+    resolved_file = XYmlFile(tmp_path / "root.yaml", yaml_backend="c")
+    resolved_file.save(tmp_path / "output.yaml")
+    output = (tmp_path / "output.yaml").read_text()
+    assert output.count("child:") == depth
+    assert output.rstrip().endswith("ref: deep")
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+import yaml
+
+from yaml_extender import yaml_loader
+from yaml_extender.yaml_loader import ParsedFileCache
+
+
+def test_cache_hit(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("value_1: abc\n")
+    cache = ParsedFileCache()
+    assert cache.load(file) == {"value_1": "abc"}
+    assert cache.load(file) == {"value_1": "abc"}
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_returns_isolated_copies(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("dict_1:\n  value_1: abc\n")
+    cache = ParsedFileCache()
+    content = cache.load(file)
+    content["dict_1"]["value_1"] = "xyz"
+    assert cache.load(file) == {"dict_1": {"value_1": "abc"}}
+
+
+def test_cache_detects_modification(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("value_1: abc\n")
+    cache = ParsedFileCache()
+    cache.load(file)
+    file.write_text("value_1: abcdef\n")
+    assert cache.load(file) == {"value_1": "abcdef"}
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_same_size_modification(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("value_1: abc\n")
+    cache = ParsedFileCache()
+    cache.load(file)
+    st = os.stat(file)
+    file.write_text("value_1: xyz\n")
+    os.utime(file, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert cache.load(file) == {"value_1": "xyz"}
+
+
+def test_cache_eviction(tmp_path):
+    cache = ParsedFileCache(max_entries=2)
+    files = []
+    for i in range(3):
+        file = tmp_path / f"file_{i}.yaml"
+        file.write_text(f"value: {i}\n")
+        files.append(file)
+        cache.load(file)
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+    # The least recently used file has been evicted
+    cache.load(files[0])
+    assert cache.stats()["misses"] == 4
+
+
+def test_cache_invalidate(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("value_1: abc\n")
+    cache = ParsedFileCache()
+    cache.load(file)
+    cache.invalidate(file)
+    assert len(cache) == 0
+    cache.load(file)
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="libyaml is not available")
+def test_cache_per_backend(tmp_path):
+    file = tmp_path / "file.yaml"
+    file.write_text("value_1: abc\n")
+    cache = ParsedFileCache()
+    cache.load(file, "python")
+    cache.load(file, "c")
+    cache.load(file, "auto")
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hits"] == 1
+    cache.invalidate(file)
+    assert len(cache) == 0
+
+
+def test_load_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        yaml_loader.load(str(tmp_path / "missing.yaml"))
+    with pytest.raises(FileNotFoundError):
+        yaml_loader.load(str(tmp_path / "missing"))
+
+
+def test_load_adds_suffix(tmp_path):
+    (tmp_path / "file.yml").write_text("value_1: abc\n")
+    assert yaml_loader.load(str(tmp_path / "file")) == {"value_1": "abc"}
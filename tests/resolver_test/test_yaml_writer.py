@@ -0,0 +1,47 @@
+import datetime
+import io
+
+import pytest
+
+from yaml_extender import yaml_loader
+from yaml_extender.yaml_writer import stream_dump, stream_dump_all
+
+SHARED = {"x": [1, 2]}
+FIRST = [1]
+SECOND = {"y": [2], "z": FIRST}
+CONTENTS = [
+    {"b": 1, "a": [1, 2.5, True, None, "str", "multi\nline", "yes", "123", ""], "c": {}, "d": [],
+     "e": SHARED, "f": [SHARED, SHARED]},
+    [1, 2, {"z": 1, 1: 2}],
+    "scalar",
+    {"date": datetime.date(2020, 1, 1), "tuple": (1, 2), "long": "x " * 100, None: 3},
+    # Anchors are numbered in the order the nodes are reached the second time
+    {"b": FIRST, "a": SECOND, "c": [SECOND, SECOND["y"]], "d": SECOND["y"], "e": FIRST},
+]
+
+
+@pytest.mark.parametrize("backend", ["c", "python"])
+@pytest.mark.parametrize("sort_keys", [False, True])
+def test_stream_dump_equals_dump(backend, sort_keys):
+    for content in CONTENTS:
+        expected = io.StringIO()
+        yaml_loader.dump(content, expected, sort_keys, backend)
+        output = io.StringIO()
+        stream_dump(content, output, sort_keys, backend)
+        assert output.getvalue() == expected.getvalue()
+    expected = io.StringIO()
+    yaml_loader.dump_all(CONTENTS, expected, sort_keys, backend)
+    output = io.StringIO()
+    stream_dump_all(CONTENTS, output, sort_keys, backend)
+    assert output.getvalue() == expected.getvalue()
+
+
+def test_stream_dump_deep_nesting():
+    content = []
+    node = content
+    for _ in range(5000):
+        node.append([])
+        node = node[0]
+    output = io.StringIO()
+    stream_dump(content, output)
+    assert output.getvalue().count("-") == 5000